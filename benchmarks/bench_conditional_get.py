@@ -0,0 +1,126 @@
+"""
+Bandwidth and CPU saved by conditional GETs of catalog endpoints
+
+Seeds a throwaway SQLite database (or the one in DATABASE_URL) with
+products and gallery items, then requests each polled endpoint through the
+full middleware and DRF stack, as an app polling for changes would:
+
+  full          a plain GET, with caches already warm
+  revalidated   the same GET sending back the ETag of the first response
+
+and reports response body bytes, CPU time and queries per request for
+both, and the share saved.
+
+Usage:
+    python benchmarks/bench_conditional_get.py [--products 2000] [--page-size 20] [--repeat 200]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def setup_django(database_url):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'flicks.settings')
+    os.environ['DATABASE_URL'] = database_url
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+
+def seed(count):
+    from django.core.management import call_command
+    from products.models import FeaturedProduct, Product, ProductGallery
+    batch = []
+    for i in range(Product.objects.count(), count):
+        batch.append(Product(
+            title=f'Toy {i}', product_category=f'Category {i % 20}', age_group='5+',
+            brand=f'Brand {i % 300}', description='Seeded for benchmarks ' * 10,
+            media_urls={'flicks': f'/media/flicks/{i}.mp4', 'poster': f'/media/posters/{i}.jpg'}
+        ))
+        if len(batch) == 5000:
+            Product.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Product.objects.bulk_create(batch)
+    if not ProductGallery.objects.exists():
+        ProductGallery.objects.bulk_create([
+            ProductGallery(product_id=pk, media_type='image', is_primary=order == 0, display_order=order,
+                           media_urls={'image': f'/media/photos/{pk}-{order}.jpg'})
+            for pk in Product.objects.values_list('pk', flat=True) for order in range(3)
+        ], batch_size=5000)
+    if not FeaturedProduct.objects.exists():
+        FeaturedProduct.objects.bulk_create([
+            FeaturedProduct(product_id=pk, featured_type='trending', display_order=order)
+            for order, pk in enumerate(Product.objects.values_list('pk', flat=True)[:10])
+        ])
+    # bulk_create skips the save() that links categories and brands
+    call_command('backfill_taxonomy', stdout=io.StringIO())
+
+
+def measure(client, url, params, repeat, etag=None):
+    """Mean (body bytes, CPU ms, queries) per request, and the last response"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+    size = 0
+    started = time.process_time()
+    with CaptureQueriesContext(connection) as captured:
+        for _ in range(repeat):
+            response = client.get(url, params, **headers)
+            size += len(response.content)
+    cpu = time.process_time() - started
+    queries = len(captured.captured_queries)
+    return (size / repeat, cpu / repeat * 1000, queries / repeat), response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    database = os.environ.get('DATABASE_URL')
+    if not database:
+        database = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    setup_django(database)
+
+    from django.contrib.auth import get_user_model
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from products.models import Product
+
+    seed(args.products)
+    print(f"{Product.objects.count()} products, {args.repeat} requests per row")
+
+    client = APIClient()
+    user, _ = get_user_model().objects.get_or_create(username='bench')
+    client.force_authenticate(user)
+    endpoints = [
+        ('product_detail', reverse('product-detail', args=[Product.objects.order_by('id').first().id]), {}),
+        ('all_products', reverse('all-products'), {'page_size': args.page_size}),
+        ('trending_products', reverse('trending-products'), {}),
+        ('product_categories', reverse('product-categories'), {}),
+    ]
+
+    print(f"{'endpoint':>18} {'':>11} {'bytes':>8} {'cpu ms':>8} {'queries':>8}")
+    for name, url, params in endpoints:
+        # Warm the count, card, facet and featured caches first
+        first = client.get(url, params)
+        full, _ = measure(client, url, params, args.repeat)
+        revalidated, response = measure(client, url, params, args.repeat, etag=first['ETag'])
+        assert response.status_code == 304, f"{name} answered {response.status_code}"
+        for label, (size, cpu, queries) in (('full', full), ('revalidated', revalidated)):
+            print(f"{name:>18} {label:>11} {size:>8.0f} {cpu:>8.3f} {queries:>8.1f}")
+        print(f"{'':>18} {'saved':>11} {1 - revalidated[0] / full[0]:>8.0%} {1 - revalidated[1] / full[1]:>8.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Payload size of animated GIF gallery uploads versus their looping video
+
+Generates animated GIFs typical of product uploads (a turntable-style
+spin over a gradient background, and a flat-colour UI animation), runs
+them through products.utils.media_processors.convert_gif_to_video for each
+container, and reports the GIF and video sizes, the ratio between them
+and the conversion time. Needs ffmpeg on the PATH.
+
+Usage:
+    python benchmarks/bench_gif_video.py [--size 480 360] [--frames 48]
+"""
+import argparse
+import io
+import math
+import os
+import shutil
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'flicks.settings')
+    os.environ.setdefault('DATABASE_URL', 'sqlite://:memory:')
+    import django
+    django.setup()
+
+
+def spin_frames(width, height, count):
+    """A shaded box turning over a gradient: lots of colours, like a product photo"""
+    from PIL import Image, ImageDraw
+    background = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        draw = ImageDraw.Draw(frame)
+        angle = 2 * math.pi * i / count
+        cx, cy, r = width / 2, height / 2, min(width, height) / 3
+        corners = [
+            (cx + r * math.cos(angle + k * math.pi / 2), cy + r * 0.6 * math.sin(angle + k * math.pi / 2))
+            for k in range(4)
+        ]
+        draw.polygon(corners, fill=(200, 80 + 60 * int(math.cos(angle) > 0), 40))
+        frames.append(frame)
+    return frames
+
+
+def flat_frames(width, height, count):
+    """A few flat colours moving: the best case for GIF"""
+    from PIL import Image, ImageDraw
+    frames = []
+    for i in range(count):
+        frame = Image.new('RGB', (width, height), (245, 245, 245))
+        draw = ImageDraw.Draw(frame)
+        x = (width - 80) * i / max(1, count - 1)
+        draw.ellipse((x, height / 2 - 40, x + 80, height / 2 + 40), fill=(30, 120, 220))
+        frames.append(frame)
+    return frames
+
+
+def encode_gif(frames, name):
+    output = io.BytesIO()
+    frames[0].save(output, format='GIF', save_all=True, append_images=frames[1:], duration=40, loop=0)
+    output.seek(0)
+    output.name = name
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size', type=int, nargs=2, default=[480, 360], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--frames', type=int, default=48)
+    args = parser.parse_args()
+
+    if not shutil.which('ffmpeg'):
+        sys.exit('ffmpeg is not on the PATH')
+    setup_django()
+    from products.utils.media_processors import convert_gif_to_video
+
+    width, height = args.size
+    print(f"{width}x{height}, {args.frames} frames at 25 fps")
+    print(f"{'animation':>10} {'container':>9} {'gif KB':>8} {'video KB':>9} {'smaller':>8} {'convert s':>10}")
+    for label, make_frames in (('spin', spin_frames), ('flat', flat_frames)):
+        gif = encode_gif(make_frames(width, height, args.frames), f'{label}.gif')
+        gif_size = len(gif.getvalue())
+        for container in ('mp4', 'webm'):
+            started = time.perf_counter()
+            video, _, _ = convert_gif_to_video(gif, container=container)
+            seconds = time.perf_counter() - started
+            video_size = video.size
+            print(f"{label:>10} {container:>9} {gif_size / 1024:>8.0f} {video_size / 1024:>9.0f} "
+                  f"{gif_size / video_size:>7.1f}x {seconds:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Peak RSS and latency of product/banner image processing on large uploads
+
+Compares the bounded image engine in products.utils.media_processors with the
+previous full-decode implementations (reproduced below as legacy_*). Every
+measurement runs in a fresh interpreter so peak RSS is not polluted by earlier
+cases.
+
+Usage:
+    python benchmarks/bench_image_engine.py [--megapixels 12 24 40] [--repeat 3]
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def setup_django():
+    from django.conf import settings
+    if not settings.configured:
+        settings.configure(IMAGE_MAX_PIXELS=200_000_000)
+
+
+def legacy_process_product_image(image_file):
+    """Center crop at full resolution, as before the image engine"""
+    from PIL import Image
+    img = Image.open(image_file)
+    width, height = img.size
+    size = min(width, height)
+    left = (width - size) // 2
+    top = (height - size) // 2
+    cropped_img = img.crop((left, top, left + size, top + size))
+    output = io.BytesIO()
+    cropped_img.save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+
+def legacy_process_banner_image(image_file, target_width=1280, target_height=720):
+    """Full-resolution LANCZOS resize followed by a crop, as before the image engine"""
+    from PIL import Image
+    img = Image.open(image_file)
+    img_ratio = img.width / img.height
+    target_ratio = target_width / target_height
+    if img_ratio > target_ratio:
+        resized_img = img.resize((int(img.height * target_ratio * (target_height / img.height)), target_height), Image.LANCZOS)
+        left = (resized_img.width - target_width) // 2
+        cropped_img = resized_img.crop((left, 0, left + target_width, target_height))
+    else:
+        resized_img = img.resize((target_width, int(img.width / target_ratio * (target_width / img.width))), Image.LANCZOS)
+        top = (resized_img.height - target_height) // 2
+        cropped_img = resized_img.crop((0, top, target_width, top + target_height))
+    output = io.BytesIO()
+    cropped_img.save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+
+def engine_process_product_image(image_file):
+    from products.utils.media_processors import process_product_image
+    return process_product_image(image_file).read()
+
+
+def engine_process_banner_image(image_file):
+    from products.utils.media_processors import process_banner_image
+    return process_banner_image(image_file).read()
+
+
+CASES = {
+    'product/legacy': legacy_process_product_image,
+    'product/engine': engine_process_product_image,
+    'banner/legacy': legacy_process_banner_image,
+    'banner/engine': engine_process_banner_image,
+}
+
+
+def make_jpeg(path, megapixels):
+    """Write a noisy 4:3 JPEG so the encoder can't cheat on flat colour"""
+    import numpy as np
+    from PIL import Image
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(0)
+    tile = rng.integers(0, 255, (256, 256, 3), dtype=np.uint8)
+    pixels = np.tile(tile, (height // 256 + 1, width // 256 + 1, 1))[:height, :width]
+    Image.fromarray(pixels).save(path, format='JPEG', quality=92)
+    return width, height
+
+
+def peak_rss_kb():
+    """
+    High-water RSS of this process
+
+    Read from /proc rather than getrusage(): ru_maxrss survives fork+exec, so
+    the child would report the parent's peak from generating the input.
+    """
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    return 0
+
+
+def run_case(case, path, repeat):
+    """Child process entry point: time the case and report peak RSS"""
+    setup_django()
+    import PIL.Image  # noqa: F401  import cost is excluded from the peak
+    baseline_kb = peak_rss_kb()
+    timings = []
+    for _ in range(repeat):
+        with open(path, 'rb') as f:
+            upload = io.BytesIO(f.read())
+        upload.name = os.path.basename(path)
+        start = time.perf_counter()
+        CASES[case](upload)
+        timings.append(time.perf_counter() - start)
+    peak_kb = peak_rss_kb()
+    print(json.dumps({
+        'latency_ms': round(min(timings) * 1000, 1),
+        'peak_rss_mb': round((peak_kb - baseline_kb) / 1024, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--megapixels', type=int, nargs='+', default=[12, 24, 40])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--child', nargs=2, metavar=('CASE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_case(args.child[0], args.child[1], args.repeat)
+        return
+
+    print(f"{'input':>16} {'case':>16} {'latency ms':>12} {'peak RSS MB':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for megapixels in args.megapixels:
+            path = os.path.join(tmp, f'{megapixels}mp.jpg')
+            width, height = make_jpeg(path, megapixels)
+            for case in CASES:
+                result = subprocess.run(
+                    [sys.executable, __file__, '--repeat', str(args.repeat), '--child', case, path],
+                    check=True, capture_output=True, text=True
+                )
+                stats = json.loads(result.stdout)
+                print(f"{f'{width}x{height}':>16} {case:>16} {stats['latency_ms']:>12} {stats['peak_rss_mb']:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Latency of deep product listing pages: offset versus keyset pagination
+
+Seeds a throwaway SQLite database (or the one in DATABASE_URL) with enough
+products to reach the deepest page, then times fetching one page at
+increasing depths with
+
+  offset    ORDER BY ... LIMIT n OFFSET k, as all_products used to
+  keyset    products.pagination.paginate with the previous page's cursor
+
+for the id sort and the (title, id) sort. Only the page query is timed; the
+serializer and gallery prefetch cost the same either way.
+
+Usage:
+    python benchmarks/bench_pagination.py [--pages 1 100 1000 10000] [--page-size 10] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def setup_django(database_url):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'flicks.settings')
+    os.environ['DATABASE_URL'] = database_url
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+
+def seed(count):
+    from products.models import Product
+    existing = Product.objects.count()
+    batch = []
+    for i in range(existing, count):
+        # Titles repeat so the id tiebreaker is exercised
+        batch.append(Product(
+            title=f'Toy {i % 5000:05d}', product_category=f'Category {i % 20}', age_group='5+',
+            brand=f'Brand {i % 300}', description='Seeded for benchmarks'
+        ))
+        if len(batch) == 5000:
+            Product.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Product.objects.bulk_create(batch)
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 100, 1000, 10000])
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    database = os.environ.get('DATABASE_URL')
+    if not database:
+        database = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    setup_django(database)
+
+    from products.models import Product
+    from products.pagination import PRODUCT_SORTS, encode_cursor, paginate
+
+    size = args.page_size
+    seed(max(args.pages) * size + size)
+    print(f"{Product.objects.count()} products, page size {size}")
+    print(f"{'sort':>6} {'page':>7} {'offset ms':>10} {'keyset ms':>10}")
+
+    for sort in ('id', 'title'):
+        ordering = PRODUCT_SORTS[sort]
+        queryset = Product.objects.all()
+        fields = [field.lstrip('-') for field in ordering]
+        for page in args.pages:
+            offset = (page - 1) * size
+            cursor = None
+            if offset:
+                # Sort key of the last row on the previous page, as a client would hold
+                last = queryset.order_by(*ordering).values_list(*fields)[offset - 1]
+                cursor = encode_cursor(ordering, list(last))
+            offset_ms = best_of(args.repeat, lambda: paginate(queryset, ordering, size, offset=offset))
+            keyset_ms = best_of(args.repeat, lambda: paginate(queryset, ordering, size, cursor=cursor))
+            print(f"{sort:>6} {page:>7} {offset_ms:>10.2f} {keyset_ms:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Upload throughput of large flicks through the media storage classes
+
+Starts a minimal S3 stand-in (PutObject, multipart upload, HeadObject) on
+localhost that caps every connection at --link-mbps and adds --latency-ms
+per request, roughly like a single TCP stream to a remote region. Compares:
+
+  baseline  PublicMediaStorage with default boto3 settings, fed an in-memory
+            ContentFile as process_video used to return
+  tuned     TunedMediaStorage (shared pooled client, larger parts, more
+            concurrency), fed the on-disk file process_video returns now
+
+Every case runs in a fresh interpreter so peak RSS is comparable.
+
+Usage:
+    python benchmarks/bench_s3_upload.py [--sizes 50 100] [--link-mbps 20] [--repeat 2]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MB = 1024 * 1024
+
+
+def make_handler(link_mbps, latency_ms):
+    bytes_per_second = link_mbps * MB
+
+    class StandInS3(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        uploads = {}
+
+        def log_message(self, *args):
+            pass
+
+        def receive_body(self):
+            # Read at the capped link rate; the payload itself is discarded
+            remaining = int(self.headers.get('Content-Length', 0))
+            received = 0
+            started = time.monotonic()
+            while remaining:
+                chunk = self.rfile.read(min(remaining, 256 * 1024))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                received += len(chunk)
+                ahead = received / bytes_per_second - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+            return received
+
+        def reply(self, status=200, body=b'', headers=None):
+            time.sleep(latency_ms / 1000)
+            self.send_response(status)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+
+        def do_HEAD(self):
+            self.reply(404)
+
+        def do_PUT(self):
+            self.receive_body()
+            self.reply(headers={'ETag': f'"{uuid.uuid4().hex}"'})
+
+        def do_POST(self):
+            self.receive_body()
+            query = parse_qs(urlparse(self.path).query, keep_blank_values=True)
+            key = urlparse(self.path).path.split('/', 2)[-1]
+            if 'uploads' in query:
+                upload_id = uuid.uuid4().hex
+                body = (
+                    '<InitiateMultipartUploadResult><Bucket>bench</Bucket>'
+                    f'<Key>{key}</Key><UploadId>{upload_id}</UploadId>'
+                    '</InitiateMultipartUploadResult>'
+                )
+            else:
+                body = (
+                    '<CompleteMultipartUploadResult><Bucket>bench</Bucket>'
+                    f'<Key>{key}</Key><ETag>"{uuid.uuid4().hex}-1"</ETag>'
+                    '</CompleteMultipartUploadResult>'
+                )
+            self.reply(body=body.encode(), headers={'Content-Type': 'application/xml'})
+
+    return StandInS3
+
+
+def run_case(case, path, endpoint):
+    from django.conf import settings
+    settings.configure(
+        AWS_ACCESS_KEY_ID='bench', AWS_SECRET_ACCESS_KEY='bench',
+        AWS_STORAGE_BUCKET_NAME='bench', AWS_S3_REGION_NAME='us-east-1',
+        AWS_S3_ENDPOINT_URL=endpoint, AWS_S3_ADDRESSING_STYLE='path',
+        AWS_S3_FILE_OVERWRITE=False,
+    )
+    from django.core.files.base import ContentFile, File
+    from flicks.storage_backends import PublicMediaStorage, TunedMediaStorage
+
+    if case == 'baseline':
+        storage = PublicMediaStorage(default_acl=None)
+        with open(path, 'rb') as f:
+            content = ContentFile(f.read(), name='flick.mp4')
+    else:
+        storage = TunedMediaStorage(default_acl=None)
+        content = File(open(path, 'rb'), name='flick.mp4')
+
+    started = time.perf_counter()
+    storage.save('products/flicks/flick.mp4', content)
+    elapsed = time.perf_counter() - started
+
+    with open('/proc/self/status') as status:
+        peak_kb = next(int(line.split()[1]) for line in status if line.startswith('VmHWM'))
+    print(json.dumps({'seconds': elapsed, 'peak_mb': peak_kb / 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 100], help='File sizes in MB')
+    parser.add_argument('--link-mbps', type=float, default=20, help='Per-connection cap in MB/s')
+    parser.add_argument('--latency-ms', type=float, default=30, help='Added latency per request')
+    parser.add_argument('--repeat', type=int, default=2)
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--file', help=argparse.SUPPRESS)
+    parser.add_argument('--endpoint', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        run_case(args.case, args.file, args.endpoint)
+        return
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(args.link_mbps, args.latency_ms))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f'http://127.0.0.1:{server.server_address[1]}'
+
+    print(f"S3 stand-in at {endpoint}: {args.link_mbps} MB/s per connection, {args.latency_ms} ms per request")
+    print(f"{'size':>6} {'case':>9} {'seconds':>8} {'MB/s':>7} {'peak RSS':>9}")
+    for size in args.sizes:
+        with tempfile.NamedTemporaryFile(suffix='.mp4') as f:
+            for _ in range(size):
+                f.write(os.urandom(MB))
+            f.flush()
+            for case in ('baseline', 'tuned'):
+                runs = []
+                for _ in range(args.repeat):
+                    out = subprocess.run(
+                        [sys.executable, __file__, '--case', case, '--file', f.name, '--endpoint', endpoint],
+                        check=True, capture_output=True, text=True,
+                    ).stdout
+                    runs.append(json.loads(out.strip().splitlines()[-1]))
+                seconds = min(r['seconds'] for r in runs)
+                peak = max(r['peak_mb'] for r in runs)
+                print(f"{size:>4}MB {case:>9} {seconds:>8.2f} {size / seconds:>7.1f} {peak:>7.0f}MB")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Search latency of the database and in-memory search backends
+
+Seeds a throwaway SQLite database (or the one in DATABASE_URL) with
+products whose titles and descriptions are drawn from a small toy
+vocabulary, builds the memory backend's index, and times the first page
+of a few queries through both backends. The memory index build time and
+its Python heap size are reported too.
+
+Usage:
+    python benchmarks/bench_search_backends.py [--products 100000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+NOUNS = [
+    'robot', 'dinosaur', 'puzzle', 'car', 'train', 'doll', 'blocks', 'kite', 'drone', 'truck',
+    'teddy', 'rocket', 'castle', 'boat', 'unicorn', 'guitar', 'piano', 'farm', 'zoo', 'plane',
+]
+ADJECTIVES = [
+    'wooden', 'electric', 'magnetic', 'musical', 'plush', 'giant', 'mini', 'glowing', 'remote',
+    'stacking', 'talking', 'racing', 'building', 'soft', 'classic', 'deluxe', 'junior', 'turbo',
+]
+QUERIES = ['robot', 'wooden puzzle', 'dino', 'remote control truck', 'xylophone']
+
+
+def setup_django(database_url):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'flicks.settings')
+    os.environ['DATABASE_URL'] = database_url
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+
+def seed(count):
+    from products.models import Manufacturer, Product
+    rng = random.Random(42)
+    makers = list(Manufacturer.objects.all())
+    if not makers:
+        makers = Manufacturer.objects.bulk_create([
+            Manufacturer(name=f'Maker {i}', email=f'maker{i}@example.com', phone='1', address='1 St')
+            for i in range(200)
+        ])
+    batch = []
+    for i in range(Product.objects.count(), count):
+        words = rng.sample(ADJECTIVES, 2) + rng.sample(NOUNS, 1)
+        description = ' '.join(rng.choice(ADJECTIVES + NOUNS) for _ in range(30))
+        batch.append(Product(
+            title=' '.join(words).title(), brand=f'Brand {i % 300}', product_category=rng.choice(NOUNS),
+            age_group='5+', description=description, manufacturer=rng.choice(makers)
+        ))
+        if len(batch) == 5000:
+            Product.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Product.objects.bulk_create(batch)
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--products', type=int, default=100_000)
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    database = os.environ.get('DATABASE_URL')
+    if not database:
+        database = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    setup_django(database)
+
+    from products.models import Product
+    from products.search import memory
+    from products.search.backends import DatabaseSearchBackend
+
+    seed(args.products)
+    print(f"{Product.objects.count()} products, page size {args.page_size}")
+
+    started = time.perf_counter()
+    memory.reset_index()
+    index = memory.get_index()
+    build_seconds = time.perf_counter() - started
+    # Measured on a second build; tracing slows allocation too much to time it
+    tracemalloc.start()
+    rebuilt = memory.build_index()
+    heap_mb = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+    del rebuilt
+    tracemalloc.stop()
+    print(f"memory index: built in {build_seconds:.1f}s, {len(index.postings)} terms, {heap_mb:.0f} MB heap")
+
+    backends = {'database': DatabaseSearchBackend(), 'memory': memory.MemorySearchBackend()}
+    products = Product.objects.all()
+    print(f"{'query':>22} {'backend':>9} {'ms':>9} {'matches':>8}")
+    for query in QUERIES:
+        for name, backend in backends.items():
+            ms, (rows, _, count) = best_of(
+                args.repeat, lambda: backend.search(query, products, args.page_size)
+            )
+            print(f"{query:>22} {name:>9} {ms:>9.1f} {count:>8}")
+
+
+if __name__ == '__main__':
+    main()
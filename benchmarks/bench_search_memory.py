@@ -0,0 +1,141 @@
+"""
+Peak memory and latency of broad substring searches
+
+Seeds a throwaway SQLite database (or the one in DATABASE_URL) with
+products, then runs queries that match most of the catalog ("in", "ro")
+next to narrower ones, fetching the first page of 10 with
+
+  legacy    list(title matches) + list(other matches), sliced in Python and
+            counted with len(), as search_products used to
+  database  DatabaseSearchBackend: title_match ranked in SQL, one page
+            fetched, matches counted up to SEARCH_COUNT_LIMIT
+
+Peak Python heap is measured with tracemalloc on a separate run from the
+timings, since tracing slows allocation.
+
+Usage:
+    python benchmarks/bench_search_memory.py [--products 100000] [--repeat 3]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = [
+    'robot', 'dinosaur', 'puzzle', 'car', 'train', 'doll', 'blocks', 'kite', 'drone', 'truck',
+    'wooden', 'electric', 'magnetic', 'musical', 'plush', 'giant', 'mini', 'glowing', 'remote',
+    'stacking', 'talking', 'racing', 'building', 'soft', 'classic', 'deluxe', 'junior', 'turbo',
+]
+QUERIES = ['in', 'ro', 'ck', 'robot', 'dinosaur puzzle', 'xylophone']
+
+
+def setup_django(database_url):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'flicks.settings')
+    os.environ['DATABASE_URL'] = database_url
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+
+def seed(count):
+    from products.models import Product
+    rng = random.Random(42)
+    batch = []
+    for i in range(Product.objects.count(), count):
+        batch.append(Product(
+            title=' '.join(rng.sample(WORDS, 3)).title(), brand=f'Brand {i % 300}',
+            product_category=rng.choice(WORDS), age_group='5+',
+            description=' '.join(rng.choice(WORDS) for _ in range(20))
+        ))
+        if len(batch) == 5000:
+            Product.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Product.objects.bulk_create(batch)
+
+
+def legacy_search(query, page_size):
+    """search_products before ranking moved into SQL"""
+    from django.db.models import Q
+    from products.models import Product
+    from products.serializers import ProductSerializer
+    q_objects = Q()
+    for word in query.split():
+        q_objects |= Q(title__icontains=word)
+        q_objects |= Q(description__icontains=word)
+        q_objects |= Q(brand__icontains=word)
+        q_objects |= Q(product_category__icontains=word)
+        q_objects |= Q(age_group__icontains=word)
+        q_objects |= Q(manufacturer__name__icontains=word)
+    products = ProductSerializer.setup_eager_loading(Product.objects.filter(q_objects).distinct())
+    products_with_title_match = products.filter(title__icontains=query)
+    other_products = products.exclude(id__in=products_with_title_match.values_list('id', flat=True))
+    sorted_products = list(products_with_title_match) + list(other_products)
+    return sorted_products[:page_size], len(sorted_products)
+
+
+def database_search(query, page_size):
+    from products.models import Product
+    from products.search.backends import DatabaseSearchBackend
+    from products.serializers import ProductSerializer
+    products = ProductSerializer.setup_eager_loading(Product.objects.all())
+    rows, _, count = DatabaseSearchBackend().search(query, products, page_size)
+    return rows, count
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000, result
+
+
+def peak_mb(fn):
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--products', type=int, default=100_000)
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    database = os.environ.get('DATABASE_URL')
+    if not database:
+        database = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    setup_django(database)
+
+    from django.core.cache import cache
+    from products.models import Product
+
+    seed(args.products)
+    print(f"{Product.objects.count()} products, page size {args.page_size}")
+
+    searches = {'legacy': legacy_search, 'database': database_search}
+    print(f"{'query':>16} {'approach':>9} {'ms':>9} {'peak MB':>8} {'count':>7}")
+    for query in QUERIES:
+        for name, search in searches.items():
+            def run():
+                # Time the count too, not the cached copy of it
+                cache.clear()
+                return search(query, args.page_size)
+            ms, (_, count) = best_of(args.repeat, run)
+            print(f"{query:>16} {name:>9} {ms:>9.1f} {peak_mb(run):>8.1f} {count:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Latency of typeahead suggestions from the memory-mapped prefix index
+
+Seeds a throwaway SQLite database (or the one in DATABASE_URL) with
+products and view counts, writes the suggestion snapshot, then times
+products.search.suggest.suggest() for every prefix of a few queries, as a
+search box sends them keystroke by keystroke. Snapshot build time and
+file size are reported too.
+
+Usage:
+    python benchmarks/bench_suggest.py [--products 100000] [--repeat 200]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+NOUNS = [
+    'robot', 'dinosaur', 'puzzle', 'car', 'train', 'doll', 'blocks', 'kite', 'drone', 'truck',
+    'teddy', 'rocket', 'castle', 'boat', 'unicorn', 'guitar', 'piano', 'farm', 'zoo', 'plane',
+]
+ADJECTIVES = [
+    'wooden', 'electric', 'magnetic', 'musical', 'plush', 'giant', 'mini', 'glowing', 'remote',
+    'stacking', 'talking', 'racing', 'building', 'soft', 'classic', 'deluxe', 'junior', 'turbo',
+]
+QUERIES = ['robot dog', 'wooden puzzle', 'brand 12', 'xylophone']
+
+
+def setup_django(database_url):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'flicks.settings')
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('SUGGEST_INDEX_PATH', os.path.join(tempfile.mkdtemp(), 'suggest.idx'))
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+
+def seed(count):
+    from products.models import FlicksAnalytics, Product
+    rng = random.Random(42)
+    batch = []
+    for i in range(Product.objects.count(), count):
+        words = rng.sample(ADJECTIVES, 2) + rng.sample(NOUNS, 1)
+        batch.append(Product(
+            title=' '.join(words).title(), brand=f'Brand {i % 300}', product_category=rng.choice(NOUNS),
+            age_group='5+', description='Seeded for benchmarks'
+        ))
+        if len(batch) == 5000:
+            Product.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Product.objects.bulk_create(batch)
+    FlicksAnalytics.objects.bulk_create(
+        [FlicksAnalytics(product_id=pk, views=int(rng.paretovariate(1.2)))
+         for pk in Product.objects.filter(flicks_analytics__isnull=True).values_list('pk', flat=True)],
+        batch_size=5000
+    )
+
+
+def percentile(timings, share):
+    return sorted(timings)[int(len(timings) * share)] * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--products', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    database = os.environ.get('DATABASE_URL')
+    if not database:
+        database = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    setup_django(database)
+
+    from products.models import Product
+    from products.search import suggest
+
+    seed(args.products)
+    print(f"{Product.objects.count()} products")
+
+    suggest.reset_index()
+    path = suggest.index_path()
+    started = time.perf_counter()
+    index = suggest.get_index()
+    build_seconds = time.perf_counter() - started
+    print(f"snapshot: built in {build_seconds:.1f}s, {len(index)} suggestions, "
+          f"{os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+    print(f"{'prefix':>14} {'p50 us':>8} {'p99 us':>8}  top suggestion")
+    for query in QUERIES:
+        for end in range(1, len(query) + 1):
+            prefix = query[:end]
+            if prefix.endswith(' '):
+                continue
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                results = suggest.suggest(prefix, 8)
+                timings.append(time.perf_counter() - started)
+            top = results[0].text if results else '-'
+            print(f"{prefix:>14} {percentile(timings, 0.5):>8.1f} {percentile(timings, 0.99):>8.1f}  {top}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Serve locally stored media with HTTP Range support
+
+Used when MEDIA_BACKEND = 'local' (see storage_backends.ContentAddressedStorage)
+so video playback can be load tested end to end without a bucket.
+
+Three ways to send the bytes, in order of preference:
+  * MEDIA_SENDFILE_HEADER = 'X-Accel-Redirect' (nginx) or 'X-Sendfile'
+    (Apache/lighttpd): Django only authorizes and resolves the path, the web
+    server streams the file and handles Range itself.
+  * Otherwise the response wraps the open file, so gunicorn's wsgi.file_wrapper
+    sends it with os.sendfile (zero copy) from the requested offset for
+    exactly Content-Length bytes.
+  * Servers without a file wrapper (runserver, the test client) iterate the
+    same bounded reader in MEDIA_CHUNK_SIZE blocks.
+"""
+import mimetypes
+import os
+import re
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_http_methods
+from django.views.static import was_modified_since
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """File wrapper that reads at most `length` bytes starting at `start`"""
+    def __init__(self, file, start, length):
+        self.file = file
+        self.name = file.name
+        self.mode = file.mode
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    # fileno/seek/tell let wsgi.file_wrapper hand the descriptor to os.sendfile
+    def fileno(self):
+        return self.file.fileno()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self.file.seek(offset, whence)
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range Range header
+
+    Args:
+        header: Value of the Range header
+        size: Size of the file in bytes
+
+    Returns:
+        (start, end) inclusive, None to ignore the header (malformed or
+        multi-range, answered with the full body), or False if unsatisfiable
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        return False
+    return start, end
+
+
+@require_http_methods(['GET', 'HEAD'])
+def serve_media(request, path):
+    """Serve a stored media file, honouring Range and conditional requests"""
+    try:
+        full_path = default_storage.path(path)
+    except (SuspiciousFileOperation, NotImplementedError):
+        raise Http404("Media not found")
+    if not os.path.isfile(full_path):
+        raise Http404("Media not found")
+
+    stat = os.stat(full_path)
+    size = stat.st_size
+    etag = quote_etag(f"{int(stat.st_mtime):x}-{size:x}")
+
+    if request.headers.get('If-None-Match') == etag or not was_modified_since(
+        request.headers.get('If-Modified-Since'), stat.st_mtime
+    ):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+    # A stale If-Range validator means the client must get the whole file
+    if range_header and request.headers.get('If-Range', etag) == etag:
+        byte_range = parse_range(range_header, size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+
+    sendfile_header = getattr(settings, 'MEDIA_SENDFILE_HEADER', None)
+    if sendfile_header:
+        response = HttpResponse(content_type=content_type)
+        if sendfile_header == 'X-Accel-Redirect':
+            prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+            response[sendfile_header] = prefix + path
+        else:
+            response[sendfile_header] = full_path
+    else:
+        response = FileResponse(
+            RangeFile(open(full_path, 'rb'), start, length),
+            content_type=content_type,
+            status=206 if byte_range else 200,
+        )
+        response.block_size = getattr(settings, 'MEDIA_CHUNK_SIZE', 512 * 1024)
+        response['Content-Length'] = str(length)
+        if byte_range:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = getattr(settings, 'MEDIA_CACHE_CONTROL', 'public, max-age=31536000, immutable')
+    return response
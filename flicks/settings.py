@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 from datetime import timedelta
 import dj_database_url
@@ -59,6 +60,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'products',
     'rest_framework',
     'rest_framework.authtoken',
@@ -181,15 +183,131 @@ AWS_S3_REGION_NAME = os.getenv("AWS_S3_REGION_NAME")
 AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com'
 AWS_S3_FILE_OVERWRITE = False
 
+# Responsive image derivatives (WebP, plus AVIF when Pillow supports it)
+IMAGE_DERIVATIVE_WIDTHS = [320, 640, 1080]
+IMAGE_DERIVATIVE_QUALITY = 80
+
+# Image processing limits: uploads above IMAGE_MAX_PIXELS are rejected before
+# decoding, and product squares are stored at most PRODUCT_IMAGE_MAX_SIZE wide
+IMAGE_MAX_PIXELS = 50_000_000
+PRODUCT_IMAGE_MAX_SIZE = 2048
+
+# Animated GIF gallery uploads are re-encoded as looping video ('mp4' or 'webm')
+ANIMATED_GIF_CONTAINER = 'mp4'
+
+# Resumable (tus-style) video uploads. Chunks go to local disk, or into S3
+# multipart parts of RESUMABLE_UPLOAD_PART_SIZE when the backend is 's3'
+RESUMABLE_UPLOAD_BACKEND = os.getenv('RESUMABLE_UPLOAD_BACKEND', 'local')
+RESUMABLE_UPLOAD_ROOT = os.getenv('RESUMABLE_UPLOAD_ROOT', os.path.join(tempfile.gettempdir(), 'flicks-uploads'))
+RESUMABLE_UPLOAD_MAX_SIZE = 500 * 1024 * 1024
+RESUMABLE_UPLOAD_PROBE_BYTES = 1024 * 1024
+RESUMABLE_UPLOAD_PART_SIZE = 8 * 1024 * 1024
+# Uploads that receive no chunk for this many seconds are abandoned and their
+# chunks discarded (see the expire_uploads command)
+RESUMABLE_UPLOAD_EXPIRES = 24 * 60 * 60
+
+# Presigned direct-to-S3 uploads stay valid for this many seconds
+DIRECT_UPLOAD_EXPIRES = 15 * 60
+
+# Background media jobs (upload attachment, processing)
+MEDIA_PIPELINE_WORKERS = 2
+MEDIA_PIPELINE_EAGER = False
+
+# Product search backend: auto, postgres, memory or database (see products.search)
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'auto')
+
+# Text search configuration for product search vectors (PostgreSQL only)
+SEARCH_CONFIG = 'english'
+
+# Seconds before the memory backend rebuilds its index to pick up writes
+# made by other processes
+SEARCH_INDEX_MAX_AGE = 300
+
+# Typeahead snapshot file shared by the workers on a host; unset uses one per
+# database in the temp directory, empty keeps it in each process
+SUGGEST_INDEX_PATH = os.getenv('SUGGEST_INDEX_PATH')
+
+# Seconds before the typeahead snapshot is rebuilt to pick up new view counts
+# and other processes' writes
+SUGGEST_INDEX_MAX_AGE = 300
+
+# Product writes a process overlays on the typeahead snapshot before it
+# rebuilds the snapshot early
+SUGGEST_OVERLAY_MAX = 500
+
+# Search results are counted up to this many; broader queries report the limit
+SEARCH_COUNT_LIMIT = 1000
+
+# Seconds a page of search result ids is cached; any product, gallery or
+# manufacturer write invalidates it sooner
+SEARCH_CACHE_SECONDS = 600
+
+# Seconds a serialized product card is cached, under the same invalidation
+CATALOG_CACHE_SECONDS = 3600
+
+# Seconds a request waits for another one rebuilding the same cached response
+# (trending and top products) before rebuilding it itself
+REBUILD_LOCK_SECONDS = 5
+
+# Seconds before a process reloads its category and brand id <-> name maps
+TAXONOMY_MAP_MAX_AGE = 300
+
+# Seconds filter_products facet counts are cached per filter combination;
+# catalog writes invalidate them sooner
+FACET_CACHE_SECONDS = 60
+
+# Seconds a product listing count is cached per filter combination
+PRODUCT_COUNT_CACHE_SECONDS = 300
+
+# Processes the import_gallery command crops images with (None: one per CPU);
+# admin imports run on the media pipeline without a process pool
+GALLERY_IMPORT_WORKERS = None
+
+# reprocess_media: encoder processes (None: one per CPU) and the ffmpeg CPU
+# seconds per second of 1080p video used for dry-run estimates
+REPROCESS_MEDIA_WORKERS = None
+REPROCESS_CPU_SECONDS_PER_VIDEO_SECOND = 2.0
+
+# S3 transfer tuning for TunedMediaStorage. Uploads at or above the threshold
+# go multipart with MAX_CONCURRENCY parts in flight per upload; keep the pool
+# at least MEDIA_PIPELINE_WORKERS * MAX_CONCURRENCY so parts don't queue for
+# connections. Failed requests are retried MAX_ATTEMPTS times with backoff.
+AWS_S3_MAX_POOL_CONNECTIONS = 32
+AWS_S3_MULTIPART_THRESHOLD = 16 * 1024 * 1024
+AWS_S3_MULTIPART_CHUNKSIZE = 16 * 1024 * 1024
+AWS_S3_MAX_CONCURRENCY = 16
+AWS_S3_RETRY_MODE = 'standard'
+AWS_S3_MAX_ATTEMPTS = 5
+
 STORAGES = {
     "default": {
-        "BACKEND": "storages.backends.s3boto3.S3StaticStorage",
+        # Same bucket layout, ACLs and unsigned URLs as before, tuned transfers
+        "BACKEND": "flicks.storage_backends.TunedMediaStorage",
+        "OPTIONS": {
+            "location": "",
+            "default_acl": None,
+            "querystring_auth": False,
+        },
     },
     "staticfiles": {
         "BACKEND": "storages.backends.s3boto3.S3StaticStorage",
     },
 }
 
+# MEDIA_BACKEND=local keeps media on disk in a content-addressed layout and
+# serves MEDIA_URL through flicks.media.serve_media (staging, load tests).
+# Behind nginx set MEDIA_SENDFILE_HEADER=X-Accel-Redirect and map
+# MEDIA_ACCEL_PREFIX to MEDIA_ROOT as an internal location.
+MEDIA_BACKEND = os.getenv('MEDIA_BACKEND', 's3')
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
+MEDIA_SENDFILE_HEADER = os.getenv('MEDIA_SENDFILE_HEADER') or None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+MEDIA_CHUNK_SIZE = 512 * 1024
+if MEDIA_BACKEND == 'local':
+    STORAGES["default"] = {
+        "BACKEND": "flicks.storage_backends.ContentAddressedStorage",
+    }
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=7),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=30),
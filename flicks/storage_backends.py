@@ -1,5 +1,19 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
 
 class StaticStorage(S3Boto3Storage):
     location = 'static'
@@ -8,4 +22,188 @@ class StaticStorage(S3Boto3Storage):
 class PublicMediaStorage(S3Boto3Storage):
     location = 'media'
     default_acl = 'public-read'
-    file_overwrite = False
\ No newline at end of file
+    file_overwrite = False
+
+def object_key(storage, name):
+    """Bucket key of a name stored in an S3 storage, i.e. the name under its location"""
+    return storage._normalize_name(clean_name(name))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+_stats = {'uploads': 0, 'bytes': 0, 'seconds': 0.0}
+_stats_lock = threading.Lock()
+
+
+def transfer_stats():
+    """Totals of uploads made through TunedMediaStorage in this process"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['mb_per_second'] = stats['bytes'] / MB / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+
+class TunedMediaStorage(PublicMediaStorage):
+    """
+    Media storage tuned for large flick uploads
+
+    All instances and threads share one boto3 client per endpoint and
+    credentials (clients are thread-safe, resources are not), with a
+    connection pool sized for concurrent multipart parts. Uploads at or above
+    AWS_S3_MULTIPART_THRESHOLD are split into AWS_S3_MULTIPART_CHUNKSIZE parts
+    sent AWS_S3_MAX_CONCURRENCY at a time, and failed requests are retried by
+    botocore with exponential backoff. Each upload logs its throughput.
+    """
+    def get_default_settings(self):
+        defaults = super().get_default_settings()
+        defaults.update({
+            'max_pool_connections': getattr(settings, 'AWS_S3_MAX_POOL_CONNECTIONS', 32),
+            'retry_mode': getattr(settings, 'AWS_S3_RETRY_MODE', 'standard'),
+            'max_attempts': getattr(settings, 'AWS_S3_MAX_ATTEMPTS', 5),
+            'multipart_threshold': getattr(settings, 'AWS_S3_MULTIPART_THRESHOLD', 8 * MB),
+            'multipart_chunksize': getattr(settings, 'AWS_S3_MULTIPART_CHUNKSIZE', 8 * MB),
+            'max_concurrency': getattr(settings, 'AWS_S3_MAX_CONCURRENCY', 16),
+        })
+        return defaults
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.client_config = self.client_config.merge(Config(
+            max_pool_connections=self.max_pool_connections,
+            retries={'mode': self.retry_mode, 'max_attempts': self.max_attempts},
+            tcp_keepalive=True,
+        ))
+        if kwargs.get('transfer_config') is None and getattr(settings, 'AWS_S3_TRANSFER_CONFIG', None) is None:
+            self.transfer_config = TransferConfig(
+                multipart_threshold=self.multipart_threshold,
+                multipart_chunksize=self.multipart_chunksize,
+                max_concurrency=self.max_concurrency,
+                use_threads=self.use_threads,
+            )
+            # File-like bodies are read into memory part by part; let as many
+            # parts be buffered as can be in flight (s3transfer caps it at 10)
+            self.transfer_config.max_in_memory_upload_chunks = self.max_concurrency
+    
+    @property
+    def client(self):
+        """The process-wide client for this storage's endpoint and credentials"""
+        key = (
+            self.endpoint_url, self.region_name, self.access_key,
+            self.session_profile, self.use_ssl, self.verify,
+        )
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = self._create_session().client(
+                    's3',
+                    region_name=self.region_name,
+                    use_ssl=self.use_ssl,
+                    endpoint_url=self.endpoint_url,
+                    config=self.client_config,
+                    verify=self.verify,
+                )
+                _clients[key] = client
+        return client
+    
+    @property
+    def connection(self):
+        # Per-thread resource (as upstream) backed by the shared client and pool
+        connection = getattr(self._connections, 'connection', None)
+        if connection is None:
+            connection = self._create_session().resource(
+                's3',
+                region_name=self.region_name,
+                use_ssl=self.use_ssl,
+                endpoint_url=self.endpoint_url,
+                config=self.client_config,
+                verify=self.verify,
+            )
+            connection.meta.client = self.client
+            self._connections.connection = connection
+        return connection
+    
+    def _save(self, name, content):
+        size = getattr(content, 'size', None) or 0
+        started = time.monotonic()
+        name = super()._save(name, content)
+        elapsed = time.monotonic() - started
+        with _stats_lock:
+            _stats['uploads'] += 1
+            _stats['bytes'] += size
+            _stats['seconds'] += elapsed
+        if size:
+            logger.info(
+                f"Uploaded {name}: {size / MB:.1f} MB in {elapsed:.2f}s "
+                f"({size / MB / elapsed if elapsed else 0:.1f} MB/s)"
+            )
+        return name
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Local media storage that names files after a hash of their content
+
+    Files land under the upload_to directory as <dir>/ab/cd/<hash><ext>, so
+    identical uploads share one blob and a name never changes meaning, which
+    lets the media view mark responses as immutable. Writes go to a temp file
+    in the same filesystem and are renamed into place, so readers never see a
+    partially written file.
+
+    Meant for staging boxes and offline benchmarks: set MEDIA_BACKEND=local
+    and serve MEDIA_URL with flicks.media.serve_media (or nginx).
+    """
+    hash_length = 32
+    
+    def get_available_name(self, name, max_length=None):
+        # The final name is decided by _save() from the content hash
+        return name
+    
+    def _save(self, name, content):
+        directory, basename = os.path.split(name)
+        ext = os.path.splitext(basename)[1].lower()
+        
+        tmp_dir = os.path.join(self.location, '.tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            
+            content_hash = digest.hexdigest()[:self.hash_length]
+            name = '/'.join(filter(None, [
+                directory.replace('\\', '/'), content_hash[:2], content_hash[2:4], content_hash + ext
+            ]))
+            full_path = self.path(name)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            # Same content already stored: keep the existing blob
+            if os.path.exists(full_path):
+                os.unlink(tmp_path)
+            else:
+                os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return name
+    
+    def delete(self, name):
+        """
+        No-op: a blob may be shared by several rows, so deleting one row's
+        file must not remove it. Unreferenced blobs are removed with purge()
+        by a sweep that knows every stored name.
+        """
+        return None
+    
+    def purge(self, name):
+        """Remove a blob from disk"""
+        super().delete(name)
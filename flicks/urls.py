@@ -14,10 +14,17 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
+from .media import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('products.urls'))
 ]
+
+if settings.MEDIA_BACKEND == 'local':
+    urlpatterns.append(
+        re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), serve_media, name='serve-media')
+    )
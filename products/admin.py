@@ -1,4 +1,6 @@
+import zipfile
 from django.contrib import admin
+from django.contrib.admin import helpers
 from django.urls import path
 from django.shortcuts import render, redirect
 from django import forms
@@ -8,10 +10,14 @@ from django.contrib.auth.models import Group, Permission, User
 from django.contrib.contenttypes.models import ContentType
 from .models import (
     Manufacturer, Product, Distributor, ShopUser, Shop, 
-    ProductGallery, FeaturedProduct, FlicksAnalytics, ViewSession
+    ProductGallery, FeaturedProduct, FlicksAnalytics, ViewSession,
+    Category, CategoryAlias, Brand, BrandAlias
 )
+from . import catalog_cache
+from .gallery_import import queue_import
 from django.utils.safestring import mark_safe
-from django.db import models 
+from django.db import models, transaction
+from django.db.models import Count, Exists, OuterRef
 
 def setup_groups():
     staff_group, created = Group.objects.get_or_create(name='Staff')
@@ -67,6 +73,25 @@ class FileUploadForm(forms.Form):
         return file
 
 
+class GalleryImportForm(forms.Form):
+    archive = forms.FileField(
+        label='ZIP archive',
+        help_text='Images (JPG, PNG, GIF, WEBP) and videos (MP4, MOV, AVI, WMV, FLV, WebM)'
+    )
+    mapping = forms.FileField(
+        label='Mapping CSV',
+        required=False,
+        help_text='Optional: file,product[,alt_text,display_order,is_primary]'
+    )
+
+    def clean_archive(self):
+        archive = self.cleaned_data['archive']
+        if not zipfile.is_zipfile(archive):
+            raise forms.ValidationError('Upload a ZIP archive')
+        archive.seek(0)
+        return archive
+
+
 @admin.register(Manufacturer)
 class ManufacturerAdmin(admin.ModelAdmin):
     list_display = ['name', 'email', 'phone', 'has_banner']
@@ -166,17 +191,55 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ('title', 'brand', 'description')
     readonly_fields = ('analytics_panel',)  # Remove image_preview and video_preview
     inlines = [ProductGalleryInline]  # Replace ProductImageInline with ProductGalleryInline
+    actions = ['import_gallery_media']
+
+    def import_gallery_media(self, request, queryset):
+        """Bulk-add gallery media to the selected products from a ZIP"""
+        if 'apply' in request.POST:
+            form = GalleryImportForm(request.POST, request.FILES)
+            if form.is_valid():
+                # Processing a large archive would tie up the request; the
+                # pipeline imports it and logs what was skipped
+                queue_import(
+                    form.cleaned_data['archive'],
+                    mapping=form.cleaned_data['mapping'],
+                    products=queryset,
+                )
+                self.message_user(
+                    request,
+                    f"Queued {form.cleaned_data['archive'].name} for import; gallery items "
+                    f"appear on the selected products as it is processed"
+                )
+                return None
+        else:
+            form = GalleryImportForm()
+
+        return render(request, 'admin/gallery_import.html', {
+            'title': 'Import gallery media',
+            'form': form,
+            'products': queryset,
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+            'opts': self.model._meta,
+        })
+    import_gallery_media.short_description = 'Import gallery media from ZIP'
+
+    def get_queryset(self, request):
+        # Columns below read analytics and gallery presence per row; load
+        # them with the page instead of two queries per product
+        queryset = super().get_queryset(request).select_related('flicks_analytics')
+        return queryset.annotate(
+            has_gallery=Exists(ProductGallery.objects.filter(product=OuterRef('pk')))
+        )
 
     def has_media(self, obj):
         """Check if product has any media (images or videos)"""
-        has_gallery = obj.gallery.exists()
-        return bool(has_gallery or obj.flicks)
+        return bool(obj.has_gallery or obj.flicks)
     has_media.boolean = True
     
     def view_count(self, obj):
         """Display view count in admin list view"""
         try:
-            analytics = FlicksAnalytics.objects.get(product=obj)
+            analytics = obj.flicks_analytics
             return analytics.views
         except FlicksAnalytics.DoesNotExist:
             return 0
@@ -185,7 +248,7 @@ class ProductAdmin(admin.ModelAdmin):
     def total_watch_time_display(self, obj):
         """Display formatted watch time in admin list view"""
         try:
-            analytics = FlicksAnalytics.objects.get(product=obj)
+            analytics = obj.flicks_analytics
             seconds = analytics.total_watch_time
             if seconds > 3600:
                 hours = seconds // 3600
@@ -297,6 +360,34 @@ class DistributorAdmin(admin.ModelAdmin):
     filter_horizontal = ['manufacturers']
     search_fields = ['name', 'location', 'email']
 
+class CategoryAliasInline(admin.TabularInline):
+    model = CategoryAlias
+    extra = 1
+
+class BrandAliasInline(admin.TabularInline):
+    model = BrandAlias
+    extra = 1
+
+class TaxonomyTermAdmin(admin.ModelAdmin):
+    """Terms with their product counts; aliases map other spellings onto them"""
+    list_display = ['name', 'product_count']
+    search_fields = ['name', 'aliases__key']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(product_count=Count('products'))
+    
+    def product_count(self, obj):
+        return obj.product_count
+    product_count.admin_order_field = 'product_count'
+
+@admin.register(Category)
+class CategoryAdmin(TaxonomyTermAdmin):
+    inlines = [CategoryAliasInline]
+
+@admin.register(Brand)
+class BrandAdmin(TaxonomyTermAdmin):
+    inlines = [BrandAliasInline]
+
 default_app_config = 'products.apps.ProductsConfig'
 
 def ready():
@@ -419,21 +510,24 @@ class FeaturedProductAdmin(admin.ModelAdmin):
         trending_ids = [id for id in trending_ids if id]
         top_ids = [id for id in top_ids if id]
         
-        FeaturedProduct.objects.all().delete()
-        
-        for i, product_id in enumerate(trending_ids):
-            FeaturedProduct.objects.create(
-                product_id=product_id,
-                featured_type='trending',
-                display_order=i
-            )
+        # Readers see the old lists or the new ones, never a half-saved mix
+        with transaction.atomic():
+            FeaturedProduct.objects.all().delete()
             
-        for i, product_id in enumerate(top_ids):
-            FeaturedProduct.objects.create(
-                product_id=product_id,
-                featured_type='top',
-                display_order=i
-            )
+            for i, product_id in enumerate(trending_ids):
+                FeaturedProduct.objects.create(
+                    product_id=product_id,
+                    featured_type='trending',
+                    display_order=i
+                )
+                
+            for i, product_id in enumerate(top_ids):
+                FeaturedProduct.objects.create(
+                    product_id=product_id,
+                    featured_type='top',
+                    display_order=i
+                )
+            transaction.on_commit(catalog_cache.bump_featured_version)
             
         self.message_user(request, 'Featured products updated successfully.')
         return redirect('admin:products_featuredproduct_changelist')
\ No newline at end of file
@@ -1,17 +1,25 @@
-from django.http import JsonResponse
-from products.models import Shop, ShopUser, Product, FeaturedProduct
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse, JsonResponse
+from products.models import Shop, ShopUser, Product, FeaturedProduct, Subscription
 from products.serializers import (
     ProductSerializer, ProductDetailSerializer, ShopSerializer, ShopUserSerializer
 )
+from products import catalog_cache, conditional, taxonomy
+from products.facets import facet_counts
+from products.search import count_limit, get_backend, suggest
+from products.pagination import (
+    PRODUCT_SORTS, InvalidCursor, paginate, page_size_param, estimated_count
+)
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.db.models import Q, Count
 from django.db import transaction
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from django.contrib.auth import authenticate
+from django.utils import timezone
 import json
 
 # Authentication endpoints
@@ -109,7 +117,8 @@ def store_info(request):
         'address': shop.address,
         'phone': shop.phone,
         'email': shop.email,
-        'banner_url': request.build_absolute_uri(shop.banner.url) if shop.banner else None,
+        'banner_url': request.build_absolute_uri(shop.media_urls['banner']) if shop.media_urls.get('banner') else None,
+        'banner_placeholder': shop.banner_placeholder,
         'owner': {
             'id': shop.owner.id,
             'username': shop.owner.username,
@@ -196,40 +205,23 @@ def subscription_details(request):
         return Response({"message": "Subscription updated successfully"})
 
 @api_view(['GET'])
+@condition(etag_func=conditional.featured_etag, last_modified_func=conditional.featured_last_modified)
 def trending_products(request):
-    """Get trending products"""
-    featured_trending = FeaturedProduct.objects.filter(
-        featured_type='trending'
-    ).select_related('product').order_by('display_order')
-    
-    if featured_trending.exists():
-        products = [item.product for item in featured_trending]
-    else:
-        products = Product.objects.all().order_by('-id')[:10]
-    
-    serializer = ProductSerializer(products, many=True)
-    return Response(serializer.data)
+    """Get trending products, served as a cached rendered body"""
+    return HttpResponse(catalog_cache.featured_body('trending'), content_type='application/json')
 
 @api_view(['GET'])
+@condition(etag_func=conditional.featured_etag, last_modified_func=conditional.featured_last_modified)
 def top_products(request):
-    """Get top products"""
-    featured_top = FeaturedProduct.objects.filter(
-        featured_type='top'
-    ).select_related('product').order_by('display_order')
-    
-    if featured_top.exists():
-        products = [item.product for item in featured_top]
-    else:
-        products = Product.objects.all().order_by('-id')[:10]
-    
-    serializer = ProductSerializer(products, many=True)
-    return Response(serializer.data)
+    """Get top products, served as a cached rendered body"""
+    return HttpResponse(catalog_cache.featured_body('top'), content_type='application/json')
 
 @api_view(['GET'])
+@condition(etag_func=conditional.product_etag, last_modified_func=conditional.product_last_modified)
 def product_detail(request, product_id):
     """Get detailed information about a specific product"""
     try:
-        product = Product.objects.get(id=product_id)
+        product = ProductDetailSerializer.setup_eager_loading(Product.objects).get(id=product_id)
         serializer = ProductDetailSerializer(product)
         return Response(serializer.data)
     except Product.DoesNotExist:
@@ -249,55 +241,67 @@ def search_products(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    query_words = query.split()
-    
-    q_objects = Q()
-    
-    for word in query_words:
-        q_objects |= Q(title__icontains=word)
-        q_objects |= Q(description__icontains=word)
-        q_objects |= Q(brand__icontains=word)
-        q_objects |= Q(product_category__icontains=word)
-        q_objects |= Q(age_group__icontains=word)
-        q_objects |= Q(manufacturer__name__icontains=word)
-    
-    products = Product.objects.filter(q_objects).distinct()
-    
-    products_with_title_match = products.filter(title__icontains=query)
-    other_products = products.exclude(id__in=products_with_title_match.values_list('id', flat=True))
-    
-    sorted_products = list(products_with_title_match) + list(other_products)
-    
-    page = int(request.query_params.get('page', 1))
-    page_size = int(request.query_params.get('page_size', 10))
-    
-    start = (page - 1) * page_size
-    end = start + page_size
+    page, page_size, cursor = page_params(request)
+    # Only ids are cached; the products themselves come from the card cache
+    key = catalog_cache.search_key(query, page, page_size, cursor)
+    try:
+        entry = catalog_cache.cached_search(key, lambda: get_backend().search(
+            query, Product.objects.only('id'), page_size, cursor=cursor, offset=(page - 1) * page_size
+        ))
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    total_count = entry['count']
+    data = page_data(
+        catalog_cache.product_cards(entry['ids']), entry['next_cursor'], total_count, page, page_size
+    )
+    data['count_capped'] = total_count >= count_limit()
+    data['query'] = query
+    return Response(data)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def search_cache_stats(request):
+    """Hit and miss counts of the search result and product card caches"""
+    return Response(catalog_cache.cache_stats())
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def suggest_products(request):
+    """Typeahead suggestions (product titles, brands, categories, manufacturers) for a partial query"""
+    query = request.query_params.get('q', '')
     
-    paginated_products = sorted_products[start:end]
+    if not query.strip():
+        return Response(
+            {"error": "Please provide a query"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
-    serializer = ProductSerializer(paginated_products, many=True)
+    try:
+        limit = int(request.query_params.get('limit', 8))
+    except ValueError:
+        limit = 8
     
+    suggestions = suggest.suggest(query, limit)
     return Response({
-        'results': serializer.data,
-        'count': len(sorted_products),
-        'has_more': len(sorted_products) > end,
-        'page': page,
-        'page_size': page_size,
-        'query': query
+        'query': query,
+        'suggestions': [
+            {
+                'text': suggestion.text,
+                'type': suggestion.kind,
+                'product_id': suggestion.product_id or None,
+            }
+            for suggestion in suggestions
+        ]
     })
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@condition(etag_func=conditional.catalog_etag, last_modified_func=conditional.catalog_last_modified)
 def product_categories(request):
     """Get the top 6 most common product categories for filtering"""
-    category_counts = Product.objects.values('product_category') \
-                        .annotate(count=Count('product_category')) \
-                        .filter(product_category__isnull=False) \
-                        .exclude(product_category='') \
-                        .order_by('-count')[:6]
-    
-    top_categories = [item['product_category'] for item in category_counts]
+    # The unfiltered category facet, shared with filter_products
+    top_categories = list(facet_counts({})['category'])[:6]
     
     return Response(top_categories)
 
@@ -318,24 +322,33 @@ def age_groups(request):
 
 @api_view(['GET'])
 def filter_products(request):
-    """Filter products by gender, age, and category"""
+    """Filter products by gender, age, and category, with facet counts for each"""
     gender = request.query_params.get('gender')
     age_group = request.query_params.get('age_group')
     product_category = request.query_params.get('category')
     
     products = Product.objects.all()
+    filters = {}
     
     if gender:
         products = products.filter(gender=gender)
+        filters['gender'] = gender
     
     if product_category:
-        products = products.filter(product_category=product_category)
+        # Any spelling of the category; no term has id 0, so unknown ones match nothing
+        category_id = taxonomy.lookup('category', product_category) or 0
+        products = products.filter(category_ref_id=category_id)
+        filters['category'] = category_id
         
     if age_group:
         products = products.filter(standardized_age=age_group)
+        filters['age_group'] = age_group
     
-    serializer = ProductSerializer(products, many=True)
-    return Response(serializer.data)
+    page = product_page(request, products, filters)
+    if isinstance(page, Response):
+        return page
+    page['facets'] = facet_counts(filters)
+    return Response(page)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -349,9 +362,10 @@ def get_shop_banner(request):
     elif hasattr(user, 'helper_at_shops') and user.helper_at_shops.exists():
         shop = user.helper_at_shops.first()
     
-    if shop and shop.banner:
+    if shop and shop.media_urls.get('banner'):
         return Response({
-            'banner_url': request.build_absolute_uri(shop.banner.url),
+            'banner_url': request.build_absolute_uri(shop.media_urls['banner']),
+            'banner_placeholder': shop.banner_placeholder,
             'shop_name': shop.name
         })
     else:
@@ -378,41 +392,69 @@ def redeem_reward(request):
         'remaining_points': 1500
     })
 
-@api_view(['GET'])
-@permission_classes([AllowAny])
-def all_products(request):
-    """Get all products with optional pagination"""
-    # Get query parameters for pagination
-    page = request.query_params.get('page', 1)
-    page_size = request.query_params.get('page_size', 10)
-    
+def page_params(request):
+    """(page, page_size, cursor) query parameters of a paged listing"""
     try:
-        page = int(page)
-        page_size = int(page_size)
+        page = max(int(request.query_params.get('page', 1)), 1)
     except ValueError:
         page = 1
-        page_size = 10
-    
-    # Calculate the slices
-    start = (page - 1) * page_size
-    end = start + page_size
-    
-    # Get products
-    products = Product.objects.all().order_by('id')[start:end]
-    
-    # Get total count for pagination info
-    total_count = Product.objects.count()
-    
-    # Serialize the data
-    serializer = ProductSerializer(products, many=True, context={'request': request})
-    
-    # Return data with pagination info
-    return Response({
-        'results': serializer.data,
+    return page, page_size_param(request), request.query_params.get('cursor')
+
+def page_data(results, next_cursor, total_count, page, page_size):
+    """Response body of one page of serialized products"""
+    # Both page-number spellings are ones existing clients read
+    return {
+        'results': results,
         'count': total_count,
         'total_pages': (total_count + page_size - 1) // page_size,
-        'current_page': page
-    })
+        'current_page': page,
+        'page': page,
+        'page_size': page_size,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
+    }
+
+def product_page(request, products, filters):
+    """
+    One page of products, serialized with cursor and count metadata
+
+    Pages are keyset-paginated: clients pass the returned next_cursor as
+    ?cursor= to continue. ?page= is still honoured for older clients but is
+    offset-based, so it gets slower the deeper it goes.
+
+    Args:
+        request: The API request, read for cursor, page, page_size and sort
+        products: Filtered Product queryset
+        filters: Filter parameters that produced the queryset, keying the count cache
+    Returns:
+        Response dict, or an error Response for a bad sort or cursor
+    """
+    sort = request.query_params.get('sort', 'id')
+    if sort not in PRODUCT_SORTS:
+        return Response(
+            {"error": f"sort must be one of: {', '.join(PRODUCT_SORTS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    page, page_size, cursor = page_params(request)
+    
+    try:
+        rows, next_cursor = paginate(
+            ProductSerializer.setup_eager_loading(products), PRODUCT_SORTS[sort], page_size,
+            cursor=cursor, offset=(page - 1) * page_size
+        )
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    serializer = ProductSerializer(rows, many=True, context={'request': request})
+    return page_data(serializer.data, next_cursor, estimated_count(products, filters), page, page_size)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@condition(etag_func=conditional.catalog_etag, last_modified_func=conditional.catalog_last_modified)
+def all_products(request):
+    """Get all products, a page at a time (see product_page)"""
+    page = product_page(request, Product.objects.all(), {})
+    return page if isinstance(page, Response) else Response(page)
     
 # Flicks Feed endpoints
 @api_view(['GET'])
@@ -597,6 +639,7 @@ def api_overview(request):
             'Trending Products': '/api/products/trending/',
             'Top Products': '/api/products/top/',
             'Filter Products': '/api/products/filter/',
+            'Suggest Products': '/api/products/suggest/',
             'Product Detail': '/api/products/<id>/',
         },
         'Rewards': {
@@ -692,7 +735,7 @@ def register_shop_with_owner(request):
             }
             
             # 5. Return the created shop data with login tokens
-            shop_serializer = ShopSerializer(shop)
+            shop_serializer = ShopSerializer(ShopSerializer.setup_eager_loading([shop])[0])
             return Response({
                 'message': 'Shop registered successfully with owner',
                 'shop': shop_serializer.data,
@@ -705,6 +748,8 @@ def register_shop_with_owner(request):
                 'tokens': tokens
             }, status=status.HTTP_201_CREATED)
             
+    except ValidationError as e:
+        return Response({"error": e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response(
             {"error": f"Failed to register shop: {str(e)}"}, 
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
+
+    def ready(self):
+        # Connects the search index, catalog cache, taxonomy map, conditional
+        # GET and upload cleanup signal receivers
+        from . import catalog_cache, conditional, taxonomy, uploads
+        from .search import memory, postgres, suggest
+        post_migrate.connect(postgres.create_search_indexes, sender=self)
@@ -0,0 +1,285 @@
+"""
+Caches of catalog reads, invalidated by a catalog version counter
+
+Every committed write to a product, its gallery, its manufacturer or a
+category or brand term bumps the version, and every key here embeds the version it was written under,
+so a write makes all older entries unreachable at once; they are left to
+expire. Writes that bypass model signals (queryset.update, bulk_create,
+bulk_update) must call bulk_written() themselves.
+
+Three layers use it:
+
+  product cards   ProductSerializer output per product, shared by every
+                  response that lists that product
+  search results  ordered product ids (plus cursor and count) per
+                  normalized query and page, rendered from the cards
+  featured lists  rendered JSON bodies of trending_products and
+                  top_products, also keyed by a featured version that
+                  FeaturedProduct writes bump
+
+Hits and misses of each are counted in the cache for cache_stats().
+"""
+import hashlib
+import json
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from products.models import Brand, Category, FeaturedProduct, Manufacturer, Product, ProductGallery
+from products.search import get_backend
+from products.serializers import ProductSerializer
+from rest_framework.renderers import JSONRenderer
+
+VERSION_KEY = 'catalog:version'
+FEATURED_VERSION_KEY = 'catalog:featured-version'
+STATS = ('search', 'cards', 'featured')
+
+# How often a request waiting for another one's rebuild checks the cache
+REBUILD_POLL_SECONDS = 0.05
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        # Never restart at a number old entries may still be cached under
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted; a fresh time-based version is just as new
+        _version(key)
+    cache.set(f'{key}:changed-at', time.time(), timeout=None)
+
+
+def _changed_at(key):
+    changed_at = cache.get(f'{key}:changed-at')
+    if changed_at is None:
+        # Unknown, so as recent as it could be: clients only revalidate by ETag
+        cache.add(f'{key}:changed-at', time.time(), timeout=None)
+        changed_at = cache.get(f'{key}:changed-at')
+    return changed_at
+
+
+def catalog_version():
+    return _version(VERSION_KEY)
+
+
+def bump_catalog_version():
+    _bump(VERSION_KEY)
+
+
+def bulk_written():
+    """Bump the catalog version once the current transaction commits; for writes that send no signals"""
+    transaction.on_commit(bump_catalog_version)
+
+
+def bump_featured_version():
+    _bump(FEATURED_VERSION_KEY)
+
+
+def featured_version():
+    return _version(FEATURED_VERSION_KEY)
+
+
+def catalog_changed_at():
+    """Unix time of the last catalog version bump"""
+    return _changed_at(VERSION_KEY)
+
+
+def featured_changed_at():
+    """Unix time of the last catalog or featured version bump, whichever is later"""
+    return max(_changed_at(VERSION_KEY), _changed_at(FEATURED_VERSION_KEY))
+
+
+def count_lookups(name, hits=0, misses=0):
+    for kind, count in (('hits', hits), ('misses', misses)):
+        if count:
+            key = f'catalog:stats:{name}:{kind}'
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                cache.add(key, count, timeout=None)
+
+
+def cache_stats():
+    """Hit and miss counts per cache layer, since the counters were last reset"""
+    names = [f'catalog:stats:{name}:{kind}' for name in STATS for kind in ('hits', 'misses')]
+    counts = cache.get_many(names)
+    stats = {'catalog_version': catalog_version()}
+    for name in STATS:
+        hits = counts.get(f'catalog:stats:{name}:hits', 0)
+        misses = counts.get(f'catalog:stats:{name}:misses', 0)
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+    return stats
+
+
+def reset_stats():
+    cache.delete_many([f'catalog:stats:{name}:{kind}' for name in STATS for kind in ('hits', 'misses')])
+
+
+def product_cards(product_ids):
+    """
+    ProductSerializer data of products, from the card cache where possible
+
+    Missing cards are serialized from one eager-loaded query and cached for
+    CATALOG_CACHE_SECONDS.
+
+    Args:
+        product_ids: Ids in the order to return them
+    Returns:
+        List of serialized products; ids that no longer exist are skipped
+    """
+    version = catalog_version()
+    keys = {pk: f'catalog:{version}:card:{pk}' for pk in product_ids}
+    cards = cache.get_many(keys.values())
+    missing = [pk for pk in product_ids if keys[pk] not in cards]
+    count_lookups('cards', hits=len(product_ids) - len(missing), misses=len(missing))
+    if missing:
+        products = ProductSerializer.setup_eager_loading(Product.objects.filter(pk__in=missing))
+        fresh = {keys[product.pk]: ProductSerializer(product).data for product in products}
+        cache.set_many(fresh, getattr(settings, 'CATALOG_CACHE_SECONDS', 3600))
+        cards.update(fresh)
+    return [cards[keys[pk]] for pk in product_ids if keys[pk] in cards]
+
+
+def search_key(query, page, page_size, cursor):
+    """
+    Result cache key of one page of a search
+
+    Queries the backend would answer alike share a key (see
+    SearchBackend.cache_query): those differing only in case or spacing,
+    and for the memory backend also in punctuation or word order.
+    """
+    normalized = [
+        get_backend().cache_query(query), page, page_size, cursor or '', getattr(settings, 'SEARCH_BACKEND', 'auto')
+    ]
+    digest = hashlib.sha1(json.dumps(normalized).encode('utf-8')).hexdigest()
+    return f'catalog:{catalog_version()}:search:{digest}'
+
+
+def cached_search(key, search):
+    """
+    One page of search results, as ordered ids, from the result cache
+
+    Args:
+        key: search_key() of the page
+        search: Callable returning (rows, next_cursor, count) on a miss
+    Returns:
+        Dict of ids, next_cursor and count
+    """
+    entry = cache.get(key)
+    count_lookups('search', hits=entry is not None, misses=entry is None)
+    if entry is None:
+        rows, next_cursor, count = search()
+        entry = {'ids': [row.pk for row in rows], 'next_cursor': next_cursor, 'count': count}
+        cache.set(key, entry, getattr(settings, 'SEARCH_CACHE_SECONDS', 600))
+    return entry
+
+
+def single_flight(key, build, timeout):
+    """
+    Cached value of key, built by one caller at a time on a miss
+
+    The first caller to miss takes a lock entry and builds; concurrent
+    callers poll for its result instead of building too, for up to
+    REBUILD_LOCK_SECONDS, then give up waiting and build themselves. Only
+    the caller holding the lock releases it.
+
+    Args:
+        key: Cache key
+        build: Callable returning the value; must not return None
+        timeout: Seconds to cache the value
+    Returns:
+        (value, whether it came from the cache)
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value, True
+    lock_key = f'{key}:lock'
+    wait = getattr(settings, 'REBUILD_LOCK_SECONDS', 5)
+    token = uuid.uuid4().hex
+    locked = cache.add(lock_key, token, wait)
+    if not locked:
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(REBUILD_POLL_SECONDS)
+            value = cache.get(key)
+            if value is not None:
+                return value, True
+    try:
+        value = build()
+        cache.set(key, value, timeout)
+    finally:
+        # A lock that expired during a slow build may be someone else's by now
+        if locked and cache.get(lock_key) == token:
+            cache.delete(lock_key)
+    return value, False
+
+
+def featured_ids(featured_type):
+    """Ids of a featured list in display order, or the 10 newest products if it is empty"""
+    ids = list(
+        FeaturedProduct.objects.filter(featured_type=featured_type)
+        .order_by('display_order').values_list('product_id', flat=True)
+    )
+    return ids or list(Product.objects.order_by('-id').values_list('id', flat=True)[:10])
+
+
+def featured_body(featured_type):
+    """
+    Rendered JSON body of trending_products or top_products
+
+    A hit reads the two versions and the body from the cache and runs no
+    queries. Bodies are cached for
+    CATALOG_CACHE_SECONDS under the catalog and featured versions, so
+    saving the featured lists or any product they show replaces them.
+
+    Args:
+        featured_type: 'trending' or 'top'
+    Returns:
+        JSON bytes
+    """
+    key = f'catalog:{catalog_version()}:featured:{featured_version()}:{featured_type}'
+    body, hit = single_flight(
+        key, lambda: JSONRenderer().render(product_cards(featured_ids(featured_type))),
+        getattr(settings, 'CATALOG_CACHE_SECONDS', 3600)
+    )
+    count_lookups('featured', hits=hit, misses=not hit)
+    return body
+
+
+# Bumped on commit: a rolled-back write invalidates nothing, and rows read
+# before the commit can only be cached under the old version
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductGallery)
+@receiver(post_delete, sender=ProductGallery)
+@receiver(post_save, sender=Manufacturer)
+@receiver(post_delete, sender=Manufacturer)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def catalog_changed(sender, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=FeaturedProduct)
+@receiver(post_delete, sender=FeaturedProduct)
+def featured_changed(sender, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(bump_featured_version)
@@ -0,0 +1,102 @@
+"""
+Validators for conditional GETs of catalog endpoints
+
+Views pass these to django.views.decorators.http.condition, applied inside
+@api_view so authentication and permissions still run first. A client that
+sends back a matching If-None-Match or If-Modified-Since gets a 304 before
+any product is loaded or serialized.
+
+  listings        all_products, product_categories: the catalog version
+                  (a cache read) and the query string
+  featured lists  trending_products, top_products: the catalog and
+                  featured versions
+  product_detail  the product's, its manufacturer's and its gallery's
+                  updated_at, from one aggregate query
+
+ETags are weak: content negotiation may render the same data differently.
+Last-Modified of the listings is when the version was last bumped.
+"""
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from products import catalog_cache, taxonomy
+from products.models import Product, ProductGallery
+
+
+def weak_etag(*parts):
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def query_string(request):
+    """Query parameters in a canonical order, so reordered URLs share an ETag"""
+    return sorted((key, sorted(values)) for key, values in request.GET.lists())
+
+
+def catalog_etag(request, *args, **kwargs):
+    return weak_etag(request.path, query_string(request), catalog_cache.catalog_version())
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return datetime.fromtimestamp(catalog_cache.catalog_changed_at(), dt_timezone.utc)
+
+
+def featured_etag(request, *args, **kwargs):
+    return weak_etag(request.path, catalog_cache.catalog_version(), catalog_cache.featured_version())
+
+
+def featured_last_modified(request, *args, **kwargs):
+    return datetime.fromtimestamp(catalog_cache.featured_changed_at(), dt_timezone.utc)
+
+
+def product_state(request, product_id):
+    """
+    Change markers of a product and what its detail response embeds
+
+    Memoized on the request, since condition() asks for the ETag and the
+    Last-Modified separately.
+
+    Returns:
+        Dict of updated_at values and gallery count, or None if the product doesn't exist
+    """
+    memo = getattr(request, '_product_state', None)
+    if memo is None or memo[0] != product_id:
+        rows = (
+            Product.objects.filter(pk=product_id)
+            .values('updated_at', 'manufacturer__updated_at', 'category_ref_id', 'brand_ref_id')
+            .annotate(gallery_updated_at=Max('gallery__updated_at'), gallery_count=Count('gallery'))
+            .order_by()[:1]
+        )
+        row = rows[0] if rows else None
+        memo = request._product_state = (product_id, row)
+    return memo[1]
+
+
+def product_etag(request, product_id):
+    state = product_state(request, product_id)
+    if state is None:
+        return None
+    # Term names come from the in-process map; renames bump no updated_at
+    return weak_etag(
+        product_id, state['updated_at'], state['manufacturer__updated_at'], state['gallery_updated_at'],
+        state['gallery_count'], taxonomy.name('category', state['category_ref_id']),
+        taxonomy.name('brand', state['brand_ref_id']),
+    )
+
+
+def product_last_modified(request, product_id):
+    state = product_state(request, product_id)
+    if state is None:
+        return None
+    return max(filter(None, (
+        state['updated_at'], state['manufacturer__updated_at'], state['gallery_updated_at']
+    )))
+
+
+@receiver(post_delete, sender=ProductGallery)
+def gallery_item_deleted(sender, instance, **kwargs):
+    # The gallery's newest updated_at can go backwards; the product's must move forwards
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
@@ -11,6 +11,12 @@ def api_documentation(request):
     """
     base_url = request.build_absolute_uri('/api')
     
+    # Catalog endpoints answer 304 Not Modified, with no body, when these match
+    conditional_headers = {
+        'If-None-Match': 'Header: ETag of an earlier response (optional)',
+        'If-Modified-Since': 'Header: Last-Modified of an earlier response (optional)'
+    }
+    
     # Authentication endpoints
     auth_endpoints = {
         'Login': {
@@ -132,16 +138,21 @@ def api_documentation(request):
         'All Products': {
             'url': f"{base_url}/products/",
             'method': 'GET',
-            'description': 'Get all products with pagination',
+            'description': 'Get all products, a page at a time',
             'parameters': {
-                'page': 'Page number (default: 1)',
-                'page_size': 'Number of results per page (default: 10)'
+                'cursor': 'next_cursor from the previous page (omit for the first page)',
+                'page_size': 'Number of results per page (default: 10, max: 100)',
+                'sort': 'id, title, brand or category (by the stored text, not the canonical name), prefixed with - for descending (default: id)',
+                'page': 'Page number instead of a cursor (slower on deep pages)',
+                **conditional_headers
             },
             'response': {
                 'results': 'List of products',
-                'count': 'Total number of products',
+                'count': 'Total number of products (estimated)',
                 'total_pages': 'Total number of pages',
-                'current_page': 'Current page number'
+                'current_page': 'Current page number',
+                'next_cursor': 'Cursor for the next page, or null on the last page',
+                'has_more': 'Whether there are more pages'
             }
         },
         'Product Detail': {
@@ -149,7 +160,8 @@ def api_documentation(request):
             'method': 'GET',
             'description': 'Get detailed information about a specific product',
             'parameters': {
-                'product_id': 'ID of the product (in URL path)'
+                'product_id': 'ID of the product (in URL path)',
+                **conditional_headers
             },
             'response': 'Detailed product information including gallery items'
         },
@@ -157,12 +169,14 @@ def api_documentation(request):
             'url': f"{base_url}/products/trending/",
             'method': 'GET',
             'description': 'Get list of trending products',
+            'parameters': conditional_headers,
             'response': 'List of trending products'
         },
         'Top Products': {
             'url': f"{base_url}/products/top/",
             'method': 'GET',
             'description': 'Get list of top products',
+            'parameters': conditional_headers,
             'response': 'List of top products'
         },
         'Search Products': {
@@ -171,33 +185,70 @@ def api_documentation(request):
             'description': 'Search products by keywords',
             'parameters': {
                 'q': 'Search query (min 2 characters)',
-                'page': 'Page number (default: 1)',
-                'page_size': 'Number of results per page (default: 10)'
+                'cursor': 'next_cursor from the previous page (omit for the first page)',
+                'page_size': 'Number of results per page (default: 10, max: 100)',
+                'page': 'Page number instead of a cursor (slower on deep pages)'
             },
             'response': {
                 'results': 'List of products matching search',
-                'count': 'Total number of matching products',
+                'count': 'Number of matching products, counted up to 1000 (cached until the catalog changes)',
+                'count_capped': 'True when count stopped at the limit and there may be more',
+                'next_cursor': 'Cursor for the next page, or null on the last page',
                 'has_more': 'Whether there are more pages',
                 'page': 'Current page number',
                 'page_size': 'Current page size',
                 'query': 'Search query used'
             }
         },
+        'Search Cache Stats': {
+            'url': f"{base_url}/products/search/stats/",
+            'method': 'GET',
+            'description': 'Hit and miss counts of the search result and product card caches',
+            'authentication': 'Required (staff)',
+            'response': {
+                'catalog_version': 'Current catalog version; bumped by every product write',
+                'search': 'hits, misses and hit_rate of cached search result pages',
+                'cards': 'hits, misses and hit_rate of cached serialized products'
+            }
+        },
+        'Suggest Products': {
+            'url': f"{base_url}/products/suggest/",
+            'method': 'GET',
+            'description': 'Typeahead suggestions for a partially typed query, most viewed first',
+            'parameters': {
+                'q': 'Text typed so far; the last word may be incomplete',
+                'limit': 'Number of suggestions (default: 8, max: 10)'
+            },
+            'response': {
+                'query': 'Query used',
+                'suggestions': 'List of {text, type, product_id}; type is product, brand, category or manufacturer and product_id is set for products only'
+            }
+        },
         'Filter Products': {
             'url': f"{base_url}/products/filter/",
             'method': 'GET',
-            'description': 'Filter products by gender, age, and category',
+            'description': 'Filter products by gender, age, and category, a page at a time',
             'parameters': {
                 'gender': 'Filter by gender (M, F, U)',
                 'age_group': 'Filter by age group',
-                'category': 'Filter by product category'
+                'category': 'Filter by product category; any spelling or alias of it matches',
+                'cursor': 'next_cursor from the previous page (omit for the first page)',
+                'page_size': 'Number of results per page (default: 10, max: 100)',
+                'sort': 'id, title, brand or category (by the stored text, not the canonical name), prefixed with - for descending (default: id)'
             },
-            'response': 'List of filtered products'
+            'response': {
+                'results': 'List of filtered products',
+                'count': 'Total number of matching products (cached briefly)',
+                'next_cursor': 'Cursor for the next page, or null on the last page',
+                'has_more': 'Whether there are more pages',
+                'facets': 'Counts per gender, age_group and category value, each under the other two filters (cached for a minute)'
+            }
         },
         'Product Categories': {
             'url': f"{base_url}/products/categories/",
             'method': 'GET',
             'description': 'Get the top 6 most common product categories',
+            'parameters': conditional_headers,
             'response': 'List of category names'
         }
     }
@@ -281,12 +332,87 @@ def api_documentation(request):
         }
     }
     
+    # Upload endpoints
+    upload_endpoints = {
+        'Create Resumable Upload': {
+            'url': f"{base_url}/uploads/",
+            'method': 'POST',
+            'description': 'Start a resumable (tus-style) video upload for a product flick or gallery video',
+            'authentication': 'Required (staff)',
+            'parameters': {
+                'product_id': 'ID of the product the video belongs to',
+                'target': "'flicks' (default) or 'gallery'",
+                'filename': 'Original file name (MP4, MOV, AVI, WMV, FLV or WebM)',
+                'Upload-Length': 'Header (or length field): total size in bytes'
+            },
+            'response': {
+                'id': 'Upload ID',
+                'upload_url': 'URL to send chunks to (also in the Location header)',
+                'offset': 'Bytes received so far',
+                'length': 'Total size in bytes'
+            }
+        },
+        'Upload Offset': {
+            'url': f"{base_url}/uploads/{{upload_id}}/",
+            'method': 'HEAD',
+            'description': 'Get the current offset to resume an interrupted upload',
+            'authentication': 'Required (staff)',
+            'response': 'Upload-Offset, Upload-Length and Upload-Expires headers (GET returns the same as JSON with status); 410 once the upload has expired'
+        },
+        'Upload Chunk': {
+            'url': f"{base_url}/uploads/{{upload_id}}/",
+            'method': 'PATCH',
+            'description': 'Append a chunk. The header is validated once the first megabyte arrives, and the video is processed after the last chunk',
+            'authentication': 'Required (staff)',
+            'parameters': {
+                'Content-Type': 'Header: application/offset+octet-stream',
+                'Upload-Offset': 'Header: offset the chunk starts at (must match the server offset, else 409)',
+                'body': 'Raw chunk bytes'
+            },
+            'response': '204 with the new Upload-Offset header; 410 if the upload went unused past Upload-Expires'
+        },
+        'Cancel Upload': {
+            'url': f"{base_url}/uploads/{{upload_id}}/",
+            'method': 'DELETE',
+            'description': 'Abandon an upload and discard its chunks',
+            'authentication': 'Required (staff)',
+            'response': '204 No Content'
+        },
+        'Create Direct Upload': {
+            'url': f"{base_url}/uploads/intents/",
+            'method': 'POST',
+            'description': 'Get a presigned URL to upload media straight to storage, bypassing the API servers',
+            'authentication': 'Required (staff, or the shop owner for shop banners)',
+            'parameters': {
+                'target': 'flicks, gallery_image, gallery_video, shop_banner or manufacturer_banner',
+                'object_id': 'ID of the product, shop or manufacturer',
+                'filename': 'Original file name',
+                'size': 'Exact size in bytes',
+                'method': "'put' (default) or 'post' (browser form upload)"
+            },
+            'response': {
+                'id': 'Upload ID',
+                'upload': 'method, url, form fields (POST) and headers (PUT) to send the file with',
+                'complete_url': 'URL to call once the upload has finished',
+                'expires_at': 'When the presigned target stops working'
+            }
+        },
+        'Complete Direct Upload': {
+            'url': f"{base_url}/uploads/intents/{{upload_id}}/complete/",
+            'method': 'POST',
+            'description': 'Verify the uploaded object and queue it for processing',
+            'authentication': 'Required',
+            'response': '202 with the upload status, 400 if the object is missing or does not match, or 410 past expires_at'
+        }
+    }
+    
     # Combine all documentation
     full_docs = {
         'Authentication': auth_endpoints,
         'Store Management': store_endpoints,
         'Products': product_endpoints,
         'Analytics': analytics_endpoints,
+        'Uploads': upload_endpoints,
         'Other': other_endpoints,
         'API Overview': {
             'url': f"{base_url}/",
@@ -0,0 +1,89 @@
+"""
+Facet counts for the product filters
+
+Each facet is counted under every filter except its own, so with gender=M
+selected the gender facet still shows how many F and U products there are,
+while the category and age facets count male products only. All three
+come from one GROUP BY category_ref query whose columns are conditional
+counts (COUNT(*) FILTER (WHERE ...), or a CASE on databases without
+FILTER), and are cached briefly per filter combination and catalog version. Categories are
+grouped by term id and named from the in-process taxonomy map.
+"""
+import hashlib
+import json
+from functools import reduce
+from operator import or_
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from products import catalog_cache, taxonomy
+from products.models import Product
+
+# Filter parameter -> Product field; category is filtered by term id
+FACETS = {
+    'gender': 'gender',
+    'age_group': 'standardized_age',
+    'category': 'category_ref_id',
+}
+
+
+def _count(condition):
+    return Count('id', filter=condition) if condition else Count('id')
+
+
+def _query_facets(filters):
+    conditions = {param: Q(**{FACETS[param]: value}) for param, value in filters.items()}
+
+    def others(param):
+        return reduce(lambda a, b: a & b, (q for p, q in conditions.items() if p != param), Q())
+
+    genders = [value for value, _ in Product.GENDER_CHOICES]
+    ages = [value for value, _ in Product.STANDARD_AGE_CHOICES]
+    aggregates = {'category_count': _count(others('category'))}
+    for i, value in enumerate(genders):
+        aggregates[f'gender_{i}'] = _count(others('gender') & Q(gender=value))
+    for i, value in enumerate(ages):
+        aggregates[f'age_{i}'] = _count(others('age_group') & Q(standardized_age=value))
+
+    products = Product.objects.all()
+    if len(conditions) > 1:
+        # Only rows that fail at most one filter can count towards any facet
+        products = products.filter(reduce(or_, (others(param) for param in conditions)))
+    rows = products.values('category_ref_id').annotate(**aggregates).order_by()
+
+    facets = {
+        'gender': dict.fromkeys(genders, 0),
+        'age_group': dict.fromkeys(ages, 0),
+        'category': {},
+    }
+    for row in rows:
+        for i, value in enumerate(genders):
+            facets['gender'][value] += row[f'gender_{i}']
+        for i, value in enumerate(ages):
+            facets['age_group'][value] += row[f'age_{i}']
+        category = taxonomy.name('category', row['category_ref_id'])
+        if category and row['category_count']:
+            facets['category'][category] = row['category_count']
+    # Most common categories first
+    facets['category'] = dict(sorted(facets['category'].items(), key=lambda item: (-item[1], item[0])))
+    return facets
+
+
+def facet_counts(filters):
+    """
+    Product counts per gender, standardized age and category
+
+    Args:
+        filters: Dict of filter parameter (a FACETS key) to selected value,
+            a term id for category
+    Returns:
+        Dict of facet name to {value: count}; every gender and age choice
+        is listed, categories only where the count is non-zero, largest first
+    """
+    digest = hashlib.sha1(json.dumps(filters, sort_keys=True).encode('utf-8')).hexdigest()
+    key = f'facets:{catalog_cache.catalog_version()}:{digest}'
+    facets = cache.get(key)
+    if facets is None:
+        facets = _query_facets(filters)
+        cache.set(key, facets, getattr(settings, 'FACET_CACHE_SECONDS', 60))
+    return facets
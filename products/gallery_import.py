@@ -0,0 +1,435 @@
+"""
+Bulk import of gallery media from a ZIP archive or a directory
+
+Files are matched to products by title (case-insensitive) or product id,
+either through a mapping CSV or from the file layout:
+
+    Robot Dog/front.jpg        folder named after the product
+    Robot Dog_2.jpg            file stem, with a trailing _N / -N ignored
+    42/demo.mp4                product id
+
+A mapping CSV has the columns file, product and optionally alt_text,
+display_order and is_primary; files it doesn't list are skipped.
+
+Still images are cropped, get derivatives and a placeholder in a process
+pool (import_gallery command) or in-process (admin imports, which are
+queued to the media pipeline with queue_import); videos and animated GIFs
+are stored as uploaded and queued to the media pipeline. All rows are inserted with one bulk_create, with display
+order and primary flags worked out per product in a single pass.
+"""
+import csv
+import io
+import logging
+import os
+import re
+import tempfile
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+from django.db.models import Count, Max, Q
+from . import catalog_cache
+from .media_pipeline import enqueue
+from .models import Product, ProductGallery
+from .utils.media_processors import (
+    process_product_image, generate_image_derivatives, store_image_derivatives,
+    is_animated_gif, sniff_video_container
+)
+from .utils.placeholders import compute_placeholder
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+VIDEO_EXTENSIONS = {'.mp4', '.mov', '.avi', '.wmv', '.flv', '.webm'}
+
+IMAGE_UPLOAD_TO = ProductGallery._meta.get_field('image').upload_to
+VIDEO_UPLOAD_TO = ProductGallery._meta.get_field('video').upload_to
+
+TRAILING_INDEX = re.compile(r'[\s_-]*(\(\d+\)|\d+)$')
+
+
+def iter_source_files(source):
+    """
+    Yield (relative path, opener) for every media file in a ZIP or directory
+
+    The opener returns a binary file object, so large videos are streamed
+    from the archive instead of being read up front.
+    """
+    if isinstance(source, (str, os.PathLike)) and os.path.isdir(source):
+        for dirpath, dirnames, filenames in os.walk(source):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                relative = os.path.relpath(path, source).replace(os.sep, '/')
+                if is_media_name(relative):
+                    yield relative, (lambda path=path: open(path, 'rb'))
+        return
+
+    archive = zipfile.ZipFile(source)
+    for info in sorted(archive.infolist(), key=lambda info: info.filename):
+        if info.is_dir() or info.filename.startswith('__MACOSX/') or not is_media_name(info.filename):
+            continue
+        yield info.filename, (lambda info=info: archive.open(info))
+
+
+def is_media_name(path):
+    basename = os.path.basename(path)
+    ext = os.path.splitext(basename)[1].lower()
+    return not basename.startswith('.') and ext in IMAGE_EXTENSIONS | VIDEO_EXTENSIONS
+
+
+def product_key(path):
+    """Product title or id a file belongs to, from its folder or file name"""
+    parts = path.split('/')
+    if len(parts) > 1:
+        return parts[-2]
+    stem = os.path.splitext(parts[-1])[0]
+    return TRAILING_INDEX.sub('', stem) or stem
+
+
+def read_mapping(mapping_file):
+    """Parse a mapping CSV into {file path: row}"""
+    if hasattr(mapping_file, 'read'):
+        content = mapping_file.read()
+        if isinstance(content, bytes):
+            content = content.decode('utf-8-sig')
+        rows = csv.DictReader(io.StringIO(content))
+    else:
+        with open(mapping_file, newline='', encoding='utf-8-sig') as f:
+            rows = list(csv.DictReader(f))
+    return {row['file'].strip(): row for row in rows if row.get('file')}
+
+
+class ProductMatcher:
+    """Resolve title-or-id keys to products loaded with a single query"""
+
+    def __init__(self, products=None):
+        queryset = products if products is not None else Product.objects.all()
+        self.by_id = {}
+        self.by_title = defaultdict(list)
+        for product in queryset.only('id', 'title'):
+            self.by_id[str(product.id)] = product
+            self.by_title[product.title.strip().lower()].append(product)
+
+    def match(self, key):
+        key = (key or '').strip()
+        if key in self.by_id:
+            return self.by_id[key], None
+        candidates = self.by_title.get(key.lower(), [])
+        if len(candidates) == 1:
+            return candidates[0], None
+        if candidates:
+            return None, f"title '{key}' matches {len(candidates)} products"
+        return None, f"no product matches '{key}'"
+
+
+def _init_worker():
+    # Forked workers inherit configured settings; spawned ones need setup
+    django.setup()
+
+
+def prepare_image(name, data):
+    """
+    Process one still image in a worker process
+
+    Returns:
+        (processed bytes, derivatives {format: {width: bytes}}, placeholder)
+    """
+    image = process_product_image(ContentFile(data, name=name))
+    image.seek(0)
+    processed = image.read()
+    try:
+        derivatives = generate_image_derivatives(image)
+    except Exception as e:
+        logger.error(f"Error generating image derivatives for {name}: {e}")
+        derivatives = {}
+    return processed, derivatives, compute_placeholder(image)
+
+
+def process_gallery_item(item_id):
+    """Media pipeline job: process a gallery row inserted in bulk"""
+    item = ProductGallery.objects.get(pk=item_id)
+    item.process_media()
+    item.save(no_process=True)
+
+
+def plan_import(source, mapping=None, products=None):
+    """
+    Match source files to products
+
+    Returns:
+        (entries, skipped) where entries are dicts with path, opener,
+        product, kind ('image', 'video' or 'gif'), alt_text, display_order
+        and is_primary (None when not given), and skipped is a list of
+        (path, reason)
+    """
+    rows = read_mapping(mapping) if mapping is not None else None
+    matcher = ProductMatcher(products)
+    entries, skipped = [], []
+
+    for path, opener in iter_source_files(source):
+        row = {}
+        if rows is not None:
+            row = rows.get(path) or rows.get(os.path.basename(path))
+            if row is None:
+                skipped.append((path, 'not in mapping'))
+                continue
+        product, error = matcher.match(row.get('product') or product_key(path))
+        if error:
+            skipped.append((path, error))
+            continue
+
+        ext = os.path.splitext(path)[1].lower()
+        if ext in VIDEO_EXTENSIONS:
+            with opener() as f:
+                header = f.read(16)
+            if not sniff_video_container(header):
+                skipped.append((path, 'not a recognised video container'))
+                continue
+            kind = 'video'
+        elif ext == '.gif':
+            with opener() as f:
+                kind = 'gif' if is_animated_gif(File(f, name=path)) else 'image'
+        else:
+            kind = 'image'
+
+        display_order = (row.get('display_order') or '').strip()
+        is_primary = (row.get('is_primary') or '').strip().lower()
+        entries.append({
+            'path': path,
+            'opener': opener,
+            'product': product,
+            'kind': kind,
+            'alt_text': (row.get('alt_text') or '')[:100],
+            'display_order': int(display_order) if display_order.isdigit() else None,
+            'is_primary': is_primary in ('1', 'true', 'yes') if is_primary else None,
+        })
+    return entries, skipped
+
+
+def assign_order_and_primary(entries):
+    """
+    Set display_order and is_primary on every entry in one pass
+
+    New media is ordered after the product's existing gallery. Where a
+    product has no primary item of a media type yet, its first new item of
+    that type becomes primary. Entries explicitly marked primary win, and
+    existing primaries they replace are cleared in a single update.
+
+    Returns:
+        Q matching the existing rows that lose their primary flag, or None
+    """
+    product_ids = {entry['product'].id for entry in entries}
+    existing = {
+        (row['product'], row['media_type']): row
+        for row in ProductGallery.objects.filter(product_id__in=product_ids)
+        .values('product', 'media_type')
+        .annotate(max_order=Max('display_order'), primaries=Count('pk', filter=Q(is_primary=True)))
+    }
+    next_order = defaultdict(int)
+    for (product_id, _), row in existing.items():
+        next_order[product_id] = max(next_order[product_id], (row['max_order'] or 0) + 1)
+
+    has_primary = {key for key, row in existing.items() if row['primaries']}
+    first_explicit = {}
+    for entry in entries:
+        if entry['is_primary']:
+            first_explicit.setdefault((entry['product'].id, media_type(entry)), entry)
+
+    demote = None
+    for product_id, kind in first_explicit:
+        if (product_id, kind) in has_primary:
+            condition = Q(product_id=product_id, media_type=kind)
+            demote = condition if demote is None else demote | condition
+
+    claimed = has_primary | set(first_explicit)
+    for entry in entries:
+        product_id = entry['product'].id
+        if entry['display_order'] is None:
+            entry['display_order'] = next_order[product_id]
+        next_order[product_id] = max(next_order[product_id], entry['display_order'] + 1)
+
+        key = (product_id, media_type(entry))
+        if entry['is_primary']:
+            # Only the first explicit primary per product and type keeps it
+            entry['is_primary'] = first_explicit[key] is entry
+        elif entry['is_primary'] is None and entry['kind'] != 'gif' and key not in claimed:
+            # GIFs may end up as either media type, so they never claim it
+            entry['is_primary'] = True
+            claimed.add(key)
+        else:
+            entry['is_primary'] = False
+    return demote
+
+
+def media_type(entry):
+    return 'video' if entry['kind'] == 'video' else 'image'
+
+
+def _store_image(entry, prepared):
+    processed, derivatives, placeholder = prepared
+    name = default_storage.save(IMAGE_UPLOAD_TO + os.path.basename(entry['path']), ContentFile(processed))
+    entry['item'] = ProductGallery(
+        media_type='image',
+        image=name,
+        image_variants=store_image_derivatives(derivatives, name, IMAGE_UPLOAD_TO),
+        placeholder=placeholder,
+    )
+
+
+def _store_images(entries, workers):
+    """Process still images, in a process pool when workers > 1, and store the results"""
+    if workers <= 1:
+        # In this process: web requests and media pipeline threads must not fork
+        for entry in entries:
+            try:
+                with entry['opener']() as f:
+                    prepared = prepare_image(os.path.basename(entry['path']), f.read())
+            except Exception as e:
+                entry['error'] = str(e)
+                continue
+            _store_image(entry, prepared)
+        return
+
+    batch_size = workers * 4
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        # Submit in batches so only a few source files are held in memory
+        for start in range(0, len(entries), batch_size):
+            batch = entries[start:start + batch_size]
+            futures = []
+            for entry in batch:
+                with entry['opener']() as f:
+                    data = f.read()
+                futures.append(pool.submit(prepare_image, os.path.basename(entry['path']), data))
+            for entry, future in zip(batch, futures):
+                try:
+                    prepared = future.result()
+                except Exception as e:
+                    entry['error'] = str(e)
+                    continue
+                _store_image(entry, prepared)
+
+
+def _store_uploads(entries):
+    """Store videos and animated GIFs as uploaded, for the media pipeline"""
+    for entry in entries:
+        basename = os.path.basename(entry['path'])
+        try:
+            with entry['opener']() as f:
+                if entry['kind'] == 'video':
+                    name = default_storage.save(VIDEO_UPLOAD_TO + basename, File(f, name=basename))
+                    entry['item'] = ProductGallery(media_type='video', video=name)
+                else:
+                    name = default_storage.save(IMAGE_UPLOAD_TO + basename, File(f, name=basename))
+                    entry['item'] = ProductGallery(media_type='image', image=name)
+        except Exception as e:
+            entry['error'] = str(e)
+
+
+def import_gallery(source, mapping=None, products=None, workers=None):
+    """
+    Import gallery media for many products at once
+
+    Args:
+        source: Path or file object of a ZIP archive, or a directory path
+        mapping: Optional mapping CSV (path or file object)
+        products: Optional queryset limiting which products can be matched
+        workers: Image processing processes (default GALLERY_IMPORT_WORKERS
+            setting); 1 processes images in this process. Only management
+            commands should fork a pool.
+
+    Returns:
+        Dict with created (rows), images, queued (videos/GIFs sent to the
+        media pipeline), skipped and failed (lists of (path, reason))
+    """
+    if workers is None:
+        workers = getattr(settings, 'GALLERY_IMPORT_WORKERS', None) or os.cpu_count() or 1
+
+    entries, skipped = plan_import(source, mapping, products)
+    images = [entry for entry in entries if entry['kind'] == 'image']
+    uploads = [entry for entry in entries if entry['kind'] != 'image']
+    if images:
+        _store_images(images, workers)
+    _store_uploads(uploads)
+
+    failed = [(entry['path'], entry['error']) for entry in entries if 'error' in entry]
+    entries = [entry for entry in entries if 'item' in entry]
+
+    with transaction.atomic():
+        demote = assign_order_and_primary(entries) if entries else None
+        if demote is not None:
+            ProductGallery.objects.filter(demote, is_primary=True).update(is_primary=False, updated_at=timezone.now())
+
+        items = []
+        for entry in entries:
+            item = entry['item']
+            item.product = entry['product']
+            item.alt_text = entry['alt_text']
+            item.display_order = entry['display_order']
+            item.is_primary = entry['is_primary']
+            item.media_urls = item.build_media_urls()
+            items.append(item)
+        ProductGallery.objects.bulk_create(items, batch_size=500)
+        if items:
+            catalog_cache.bulk_written()
+
+    queued = 0
+    for entry in entries:
+        if entry['kind'] != 'image':
+            enqueue(process_gallery_item, entry['item'].pk)
+            queued += 1
+
+    for path, reason in skipped + failed:
+        logger.warning(f"Gallery import skipped {path}: {reason}")
+    return {
+        'created': len(entries),
+        'images': len(entries) - queued,
+        'queued': queued,
+        'skipped': skipped,
+        'failed': failed,
+    }
+
+
+def _spool(uploaded, suffix):
+    """Copy an uploaded file to a temp file that outlives the request"""
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=settings.FILE_UPLOAD_TEMP_DIR)
+    with os.fdopen(fd, 'wb') as f:
+        for chunk in File(uploaded).chunks():
+            f.write(chunk)
+    return path
+
+
+def queue_import(archive, mapping=None, products=None):
+    """
+    Import an uploaded archive on the media pipeline instead of in the request
+
+    The archive and mapping are spooled to temp files, which the job
+    removes when it is done. Images are processed in the pipeline's thread,
+    without a process pool.
+    """
+    archive_path = _spool(archive, '.zip')
+    mapping_path = _spool(mapping, '.csv') if mapping else None
+    product_ids = list(products.values_list('pk', flat=True)) if products is not None else None
+    enqueue(import_gallery_job, archive_path, mapping_path, product_ids)
+
+
+def import_gallery_job(archive_path, mapping_path, product_ids):
+    """Media pipeline job: import a spooled archive (see queue_import)"""
+    try:
+        products = Product.objects.filter(pk__in=product_ids) if product_ids is not None else None
+        report = import_gallery(archive_path, mapping=mapping_path, products=products, workers=1)
+        logger.info(
+            f"Gallery import of {len(product_ids or [])} products: {report['created']} items, "
+            f"{report['images']} images, {report['queued']} videos queued for processing"
+        )
+    finally:
+        for path in (archive_path, mapping_path):
+            if path and os.path.exists(path):
+                os.unlink(path)
@@ -0,0 +1,110 @@
+import json
+from collections import defaultdict
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from products import catalog_cache, taxonomy
+from products.models import Brand, Category, Product, taxonomy_key
+
+# kind -> (term model, product text field, product ref field)
+FIELDS = {
+    'category': (Category, 'product_category', 'category_ref'),
+    'brand': (Brand, 'brand', 'brand_ref'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Link products to the Category and Brand terms their free-text category "
+        "and brand resolve to, creating terms as needed. Safe to re-run; by "
+        "default only products not linked yet are touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--aliases',
+            help='JSON file of {"category": {"Canonical name": ["spelling", ...]}, "brand": {...}}; '
+                 'these spellings are mapped onto the named terms, replacing any existing mapping'
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Re-resolve every product, e.g. after changing aliases'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Products read and updated per transaction'
+        )
+
+    def handle(self, *args, **options):
+        aliases = None
+        if options['aliases']:
+            try:
+                with open(options['aliases']) as f:
+                    aliases = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Can't read aliases: {e}")
+
+        # One reload at the end rather than one per term created
+        with taxonomy.reloads_deferred():
+            if aliases is not None:
+                self.load_aliases(aliases)
+            for kind, (model, text_field, ref_field) in FIELDS.items():
+                self.create_terms(model, text_field)
+                linked = self.link_products(model, text_field, ref_field, options['batch_size'], options['all'])
+                self.stdout.write(f"{model.__name__}: {model.objects.count()} terms, linked {linked} products")
+
+        # update() bypasses the signals that invalidate cached cards and maps
+        catalog_cache.bulk_written()
+        taxonomy.load_maps()
+
+    def load_aliases(self, aliases):
+        for kind, terms in aliases.items():
+            if kind not in FIELDS:
+                raise CommandError(f"Unknown taxonomy '{kind}', expected one of {', '.join(FIELDS)}")
+            model = FIELDS[kind][0]
+            with transaction.atomic():
+                for name, spellings in terms.items():
+                    term = model.objects.get(pk=model.resolve(name))
+                    for spelling in spellings:
+                        if taxonomy_key(spelling):
+                            model.alias_model().objects.update_or_create(
+                                key=taxonomy_key(spelling), defaults={'term': term}
+                            )
+
+    def create_terms(self, model, text_field):
+        """Resolve every distinct spelling, most used first, so the commonest one names its term"""
+        spellings = (
+            Product.objects.exclude(**{text_field: ''})
+            .values(text_field)
+            .annotate(n=Count('id'))
+            .order_by('-n', text_field)
+        )
+        for row in spellings.iterator():
+            model.resolve(row[text_field])
+
+    def link_products(self, model, text_field, ref_field, batch_size, everything):
+        ids = dict(model.alias_model().objects.values_list('key', 'term_id'))
+        products = Product.objects.order_by('id')
+        if not everything:
+            products = products.filter(**{f'{ref_field}__isnull': True})
+
+        linked = 0
+        last_id = 0
+        while True:
+            # Keyset chunks, each its own short transaction
+            rows = list(products.filter(id__gt=last_id).values_list('id', text_field, f'{ref_field}_id')[:batch_size])
+            if not rows:
+                return linked
+            last_id = rows[-1][0]
+            by_term = defaultdict(list)
+            for pk, text, current in rows:
+                term_id = ids.get(taxonomy_key(text))
+                if term_id != current:
+                    by_term[term_id].append(pk)
+            with transaction.atomic():
+                for term_id, pks in by_term.items():
+                    Product.objects.filter(pk__in=pks).update(
+                        **{f'{ref_field}_id': term_id}, updated_at=timezone.now()
+                    )
+                    linked += len(pks)
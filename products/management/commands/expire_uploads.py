@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from products.uploads import expire_uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "Abandon resumable uploads that received no chunk for RESUMABLE_UPLOAD_EXPIRES "
+        "seconds, discarding their chunks and S3 multipart parts, and remove chunk "
+        "files no upload in progress owns. Run periodically, e.g. hourly."
+    )
+
+    def handle(self, *args, **options):
+        abandoned, removed = expire_uploads()
+        self.stdout.write(f"Abandoned {abandoned} uploads, removed {removed} stray chunk files")
@@ -0,0 +1,221 @@
+import os
+from datetime import datetime, timedelta, timezone
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import models
+from flicks.storage_backends import object_key
+from products.models import MediaFieldsMixin
+from products.uploads import expire_uploads, in_flight_uploads, prune_uploads
+from products.utils.bloom import BloomFilter
+from products.utils.media_processors import DEFAULT_DERIVATIVE_WIDTHS
+
+# S3 DeleteObjects accepts at most this many keys per request
+S3_DELETE_BATCH = 1000
+
+
+def file_fields():
+    """(model, field name) of every FileField/ImageField on every installed model"""
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if isinstance(field, models.FileField):
+                yield model, field.name
+
+
+def media_prefixes():
+    """
+    Top-level directories FileFields upload into
+
+    Only these are swept: static files share the bucket root, and anything
+    else there is not ours to judge.
+    """
+    prefixes = set()
+    for model, field_name in file_fields():
+        upload_to = model._meta.get_field(field_name).upload_to
+        if isinstance(upload_to, str) and upload_to.strip('/'):
+            prefixes.add(upload_to.strip('/').split('/')[0] + '/')
+    return sorted(prefixes)
+
+
+def variant_names(variants):
+    """Stored derivative names in a {format: {width: name}} JSON value"""
+    for sizes in (variants or {}).values():
+        yield from sizes.values()
+
+
+def referenced_names(chunk_size):
+    """Stream every storage name the database still points at"""
+    for model, field_name in file_fields():
+        names = model._default_manager.exclude(**{field_name: ''}).values_list(field_name, flat=True)
+        yield from (name for name in names.iterator(chunk_size=chunk_size) if name)
+
+    for model in apps.get_models():
+        if issubclass(model, MediaFieldsMixin):
+            for variants_field in model.variant_fields:
+                values = model._default_manager.values_list(variants_field, flat=True)
+                for variants in values.iterator(chunk_size=chunk_size):
+                    yield from variant_names(variants)
+
+    # Uploads still in flight own their object before any row references it
+    for uploads in in_flight_uploads():
+        names = uploads.exclude(storage_name='').values_list('storage_name', flat=True)
+        yield from names.iterator(chunk_size=chunk_size)
+
+
+def count_references():
+    """Upper bound of referenced_names(), used to size the Bloom filter"""
+    widths = getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', DEFAULT_DERIVATIVE_WIDTHS)
+    total = sum(model._default_manager.count() for model, _ in file_fields())
+    for model in apps.get_models():
+        if issubclass(model, MediaFieldsMixin) and model.variant_fields:
+            # WebP and AVIF at every derivative width
+            total += model._default_manager.count() * len(model.variant_fields) * 2 * len(widths)
+    return total + sum(uploads.count() for uploads in in_flight_uploads())
+
+
+def iter_stored_files(storage, prefixes):
+    """
+    Stream (name, last_modified, size) of every object under the prefixes
+
+    S3 is listed page by page (1000 keys per request); local storage is
+    walked directory by directory. Names are relative to the storage
+    location, as FileFields store them.
+    """
+    if hasattr(storage, 'bucket_name'):
+        paginator = storage.connection.meta.client.get_paginator('list_objects_v2')
+        location = object_key(storage, '')
+        location = location.rstrip('/') + '/' if location else ''
+        for prefix in prefixes:
+            for page in paginator.paginate(Bucket=storage.bucket_name, Prefix=location + prefix):
+                for obj in page.get('Contents', []):
+                    yield obj['Key'][len(location):], obj['LastModified'], obj['Size']
+    else:
+        root = storage.location
+        for prefix in prefixes:
+            for dirpath, dirnames, filenames in os.walk(os.path.join(root, prefix)):
+                # Skip in-progress atomic writes
+                dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    stat = os.stat(path)
+                    name = os.path.relpath(path, root).replace(os.sep, '/')
+                    yield name, datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc), stat.st_size
+
+
+def delete_batch(storage, names):
+    """Delete stored names, in one request per batch on S3. Returns names that failed."""
+    if hasattr(storage, 'bucket_name'):
+        response = storage.connection.meta.client.delete_objects(
+            Bucket=storage.bucket_name,
+            Delete={
+                'Objects': [{'Key': object_key(storage, name)} for name in names],
+                'Quiet': True,
+            },
+        )
+        return [error['Key'] for error in response.get('Errors', [])]
+
+    failed = []
+    # Content-addressed storage ignores delete() since blobs may be shared
+    remove = getattr(storage, 'purge', storage.delete)
+    for name in names:
+        try:
+            remove(name)
+        except OSError:
+            failed.append(name)
+    return failed
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete media objects no longer referenced by any FileField, derivative "
+        "or in-flight upload, after pruning upload rows past RESUMABLE_UPLOAD_EXPIRES. "
+        "Lists storage and database in streams, so memory stays bounded by the "
+        "Bloom filter size."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report orphans without deleting them'
+        )
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help='Never delete objects modified more recently than this'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=S3_DELETE_BATCH,
+            help='Orphans deleted per request (and rows fetched per query)'
+        )
+        parser.add_argument(
+            '--error-rate', type=float, default=0.001,
+            help='Bloom filter false-positive rate; false positives are kept, never deleted'
+        )
+        parser.add_argument(
+            '--prefix', action='append', dest='prefixes',
+            help='Storage prefix to sweep (repeatable); defaults to the FileField upload_to roots'
+        )
+        parser.add_argument(
+            '--show', type=int, default=20,
+            help='Orphan names to list in the report'
+        )
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        batch_size = min(options['batch_size'], S3_DELETE_BATCH)
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=options['grace_hours'])
+        dry_run = options['dry_run']
+        prefixes = options['prefixes'] or media_prefixes()
+
+        if not dry_run:
+            # Finished, failed and abandoned uploads stop protecting their objects
+            abandoned, _ = expire_uploads()
+            sessions, intents = prune_uploads()
+            self.stdout.write(
+                f"Abandoned {abandoned} idle uploads; pruned {sessions} upload sessions and {intents} upload intents"
+            )
+
+        referenced = BloomFilter(count_references(), options['error_rate'])
+        reference_count = 0
+        for name in referenced_names(batch_size):
+            referenced.add(name)
+            reference_count += 1
+        self.stdout.write(f"Indexed {reference_count} referenced names; sweeping {', '.join(prefixes)}")
+
+        scanned = orphans = orphan_bytes = recent = deleted = 0
+        failed = []
+        batch = []
+        for name, modified, size in iter_stored_files(storage, prefixes):
+            scanned += 1
+            if name in referenced:
+                continue
+            if modified > cutoff:
+                recent += 1
+                continue
+            orphans += 1
+            orphan_bytes += size
+            if orphans <= options['show']:
+                self.stdout.write(f"  orphan: {name} ({size} bytes, {modified:%Y-%m-%d %H:%M})")
+            if dry_run:
+                continue
+            batch.append(name)
+            if len(batch) >= batch_size:
+                errors = delete_batch(storage, batch)
+                failed.extend(errors)
+                deleted += len(batch) - len(errors)
+                batch = []
+        if batch:
+            errors = delete_batch(storage, batch)
+            failed.extend(errors)
+            deleted += len(batch) - len(errors)
+
+        self.stdout.write(
+            f"Scanned {scanned} objects: {orphans} orphans ({orphan_bytes / 1024 / 1024:.1f} MB), "
+            f"{recent} unreferenced but inside the {options['grace_hours']:g}h grace period"
+        )
+        if dry_run:
+            self.stdout.write("Dry run: nothing deleted")
+        else:
+            self.stdout.write(f"Deleted {deleted} orphans")
+        for name in failed:
+            self.stderr.write(f"Failed to delete {name}")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.gallery_import import import_gallery
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-add gallery media from a ZIP archive or a directory, matching "
+        "files to products by title or id (see products.gallery_import)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='ZIP archive or directory of media files')
+        parser.add_argument('--mapping', help='CSV with file,product[,alt_text,display_order,is_primary]')
+        parser.add_argument('--workers', type=int, help='Image processing processes (default: one per CPU)')
+
+    def handle(self, *args, **options):
+        try:
+            report = import_gallery(options['source'], mapping=options['mapping'], workers=options['workers'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for path, reason in report['skipped'] + report['failed']:
+            self.stderr.write(f"Skipped {path}: {reason}")
+        self.stdout.write(
+            f"Imported {report['created']} gallery items: {report['images']} images, "
+            f"{report['queued']} videos queued for processing"
+        )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.models import Product
+from products.search.postgres import is_postgres, update_search_vectors
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the stored full-text vector of every product. Signals keep "
+        "vectors current on save; run this after changing SEARCH_CONFIG or the "
+        "field weights, or after bulk writes that bypass save()."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Only fill products that have no vector yet'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Products updated per query'
+        )
+
+    def handle(self, *args, **options):
+        if not is_postgres():
+            raise CommandError("Full-text search vectors need PostgreSQL")
+
+        queryset = Product.objects.order_by('pk')
+        if options['missing']:
+            queryset = queryset.filter(search_vector__isnull=True)
+        ids = list(queryset.values_list('pk', flat=True))
+
+        batch_size = options['batch_size']
+        updated = 0
+        for start in range(0, len(ids), batch_size):
+            updated += update_search_vectors(Product.objects.filter(pk__in=ids[start:start + batch_size]))
+        self.stdout.write(f"Rebuilt search vectors for {updated} products")
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from products import catalog_cache
+from products.models import Manufacturer, Shop, Product, ProductGallery
+
+MODELS = [Manufacturer, Shop, Product, ProductGallery]
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the stored media_urls of every model with media. Run after "
+        "changing AWS_S3_CUSTOM_DOMAIN, the bucket or the CDN host."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Only fill rows whose media_urls is still empty'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Rows fetched and written per query'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        changed = 0
+        for model in MODELS:
+            queryset = model.objects.only('pk', 'media_urls', *model.url_fields, *model.variant_fields)
+            if options['missing']:
+                queryset = queryset.filter(media_urls={})
+            # bulk_update() skips auto_now, and conditional GETs of products compare updated_at
+            fields = ['media_urls']
+            if any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+                fields.append('updated_at')
+
+            updated = 0
+            batch = []
+            for instance in queryset.iterator(chunk_size=batch_size):
+                instance.media_urls = instance.build_media_urls()
+                instance.updated_at = timezone.now()
+                batch.append(instance)
+                if len(batch) >= batch_size:
+                    model.objects.bulk_update(batch, fields)
+                    updated += len(batch)
+                    batch = []
+            if batch:
+                model.objects.bulk_update(batch, fields)
+                updated += len(batch)
+
+            changed += updated
+            self.stdout.write(f"{model.__name__}: refreshed {updated} rows")
+
+        if changed:
+            catalog_cache.bulk_written()
@@ -0,0 +1,245 @@
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, time
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+from products.models import Product, ProductGallery
+
+# Stored video field of every model that holds videos
+VIDEO_MODELS = {
+    'product': (Product, 'flicks'),
+    'gallery': (ProductGallery, 'video'),
+}
+
+# Assumed for rows whose duration is unknown (the view tracker's fallback)
+DEFAULT_DURATION = 30
+
+
+def reprocess_item(label, pk):
+    """
+    Re-encode one stored video and save its metadata
+
+    Runs in a worker process with its own database connection and storage
+    client. The new encode is stored under a new name; the old object is
+    left for gc_media.
+
+    Returns:
+        Dict with the resulting duration, codec and height
+    """
+    model = apps.get_model(label)
+    instance = model.objects.get(pk=pk)
+    instance.process_media()
+    instance.save(no_process=True)
+    return {
+        'duration': instance.video_duration,
+        'codec': instance.video_codec,
+        'height': instance.video_height,
+    }
+
+
+def estimate_cpu_seconds(duration, height):
+    """ffmpeg CPU time for one video, scaled from the 1080p rate by pixel count"""
+    rate = getattr(settings, 'REPROCESS_CPU_SECONDS_PER_VIDEO_SECOND', 2.0)
+    scale = (height / 1080) ** 2 if height else 1.0
+    return (duration or DEFAULT_DURATION) * rate * scale
+
+
+def parse_date(value, end_of_day=False):
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD[THH:MM]")
+    if len(value) <= 10 and end_of_day:
+        parsed = datetime.combine(parsed.date(), time.max)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def write_checkpoint(path, checkpoint):
+    """Persist the checkpoint atomically so a crash never leaves it half-written"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-encode stored videos selected by missing duration, codec or "
+        "processing date. Progress is checkpointed, so re-running the same "
+        "command resumes where an interrupted run stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', choices=sorted(VIDEO_MODELS), action='append',
+            help='Only product flicks or gallery videos (default: both)'
+        )
+        parser.add_argument(
+            '--missing-duration', action='store_true',
+            help='Videos whose duration was never recorded'
+        )
+        parser.add_argument(
+            '--codec', action='append',
+            help='Videos stored with this codec, e.g. hevc (repeatable)'
+        )
+        parser.add_argument(
+            '--processed-before',
+            help='Videos last encoded before this date, or never (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--processed-after',
+            help='Videos last encoded on or after this date (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--workers', type=int,
+            help='Encoder processes (default REPROCESS_MEDIA_WORKERS or one per CPU; 0 runs inline)'
+        )
+        parser.add_argument(
+            '--checkpoint', default='reprocess_media.checkpoint.json',
+            help='File recording finished items, used to resume'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Ignore an existing checkpoint and start over'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report the selection and estimated CPU time without encoding'
+        )
+
+    def selection(self, options):
+        """Filter shared by both video models, from the selector options"""
+        query = Q()
+        if options['missing_duration']:
+            query &= Q(video_duration__isnull=True)
+        if options['codec']:
+            query &= Q(video_codec__in=options['codec'])
+        if options['processed_before']:
+            query &= Q(video_processed_at__lt=parse_date(options['processed_before'])) | Q(video_processed_at__isnull=True)
+        if options['processed_after']:
+            query &= Q(video_processed_at__gte=parse_date(options['processed_after']))
+        return query
+
+    def handle(self, *args, **options):
+        query = self.selection(options)
+        selector = {
+            key: options[key] for key in (
+                'model', 'missing_duration', 'codec', 'processed_before', 'processed_after'
+            )
+        }
+
+        querysets = []
+        for name in options['model'] or sorted(VIDEO_MODELS):
+            model, field = VIDEO_MODELS[name]
+            queryset = model.objects.filter(query).exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            if model is ProductGallery:
+                queryset = queryset.filter(media_type='video')
+            querysets.append((model._meta.label_lower, queryset.order_by('pk')))
+
+        if options['dry_run']:
+            self.report_estimate(querysets, options)
+            return
+
+        checkpoint_path = options['checkpoint']
+        checkpoint = {'selector': selector, 'done': {}, 'failed': {}}
+        if os.path.exists(checkpoint_path) and not options['restart']:
+            with open(checkpoint_path) as f:
+                saved = json.load(f)
+            if saved.get('selector') != selector:
+                raise CommandError(
+                    f"{checkpoint_path} belongs to a run with different selectors; "
+                    "use --restart or another --checkpoint"
+                )
+            checkpoint = saved
+            self.stdout.write(
+                f"Resuming: {sum(len(ids) for ids in checkpoint['done'].values())} items already done"
+            )
+
+        pending = []
+        for label, queryset in querysets:
+            done = set(checkpoint['done'].get(label, []))
+            pending.extend(
+                (label, pk) for pk in queryset.values_list('pk', flat=True).iterator() if pk not in done
+            )
+        self.stdout.write(f"{len(pending)} videos to re-encode")
+
+        workers = options['workers']
+        if workers is None:
+            workers = getattr(settings, 'REPROCESS_MEDIA_WORKERS', None) or os.cpu_count() or 1
+
+        def record(label, pk, result=None, error=None):
+            if error is None:
+                checkpoint['done'].setdefault(label, []).append(pk)
+                checkpoint['failed'].get(label, {}).pop(str(pk), None)
+                self.stdout.write(f"  {label} {pk}: {result['duration']}s {result['codec']} {result['height']}p")
+            else:
+                checkpoint['failed'].setdefault(label, {})[str(pk)] = error
+                self.stderr.write(f"  {label} {pk} failed: {error}")
+            write_checkpoint(checkpoint_path, checkpoint)
+
+        if workers == 0:
+            for label, pk in pending:
+                try:
+                    record(label, pk, reprocess_item(label, pk))
+                except Exception as e:
+                    record(label, pk, error=str(e))
+        else:
+            # Spawned workers start clean: no inherited DB connections or
+            # storage client sockets from this process
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+                items = iter(pending)
+                running = {}
+                while True:
+                    # Keep a small window in flight so an interrupt loses little work
+                    while len(running) < workers * 2:
+                        item = next(items, None)
+                        if item is None:
+                            break
+                        running[pool.submit(reprocess_item, *item)] = item
+                    if not running:
+                        break
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        label, pk = running.pop(future)
+                        try:
+                            record(label, pk, future.result())
+                        except Exception as e:
+                            record(label, pk, error=str(e))
+
+        failed = sum(len(items) for items in checkpoint['failed'].values())
+        self.stdout.write(f"Done; {failed} failed (listed in {checkpoint_path})")
+
+    def report_estimate(self, querysets, options):
+        workers = options['workers'] or getattr(settings, 'REPROCESS_MEDIA_WORKERS', None) or os.cpu_count() or 1
+        total_cpu = 0.0
+        for label, queryset in querysets:
+            count = unknown = 0
+            seconds = cpu = 0.0
+            codecs = {}
+            rows = queryset.values_list('video_duration', 'video_height', 'video_codec')
+            for duration, height, codec in rows.iterator():
+                count += 1
+                unknown += duration is None
+                seconds += duration or DEFAULT_DURATION
+                cpu += estimate_cpu_seconds(duration, height)
+                codecs[codec or 'unknown'] = codecs.get(codec or 'unknown', 0) + 1
+            total_cpu += cpu
+            codec_summary = ', '.join(f"{codec} {n}" for codec, n in sorted(codecs.items())) or '-'
+            self.stdout.write(
+                f"{label}: {count} videos, {seconds / 60:.1f} min of video "
+                f"({unknown} with unknown duration counted as {DEFAULT_DURATION}s); codecs: {codec_summary}"
+            )
+        self.stdout.write(
+            f"Estimated CPU time {total_cpu / 3600:.2f} h, "
+            f"about {total_cpu / workers / 3600:.2f} h wall time on {workers} workers"
+        )
+        self.stdout.write("Dry run: nothing encoded")
@@ -0,0 +1,54 @@
+"""
+Background execution of media processing jobs
+
+Jobs run on a small in-process thread pool so upload requests return as soon
+as the bytes are stored. Set MEDIA_PIPELINE_EAGER = True to run them inline
+(tests, management commands).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'MEDIA_PIPELINE_WORKERS', 2),
+                thread_name_prefix='media-pipeline'
+            )
+        return _executor
+
+
+def _run(job, args):
+    try:
+        job(*args)
+    except Exception as e:
+        logger.error(f"Media pipeline job {job.__name__} failed: {e}")
+    finally:
+        close_old_connections()
+
+
+def enqueue(job, *args):
+    """
+    Queue a media job
+
+    Args:
+        job: Module-level callable taking only primitive arguments (ids, names)
+        args: Arguments for the job
+
+    Returns:
+        A Future, or None when the job ran inline
+    """
+    if getattr(settings, 'MEDIA_PIPELINE_EAGER', False):
+        job(*args)
+        return None
+    return _get_executor().submit(_run, job, args)
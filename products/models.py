@@ -1,13 +1,30 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
+from django.core.files.storage import default_storage
 from django.contrib.auth.models import AbstractUser, Group, Permission
+from django.contrib.postgres.search import SearchVectorField
+from PIL import Image
+from .utils.image_engine import check_image_size, max_image_pixels
 from .utils.media_processors import (
-    process_video, 
+    encode_video, 
     process_product_image, 
-    process_banner_image
+    process_banner_image,
+    save_image_derivatives,
+    is_animated_gif,
+    convert_gif_to_video,
+    extract_video_poster
 )
+from .utils.placeholders import compute_placeholder
 from django.utils import timezone
+import re
+import uuid
+
+def image_too_large():
+    """The ValidationError for images above IMAGE_MAX_PIXELS, from validators and save() alike"""
+    return ValidationError(
+        f'Image resolution too large. Please upload an image under {max_image_pixels() // 1_000_000} megapixels.'
+    )
 
 def validate_image(file):
     """Validate that the file is an image."""
@@ -23,6 +40,16 @@ def validate_image(file):
     # Check file size (5MB max)
     if file.size > 5 * 1024 * 1024:
         raise ValidationError('Image file too large. Please upload a file smaller than 5MB.')
+    
+    # Check resolution from the header alone, before anything decodes the pixels
+    try:
+        check_image_size(Image.open(file))
+    except Image.DecompressionBombError:
+        raise image_too_large()
+    except Exception:
+        pass  # Unreadable images are left to the image processor
+    finally:
+        file.seek(0)
 
 def validate_video(file):
         """Validate that the file is a video in allowed format."""
@@ -39,6 +66,103 @@ def validate_video(file):
         if file.size > 100 * 1024 * 1024:
             raise ValidationError('Video file too large. Please upload a file smaller than 10MB.')
 
+def build_srcset(variants):
+    """Resolve stored derivative names into {format: {width: url}} for clients"""
+    return {
+        fmt: {width: default_storage.url(name) for width, name in sizes.items()}
+        for fmt, sizes in (variants or {}).items()
+    }
+
+class MediaFieldsMixin:
+    """
+    Track which file fields got new media since the instance was loaded
+    
+    Models list their processed file fields in media_fields and gate
+    processing on media_changed(), which compares stored names instead of
+    touching the file (hasattr(field, 'file') opens it, downloading from S3).
+    
+    Public URLs of url_fields, and of the derivatives in variant_fields, are
+    resolved once when the media changes and kept in the media_urls column,
+    so serializers never call storage.url() per row.
+    """
+    media_fields = ()
+    url_fields = ()
+    variant_fields = {}  # JSON field of derivative names -> key in media_urls
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Raw stored names; deferred fields are simply not tracked
+        instance._loaded_media = {
+            name: instance.__dict__[name] or ''
+            for name in cls.url_fields if name in instance.__dict__
+        }
+        return instance
+    
+    def media_changed(self, field_name):
+        """Whether the field holds an upload or stored name that hasn't been processed yet"""
+        field_file = getattr(self, field_name)
+        if not field_file:
+            return False
+        if not field_file._committed or self._state.adding:
+            return True
+        loaded = getattr(self, '_loaded_media', {})
+        return field_name in loaded and field_file.name != loaded[field_name]
+    
+    def snapshot_media(self):
+        """Mark the current media as processed"""
+        self._loaded_media = {
+            name: getattr(self, name).name or '' for name in self.url_fields
+        }
+    
+    def build_media_urls(self):
+        """Resolve the public URLs of every media field and derivative"""
+        urls = {}
+        for name in self.url_fields:
+            field_file = getattr(self, name)
+            urls[name] = field_file.url if field_file else None
+        for variants_field, key in self.variant_fields.items():
+            urls[key] = build_srcset(getattr(self, variants_field))
+        return urls
+    
+    def refresh_media_urls(self):
+        """
+        Recompute media_urls if any media field was added, replaced or cleared
+        
+        Pending uploads are committed to storage first (what the field's
+        pre_save would do anyway) so their final names are known.
+        """
+        loaded = getattr(self, '_loaded_media', None)
+        changed = self._state.adding or loaded is None or not self.media_urls
+        for name in self.url_fields:
+            field_file = getattr(self, name)
+            if field_file and not field_file._committed:
+                field_file.save(field_file.name, field_file.file, save=False)
+                changed = True
+            elif not changed and (field_file.name or '') != loaded.get(name, ''):
+                changed = True
+        if changed:
+            self.media_urls = self.build_media_urls()
+    
+    def hold_processed_media(self, processed, metadata):
+        """Keep an encoded video's temp file until release_processed_media()"""
+        if metadata.get('encoded'):
+            self.__dict__.setdefault('_processed_media', []).append(processed)
+    
+    def release_processed_media(self):
+        """Close (and so delete) the temp files encoding produced, saved or not"""
+        for processed in self.__dict__.pop('_processed_media', []):
+            processed.close()
+    
+    def apply_video_metadata(self, metadata):
+        """Record what encode_video() learned about the video"""
+        if metadata.get('duration'):
+            self.video_duration = metadata['duration']
+        self.video_codec = metadata.get('codec') or self.video_codec
+        self.video_height = metadata.get('height') or self.video_height
+        if metadata.get('encoded'):
+            self.video_processed_at = timezone.now()
+
 class ShopUser(AbstractUser):
     OWNER = 'owner'
     HELPER = 'helper'
@@ -84,7 +208,11 @@ class ShopUser(AbstractUser):
     def __str__(self):
         return self.username
 
-class Manufacturer(models.Model):
+class Manufacturer(MediaFieldsMixin, models.Model):
+    media_fields = ('banner',)
+    url_fields = ('banner',)
+    variant_fields = {'banner_variants': 'banner_srcset'}
+    
     name = models.CharField(max_length=200)
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=20)
@@ -96,14 +224,40 @@ class Manufacturer(models.Model):
         validators=[validate_image],
         help_text="Upload a banner image (JPG, PNG, GIF, WEBP, max 5MB)"
     )
+    banner_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Responsive WebP/AVIF derivatives of the banner, keyed by format and width"
+    )
+    banner_placeholder = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        help_text="BlurHash of the banner, painted while the image loads"
+    )
+    media_urls = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Public URLs of the media and its derivatives, resolved when the media changes"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def save(self, *args, **kwargs):
         # Process banner image to 1280x720
-        if self.banner and hasattr(self.banner, 'file') and not kwargs.pop('no_process', False):
-            self.banner = process_banner_image(self.banner)
+        no_process = kwargs.pop('no_process', False)
+        if self.media_changed('banner') and not no_process:
+            try:
+                self.banner = process_banner_image(self.banner)
+                self.banner_variants = save_image_derivatives(self.banner, 'manufacturers/banners/')
+            except Image.DecompressionBombError:
+                raise image_too_large()
+            self.banner_placeholder = compute_placeholder(self.banner)
+        self.refresh_media_urls()
         super().save(*args, **kwargs)
+        self.snapshot_media()
 
     def __str__(self):
         return self.name
@@ -128,7 +282,97 @@ class Distributor(models.Model):
         if not self.email and not self.phone:
             raise ValidationError('At least one contact method (email/phone) is required')
 
-class Product(models.Model):
+def taxonomy_key(name):
+    """Spelling-insensitive form of a category or brand name: casefolded words, & as 'and'"""
+    return ' '.join(re.findall(r'\w+', (name or '').casefold().replace('&', ' and ')))
+
+class TaxonomyTerm(models.Model):
+    """
+    A canonical category or brand name
+    
+    Products keep the text they were entered with and point at the term that
+    text resolves to. Every spelling that resolves to a term is one of its
+    aliases, keyed by taxonomy_key(), so "Toys & Games" and "toys and games"
+    share one term and an admin can map "Games/Toys" onto it as well.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    
+    class Meta:
+        abstract = True
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+    
+    @classmethod
+    def alias_model(cls):
+        return cls._meta.get_field('aliases').related_model
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # A term's own spelling always resolves to it
+        self.alias_model().objects.get_or_create(key=taxonomy_key(self.name), defaults={'term': self})
+    
+    @classmethod
+    def resolve(cls, name):
+        """
+        Id of the term a spelling resolves to, creating the term if none does
+        
+        Returns:
+            The term id, or None for a blank name
+        """
+        key = taxonomy_key(name)
+        if not key:
+            return None
+        aliases = cls.alias_model().objects
+        term_id = aliases.filter(key=key).values_list('term_id', flat=True).first()
+        if term_id is None:
+            try:
+                with transaction.atomic():
+                    term, _ = cls.objects.get_or_create(name=name.strip()[:100])
+                    term_id = aliases.get_or_create(key=key, defaults={'term': term})[0].term_id
+            except IntegrityError:
+                # Created by a concurrent request
+                term_id = aliases.filter(key=key).values_list('term_id', flat=True).get()
+        return term_id
+
+class TaxonomyAlias(models.Model):
+    """A spelling that resolves to a term; admins may type it any way, it is stored as its key"""
+    key = models.CharField(max_length=100, unique=True, help_text="Any spelling; stored as taxonomy_key()")
+    
+    class Meta:
+        abstract = True
+    
+    def __str__(self):
+        return self.key
+    
+    def save(self, *args, **kwargs):
+        self.key = taxonomy_key(self.key)
+        super().save(*args, **kwargs)
+
+class Category(TaxonomyTerm):
+    class Meta(TaxonomyTerm.Meta):
+        verbose_name_plural = 'categories'
+
+class CategoryAlias(TaxonomyAlias):
+    term = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='aliases')
+    
+    class Meta(TaxonomyAlias.Meta):
+        verbose_name_plural = 'category aliases'
+
+class Brand(TaxonomyTerm):
+    pass
+
+class BrandAlias(TaxonomyAlias):
+    term = models.ForeignKey(Brand, on_delete=models.CASCADE, related_name='aliases')
+    
+    class Meta(TaxonomyAlias.Meta):
+        verbose_name_plural = 'brand aliases'
+
+class Product(MediaFieldsMixin, models.Model):
+    media_fields = ('flicks',)
+    url_fields = ('flicks', 'flicks_poster')
+    
     GENDER_CHOICES=[
         ('M','Male'),
         ('F','Female'),
@@ -162,6 +406,13 @@ class Product(models.Model):
     
     brand=models.CharField(max_length=100)
     gender=models.CharField(max_length=1,choices=GENDER_CHOICES,default='U')
+    # Resolved from product_category and brand on save; filters and facets use these
+    category_ref = models.ForeignKey(
+        Category, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='products'
+    )
+    brand_ref = models.ForeignKey(
+        Brand, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='products'
+    )
     description=models.TextField()
     flicks = models.FileField(
         upload_to='products/flicks/', 
@@ -175,6 +426,63 @@ class Product(models.Model):
         blank=True,
         help_text="Duration of the video in seconds"
     )
+    video_codec = models.CharField(
+        max_length=32,
+        blank=True,
+        editable=False,
+        help_text="Codec of the stored video, as reported by ffprobe"
+    )
+    video_height = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Height of the stored video in pixels"
+    )
+    video_processed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="When the video was last re-encoded; empty if it never was"
+    )
+    flicks_poster = models.ImageField(
+        upload_to='products/flicks/posters/',
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Still frame shown before the flick plays"
+    )
+    flicks_placeholder = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        help_text="BlurHash of the flick poster, painted while the video loads"
+    )
+    media_urls = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Public URLs of the media and its derivatives, resolved when the media changes"
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        help_text="Weighted full-text vector, maintained by products.search.postgres"
+    )
+    # Validates conditional GETs of product_detail; bulk update() calls must set it themselves
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination seeks on (sort field, id); see products.pagination
+            models.Index(fields=['title', 'id']),
+            models.Index(fields=['brand', 'id']),
+            models.Index(fields=['product_category', 'id']),
+            # filter_products: every combination of its filters is a prefix
+            # of one of these, and the first also covers the facet GROUP BY
+            models.Index(fields=['category_ref', 'gender', 'standardized_age', 'id']),
+            models.Index(fields=['gender', 'standardized_age', 'id']),
+            models.Index(fields=['standardized_age', 'category_ref', 'id']),
+        ]
 
     def primary_image(self):
         """Get primary image from the ProductImage model"""
@@ -209,18 +517,54 @@ class Product(models.Model):
         """Get all videos from gallery"""
         return self.gallery.filter(media_type='video')
 
+    def process_media(self):
+        """Re-encode the flick and grab its poster"""
+        processed, metadata = encode_video(self.flicks)
+        self.hold_processed_media(processed, metadata)
+        self.flicks = processed
+        self.apply_video_metadata(metadata)
+        poster = extract_video_poster(self.flicks)
+        if poster:
+            self.flicks_poster = poster
+            self.flicks_placeholder = compute_placeholder(poster)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_taxonomy = (instance.__dict__.get('product_category'), instance.__dict__.get('brand'))
+        return instance
+
+    def resolve_taxonomy(self):
+        """Point category_ref and brand_ref at the terms product_category and brand resolve to"""
+        loaded = getattr(self, '_loaded_taxonomy', (None, None))
+        if self.category_ref_id is None or self.product_category != loaded[0]:
+            self.category_ref_id = Category.resolve(self.product_category)
+        if self.brand_ref_id is None or self.brand != loaded[1]:
+            self.brand_ref_id = Brand.resolve(self.brand)
+        self._loaded_taxonomy = (self.product_category, self.brand)
+
     def save(self, *args, **kwargs):
-        if self.flicks and hasattr(self.flicks, 'file') and not kwargs.pop('no_process', False):
-            self.flicks, duration = process_video(self.flicks)
-            if duration:
-                self.video_duration = duration
+        no_process = kwargs.pop('no_process', False)
+        try:
+            if self.media_changed('flicks') and not no_process:
+                self.process_media()
+            # Commits new media to storage
+            self.refresh_media_urls()
+        finally:
+            self.release_processed_media()
+        self.resolve_taxonomy()
         super().save(*args, **kwargs)
+        self.snapshot_media()
 
     def __str__(self):
         return self.title
 
-class ProductGallery(models.Model):
+class ProductGallery(MediaFieldsMixin, models.Model):
     """Gallery items for product (images and videos)"""
+    media_fields = ('image', 'video')
+    url_fields = ('image', 'video', 'poster')
+    variant_fields = {'image_variants': 'srcset'}
+    
     MEDIA_TYPE_CHOICES = [
         ('image', 'Image'),
         ('video', 'Video'),
@@ -243,6 +587,12 @@ class ProductGallery(models.Model):
         blank=True,
         help_text="Upload a product image (JPG, PNG, GIF, WEBP, max 5MB)"
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Responsive WebP/AVIF derivatives of the image, keyed by format and width"
+    )
     video = models.FileField(
         upload_to='products/videos/',
         validators=[validate_video],
@@ -250,20 +600,62 @@ class ProductGallery(models.Model):
         blank=True,
         help_text="Upload a product video (MP4, MOV, AVI, WMV, FLV or WebM, max 10MB)"
     )
+    poster = models.ImageField(
+        upload_to='products/posters/',
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Still frame shown before the video plays"
+    )
+    placeholder = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        help_text="BlurHash of the image or video poster, painted while the media loads"
+    )
+    media_urls = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Public URLs of the media and its derivatives, resolved when the media changes"
+    )
     video_duration = models.PositiveIntegerField(
         null=True, 
         blank=True,
         help_text="Duration of the video in seconds"
     )
+    video_codec = models.CharField(
+        max_length=32,
+        blank=True,
+        editable=False,
+        help_text="Codec of the stored video, as reported by ffprobe"
+    )
+    video_height = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Height of the stored video in pixels"
+    )
+    video_processed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="When the video was last re-encoded; empty if it never was"
+    )
     is_primary = models.BooleanField(default=False)
     alt_text = models.CharField(max_length=100, blank=True)
     display_order = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-is_primary', 'display_order', 'created_at']
         verbose_name = 'Product Gallery Item'
         verbose_name_plural = 'Product Gallery'
+        indexes = [
+            # Primary image lookup per product
+            models.Index(fields=['product', 'media_type', 'is_primary']),
+        ]
     
     def __str__(self):
         media_type_str = 'Video' if self.media_type == 'video' else 'Image'
@@ -285,28 +677,64 @@ class ProductGallery(models.Model):
             # If switching from image to video, clear image field
             self.image = None
     
-    def save(self, *args, **kwargs):
+    def process_media(self):
+        """
+        Run the media pipeline on the current image or video
+        
+        Animated GIFs become a looping video with a poster, images are
+        cropped and get derivatives, videos are re-encoded and get a poster.
+        Called by save() for new media, and by background jobs for rows
+        inserted in bulk.
+        """
+        converted = False
+        
+        # Store animated GIFs as a looping video with a poster frame
+        if self.media_type == 'image' and self.image and is_animated_gif(self.image):
+            result = convert_gif_to_video(self.image)
+            if result:
+                self.video, self.poster, self.video_duration = result
+                self.video_codec = 'vp9' if self.video.name.endswith('.webm') else 'h264'
+                self.video_processed_at = timezone.now()
+                self.media_type = 'video'
+                self.image = None
+                self.image_variants = {}
+                self.placeholder = compute_placeholder(self.poster)
+                converted = True
+        
         # Process image if provided
-        if self.media_type == 'image' and self.image and hasattr(self.image, 'file') and not kwargs.pop('no_process', False):
-            self.image = process_product_image(self.image)
+        if self.media_type == 'image' and self.image:
+            try:
+                self.image = process_product_image(self.image)
+                self.image_variants = save_image_derivatives(self.image, 'products/photos/')
+            except Image.DecompressionBombError:
+                raise image_too_large()
+            self.placeholder = compute_placeholder(self.image)
         
         # Process video if provided
-        if self.media_type == 'video' and self.video and hasattr(self.video, 'file') and not kwargs.pop('no_process', False):
+        if self.media_type == 'video' and self.video and not converted:
             try:
-                result = process_video(self.video)
-                
-                # Make sure we have a tuple of length 2
-                if isinstance(result, tuple) and len(result) == 2:
-                    processed_video, duration = result
-                    self.video = processed_video
-                    if duration is not None:
-                        self.video_duration = duration
-                else:
-                    # Log unexpected result format
-                    print(f"Warning: process_video returned unexpected format: {result}")
+                processed, metadata = encode_video(self.video)
+                self.hold_processed_media(processed, metadata)
+                self.video = processed
+                self.apply_video_metadata(metadata)
+                poster = extract_video_poster(self.video)
+                if poster:
+                    self.poster = poster
+                    self.placeholder = compute_placeholder(poster)
             except Exception as e:
                 # Log exception
                 print(f"Error while processing video in ProductGallery: {str(e)}")
+    
+    def save(self, *args, **kwargs):
+        no_process = kwargs.pop('no_process', False)
+        
+        try:
+            if self.media_changed(self.media_type) and not no_process:
+                self.process_media()
+            # Commits new media to storage
+            self.refresh_media_urls()
+        finally:
+            self.release_processed_media()
         
         # Handle primary flag (ensure only one primary media per product)
         if self.is_primary:
@@ -315,7 +743,7 @@ class ProductGallery(models.Model):
                 product=self.product, 
                 media_type=self.media_type,
                 is_primary=True
-            ).exclude(pk=self.pk).update(is_primary=False)
+            ).exclude(pk=self.pk).update(is_primary=False, updated_at=timezone.now())
         
         # Make first gallery item primary by default
         if not self.pk and not ProductGallery.objects.filter(
@@ -325,8 +753,13 @@ class ProductGallery(models.Model):
             self.is_primary = True
             
         super().save(*args, **kwargs)
+        self.snapshot_media()
 
-class Shop(models.Model):
+class Shop(MediaFieldsMixin, models.Model):
+    media_fields = ('banner',)
+    url_fields = ('banner',)
+    variant_fields = {'banner_variants': 'banner_srcset'}
+    
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     address = models.TextField()
@@ -339,6 +772,24 @@ class Shop(models.Model):
         validators=[validate_image],
         help_text="Upload a banner image (JPG, PNG, GIF, WEBP, max 5MB)"
     )
+    banner_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Responsive WebP/AVIF derivatives of the banner, keyed by format and width"
+    )
+    banner_placeholder = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        help_text="BlurHash of the banner, painted while the image loads"
+    )
+    media_urls = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Public URLs of the media and its derivatives, resolved when the media changes"
+    )
     owner = models.ForeignKey(
         ShopUser,
         on_delete=models.CASCADE,
@@ -352,9 +803,17 @@ class Shop(models.Model):
     )
     
     def save(self, *args, **kwargs):
-        if self.banner and hasattr(self.banner, 'file') and not kwargs.pop('no_process', False):
-            self.banner = process_banner_image(self.banner)
+        no_process = kwargs.pop('no_process', False)
+        if self.media_changed('banner') and not no_process:
+            try:
+                self.banner = process_banner_image(self.banner)
+                self.banner_variants = save_image_derivatives(self.banner, 'shops/banners/')
+            except Image.DecompressionBombError:
+                raise image_too_large()
+            self.banner_placeholder = compute_placeholder(self.banner)
+        self.refresh_media_urls()
         super().save(*args, **kwargs)
+        self.snapshot_media()
 
     def __str__(self):
         return self.name
@@ -397,6 +856,7 @@ class FeaturedProduct(models.Model):
         choices=FEATURED_TYPE_CHOICES
     )
     display_order = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['featured_type', 'display_order']
@@ -441,3 +901,93 @@ class ViewSession(models.Model):
     
     def __str__(self):
         return f"Session {self.id} for {self.product.title}"
+
+
+class UploadSession(models.Model):
+    """Resumable (tus-style) upload of a large video, assembled chunk by chunk"""
+    FLICKS = 'flicks'
+    GALLERY = 'gallery'
+    TARGET_CHOICES = [
+        (FLICKS, 'Product flick'),
+        (GALLERY, 'Gallery video'),
+    ]
+    
+    UPLOADING = 'uploading'
+    PROCESSING = 'processing'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (UPLOADING, 'Uploading'),
+        (PROCESSING, 'Processing'),
+        (COMPLETE, 'Complete'),
+        (FAILED, 'Failed'),
+    ]
+    
+    LOCAL = 'local'
+    S3 = 's3'
+    BACKEND_CHOICES = [
+        (LOCAL, 'Local disk'),
+        (S3, 'S3 multipart'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(ShopUser, on_delete=models.SET_NULL, null=True, blank=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='upload_sessions')
+    target = models.CharField(max_length=10, choices=TARGET_CHOICES, default=FLICKS)
+    filename = models.CharField(max_length=255)
+    length = models.PositiveBigIntegerField(help_text="Total size of the upload in bytes")
+    offset = models.PositiveBigIntegerField(default=0, help_text="Bytes received so far")
+    backend = models.CharField(max_length=5, choices=BACKEND_CHOICES, default=LOCAL)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=UPLOADING)
+    container = models.CharField(max_length=10, blank=True, help_text="Container detected from the header")
+    storage_name = models.CharField(max_length=255, blank=True, help_text="Storage name of the assembled S3 object")
+    s3_upload_id = models.CharField(max_length=255, blank=True)
+    parts = models.JSONField(default=list, blank=True)  # [{'PartNumber': n, 'ETag': '...'}]
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Upload {self.id} of {self.filename} ({self.offset}/{self.length})"
+
+
+class UploadIntent(models.Model):
+    """Presigned direct-to-storage upload, confirmed by a completion callback"""
+    FLICKS = 'flicks'
+    GALLERY_IMAGE = 'gallery_image'
+    GALLERY_VIDEO = 'gallery_video'
+    SHOP_BANNER = 'shop_banner'
+    MANUFACTURER_BANNER = 'manufacturer_banner'
+    TARGET_CHOICES = [
+        (FLICKS, 'Product flick'),
+        (GALLERY_IMAGE, 'Gallery image'),
+        (GALLERY_VIDEO, 'Gallery video'),
+        (SHOP_BANNER, 'Shop banner'),
+        (MANUFACTURER_BANNER, 'Manufacturer banner'),
+    ]
+    
+    PENDING = 'pending'
+    UPLOADED = 'uploaded'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Waiting for upload'),
+        (UPLOADED, 'Uploaded, processing'),
+        (COMPLETE, 'Complete'),
+        (FAILED, 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(ShopUser, on_delete=models.SET_NULL, null=True, blank=True)
+    target = models.CharField(max_length=20, choices=TARGET_CHOICES)
+    object_id = models.PositiveBigIntegerField(help_text="Product, shop or manufacturer the upload belongs to")
+    storage_name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField(help_text="Declared size in bytes")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    error = models.TextField(blank=True)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.get_target_display()} upload {self.id} ({self.status})"
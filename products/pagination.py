@@ -0,0 +1,155 @@
+"""
+Keyset (cursor) pagination and cheap counts for product listings
+
+Offset pagination makes the database walk and discard every row before the
+page, so page 10,000 costs 10,000 pages of work. A keyset page instead
+filters on the sort key of the last row already seen, which the (field, id)
+ordering lets an index seek to directly. The cursor handed to clients is
+that sort key, base64-encoded JSON, and is opaque to them.
+"""
+import base64
+import binascii
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+
+# Sort keys clients may pick, each ending in id so every row has a unique key
+PRODUCT_SORTS = {
+    'id': ('id',),
+    '-id': ('-id',),
+    'title': ('title', 'id'),
+    '-title': ('-title', '-id'),
+    # The product's own text, which the (field, id) indexes serve; listings
+    # display the canonical term name, which a join can't seek by
+    'brand': ('brand', 'id'),
+    '-brand': ('-brand', '-id'),
+    'category': ('product_category', 'id'),
+    '-category': ('-product_category', '-id'),
+}
+
+
+class InvalidCursor(ValueError):
+    """A cursor that was not produced by encode_cursor for this ordering"""
+
+
+def encode_cursor(ordering, values):
+    data = json.dumps({'o': list(ordering), 'v': values}, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, ordering):
+    """
+    Sort key values from a cursor
+
+    Raises:
+        InvalidCursor: if the cursor is malformed or was made for another ordering
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        values = data['v']
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise InvalidCursor('Malformed cursor')
+    if data.get('o') != list(ordering) or not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidCursor('Cursor does not match the requested sort')
+    return values
+
+
+def after(ordering, values):
+    """
+    Filter for rows strictly after the given sort key
+
+    Expands the row comparison (a, b) > (x, y) to a > x OR (a = x AND b > y),
+    with < for descending fields, behind a redundant a >= x that lets the
+    planner turn the OR into one index range scan.
+    """
+    query = None
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        step = equal & Q(**{f'{name}__{lookup}': value})
+        query = step if query is None else query | step
+        equal &= Q(**{name: value})
+    first = ordering[0]
+    lookup = 'lte' if first.startswith('-') else 'gte'
+    return Q(**{f'{first.lstrip("-")}__{lookup}': values[0]}) & query
+
+
+def page_size_param(request, default=DEFAULT_PAGE_SIZE):
+    """page_size query parameter, clamped to 1..MAX_PAGE_SIZE"""
+    try:
+        page_size = int(request.query_params.get('page_size', default))
+    except ValueError:
+        page_size = default
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def paginate(queryset, ordering, page_size, cursor=None, offset=0):
+    """
+    One page of a queryset in keyset order
+
+    Args:
+        queryset: Rows to page through; may be annotated with sort fields
+        ordering: Field names (with '-' for descending), ending in a unique field
+        page_size: Rows per page
+        cursor: next_cursor of the previous page, or None for the first page
+        offset: Rows to skip instead of a cursor, for legacy page numbers
+    Returns:
+        (rows, next_cursor), next_cursor being None on the last page
+    Raises:
+        InvalidCursor: if the cursor is malformed
+    """
+    if cursor:
+        queryset = queryset.filter(after(ordering, decode_cursor(cursor, ordering)))
+        offset = 0
+    # One extra row tells whether another page follows without a count
+    rows = list(queryset.order_by(*ordering)[offset:offset + page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, encode_cursor(ordering, [getattr(last, field.lstrip('-')) for field in ordering])
+
+
+def estimated_count(queryset, filters, limit=None):
+    """
+    Row count that is cheap to produce on every request
+
+    Unfiltered listings on PostgreSQL use the planner's reltuples estimate
+    from pg_class, which costs nothing however large the table is. Anything
+    else is counted once per filter combination and cached for
+    PRODUCT_COUNT_CACHE_SECONDS, so totals may lag new products by that long.
+
+    Args:
+        queryset: The filtered rows to count
+        filters: Dict of the filter parameters that produced the queryset
+        limit: Stop counting at this many rows, so a broad match costs no
+            more than a page of limit rows; None counts them all
+    """
+    model = queryset.model
+    if not filters and limit is None and connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        # -1 until the table is first analyzed
+        if row and row[0] >= 0:
+            return row[0]
+
+    digest = hashlib.sha1(json.dumps([filters, limit], sort_keys=True).encode('utf-8')).hexdigest()
+    key = f'count:{model._meta.label_lower}:{digest}'
+    count = cache.get(key)
+    if count is None:
+        # A sliced count is SELECT COUNT(*) over a LIMIT subquery
+        count = queryset.order_by()[:limit].count() if limit else queryset.count()
+        cache.set(key, count, getattr(settings, 'PRODUCT_COUNT_CACHE_SECONDS', 300))
+    return count
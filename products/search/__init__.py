@@ -0,0 +1,44 @@
+"""
+Product search
+
+SEARCH_BACKEND picks how search_products finds matches:
+
+  postgres  weighted tsvector and trigram matching in PostgreSQL (postgres.py)
+  memory    BM25 over an in-process inverted index (memory.py)
+  database  substring matching that works on any database
+  auto      postgres on PostgreSQL, database elsewhere (the default)
+
+A dotted path to a SearchBackend subclass is accepted as well.
+
+Backends count matches only up to SEARCH_COUNT_LIMIT, so a broad query
+such as "to" costs the same as a narrow one.
+
+Typeahead suggestions do not go through a backend; see suggest.py.
+"""
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+BACKENDS = {
+    'postgres': 'products.search.backends.PostgresSearchBackend',
+    'memory': 'products.search.memory.MemorySearchBackend',
+    'database': 'products.search.backends.DatabaseSearchBackend',
+}
+
+_backends = {}
+
+
+def get_backend():
+    """The configured SearchBackend instance, shared within the process"""
+    name = getattr(settings, 'SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        name = 'postgres' if connection.vendor == 'postgresql' else 'database'
+    path = BACKENDS.get(name, name)
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
+
+
+def count_limit():
+    """Most matches a backend counts; a count at the limit means at least that many"""
+    return getattr(settings, 'SEARCH_COUNT_LIMIT', 1000)
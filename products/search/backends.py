@@ -0,0 +1,93 @@
+"""
+Search backends: find the products matching a query, a page at a time
+
+A backend is selected with the SEARCH_BACKEND setting (see get_backend in
+this package). All backends page with the same opaque cursors as the
+product listings and return model instances, so the search view does not
+care which one answered.
+"""
+from django.db.models import Case, IntegerField, Q, Value, When
+from products.pagination import estimated_count, paginate
+from . import count_limit, postgres
+
+
+class SearchBackend:
+    """Base class; subclasses implement search()"""
+
+    def search(self, query, products, page_size, cursor=None, offset=0):
+        """
+        One page of products matching a query, best first
+
+        Args:
+            query: Raw search text
+            products: Product queryset to draw rows from, already eager-loaded
+            page_size: Rows per page
+            cursor: next_cursor of the previous page, or None
+            offset: Rows to skip instead of a cursor, for legacy page numbers
+        Returns:
+            (rows, next_cursor, count), count stopping at count_limit()
+        Raises:
+            InvalidCursor: if the cursor is malformed
+        """
+        raise NotImplementedError
+
+    def cache_query(self, query):
+        """
+        The query as the result cache keys it
+
+        Queries given the same text here must match the same products in
+        the same order. Case and spacing never matter to a backend; word
+        order and operators (quotes, -word, or) may.
+        """
+        return ' '.join(query.casefold().split())
+
+
+class QuerysetSearchBackend(SearchBackend):
+    """Backends that express the match and its ranking as a queryset"""
+    ordering = None
+
+    def matching(self, products, query):
+        """products narrowed to matches and annotated with the ordering's fields"""
+        raise NotImplementedError
+
+    def search(self, query, products, page_size, cursor=None, offset=0):
+        matches = self.matching(products, query)
+        rows, next_cursor = paginate(matches, self.ordering, page_size, cursor=cursor, offset=offset)
+        return rows, next_cursor, estimated_count(matches, {'q': query}, limit=count_limit())
+
+
+class DatabaseSearchBackend(QuerysetSearchBackend):
+    """
+    Substring matching on any database
+
+    Every clause is a substring scan, so it reads the whole table. Ranking
+    and paging happen in SQL, so only one page of rows is ever loaded.
+    """
+    ordering = ('title_match', 'id')
+
+    def matching(self, products, query):
+        q_objects = Q()
+        for word in query.split():
+            q_objects |= Q(title__icontains=word)
+            q_objects |= Q(description__icontains=word)
+            q_objects |= Q(brand__icontains=word)
+            q_objects |= Q(product_category__icontains=word)
+            q_objects |= Q(age_group__icontains=word)
+            q_objects |= Q(manufacturer__name__icontains=word)
+
+        # Title matches first, then the rest, each in id order
+        return products.filter(q_objects).distinct().annotate(
+            title_match=Case(
+                When(title__icontains=query, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+        )
+
+
+class PostgresSearchBackend(QuerysetSearchBackend):
+    """Weighted tsvector and title trigram matching; see postgres.py"""
+    ordering = ('-rank', 'id')
+
+    def matching(self, products, query):
+        return postgres.full_text_search(query, products)
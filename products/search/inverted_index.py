@@ -0,0 +1,160 @@
+"""
+In-memory inverted index with BM25 ranking and prefix matching
+
+Postings are kept per term in two parallel typed arrays (document ordinals
+and term frequencies), a few bytes per posting instead of a Python object
+each. Documents get a new ordinal every time they are (re)indexed; the old
+one is tombstoned, so updates are appends and postings stay sorted.
+Tombstones are skipped at query time and dropped by rebuilding once they
+make up too much of the index.
+
+Nothing here depends on Django.
+"""
+import heapq
+import math
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Score multiplier for a term that only starts with the query token
+PREFIX_WEIGHT = 0.5
+# Most vocabulary terms one query token may expand to
+MAX_PREFIX_EXPANSIONS = 64
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.casefold()) if text else []
+
+
+class InvertedIndex:
+    """
+    Documents are lists of (text, weight) fields, searched with BM25
+
+    A field's weight multiplies the frequency of its tokens, so a title
+    word with weight 3 counts like three occurrences in a weight-1 field.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        # term -> (ordinals, weighted term frequencies)
+        self.postings = {}
+        self.doc_ids = array('q')
+        self.doc_lengths = array('I')
+        self.live = bytearray()
+        self.ordinals = {}
+        self.total_length = 0
+        self._vocabulary = None
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    @property
+    def dead_ratio(self):
+        """Share of indexed ordinals that are tombstones"""
+        return 1 - len(self.ordinals) / len(self.doc_ids) if self.doc_ids else 0.0
+
+    def add(self, doc_id, fields):
+        """Index a document, replacing any earlier version of it"""
+        self.remove(doc_id)
+        counts = Counter()
+        for text, weight in fields:
+            for token in tokenize(text):
+                counts[token] += weight
+
+        ordinal = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        length = sum(counts.values())
+        self.doc_lengths.append(length)
+        self.live.append(1)
+        self.ordinals[doc_id] = ordinal
+        self.total_length += length
+
+        for term, frequency in counts.items():
+            entry = self.postings.get(term)
+            if entry is None:
+                entry = self.postings[term] = (array('I'), array('H'))
+                self._vocabulary = None
+            entry[0].append(ordinal)
+            entry[1].append(min(frequency, 0xFFFF))
+
+    def remove(self, doc_id):
+        ordinal = self.ordinals.pop(doc_id, None)
+        if ordinal is not None:
+            self.live[ordinal] = 0
+            self.total_length -= self.doc_lengths[ordinal]
+
+    def _expand(self, token):
+        """(term, weight) pairs a query token matches: itself, then terms it prefixes"""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        vocabulary = self._vocabulary
+        matches = []
+        position = bisect_left(vocabulary, token)
+        while position < len(vocabulary) and len(matches) < MAX_PREFIX_EXPANSIONS:
+            term = vocabulary[position]
+            if not term.startswith(token):
+                break
+            matches.append((term, 1.0 if term == token else PREFIX_WEIGHT))
+            position += 1
+        return matches
+
+    def scores(self, query, prefix=True):
+        """
+        BM25 score of every live document matching any query token
+
+        Document frequencies count tombstoned postings too, which slightly
+        understates idf until the next rebuild.
+
+        Returns:
+            Dict of document id to score
+        """
+        live_count = len(self.ordinals)
+        if not live_count:
+            return {}
+        average_length = self.total_length / live_count
+        k1, b = self.k1, self.b
+        live, lengths = self.live, self.doc_lengths
+
+        totals = {}
+        for token in set(tokenize(query)):
+            terms = self._expand(token) if prefix else [(token, 1.0)]
+            for term, weight in terms:
+                entry = self.postings.get(term)
+                if entry is None:
+                    continue
+                ordinals, frequencies = entry
+                idf = math.log(1 + (live_count - len(ordinals) + 0.5) / (len(ordinals) + 0.5))
+                for ordinal, frequency in zip(ordinals, frequencies):
+                    if not live[ordinal]:
+                        continue
+                    norm = k1 * (1 - b + b * lengths[ordinal] / average_length)
+                    score = weight * idf * frequency * (k1 + 1) / (frequency + norm)
+                    totals[ordinal] = totals.get(ordinal, 0.0) + score
+
+        doc_ids = self.doc_ids
+        return {doc_ids[ordinal]: score for ordinal, score in totals.items()}
+
+    def search(self, query, limit, after=None, prefix=True):
+        """
+        Best matches in (score descending, id ascending) order
+
+        Args:
+            query: Raw search text
+            limit: Most results to return
+            after: (score, id) of the last result already seen, to continue from
+        Returns:
+            (results, total) where results is a list of (score, id) and total
+            is the number of matching documents
+        """
+        scores = self.scores(query, prefix=prefix)
+        total = len(scores)
+        candidates = ((-score, doc_id) for doc_id, score in scores.items())
+        if after is not None:
+            last = (-after[0], after[1])
+            candidates = (key for key in candidates if key > last)
+        best = heapq.nsmallest(limit, candidates)
+        return [(-score, doc_id) for score, doc_id in best], total
@@ -0,0 +1,192 @@
+"""
+Search backend over a per-process in-memory inverted index
+
+For deployments without PostgreSQL full-text search. The index is built
+from one pass over the product table the first time a process searches,
+then kept current by the Product and Manufacturer signal receivers below.
+Writes made by other processes only reach this one when the index is
+rebuilt, which happens after SEARCH_INDEX_MAX_AGE seconds.
+
+A rebuild runs in the request that finds the index stale, outside the
+lock; other requests keep searching the old index until the new one is
+swapped in. Writes that land during the build are replayed onto it first.
+"""
+import threading
+import time
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from products.models import Manufacturer, Product
+from products.pagination import decode_cursor, encode_cursor
+from . import count_limit
+from .backends import SearchBackend
+from .inverted_index import InvertedIndex, tokenize
+
+# Token frequency multiplier per product field
+FIELD_WEIGHTS = {
+    'title': 3,
+    'brand': 2,
+    'product_category': 2,
+    'manufacturer__name': 2,
+    'description': 1,
+}
+
+# Rebuild rather than keep skipping tombstones past this share of the index
+MAX_DEAD_RATIO = 0.25
+
+ORDERING = ('-rank', 'id')
+
+_lock = threading.Lock()
+# Held by the one request rebuilding the index
+_build_lock = threading.Lock()
+_state = {'index': None, 'built_at': 0.0, 'building': False, 'changed': set()}
+
+
+def product_fields(values):
+    """(text, weight) fields of a product from a values() row"""
+    return [(values[field], weight) for field, weight in FIELD_WEIGHTS.items()]
+
+
+def build_index():
+    """Index every product from a single streamed query"""
+    index = InvertedIndex()
+    rows = Product.objects.values('id', *FIELD_WEIGHTS).order_by()
+    for values in rows.iterator(chunk_size=2000):
+        index.add(values['id'], product_fields(values))
+    return index
+
+
+def _current():
+    """(index, whether it is due for a rebuild)"""
+    max_age = getattr(settings, 'SEARCH_INDEX_MAX_AGE', 300)
+    with _lock:
+        index = _state['index']
+        due = (
+            index is None or time.monotonic() - _state['built_at'] > max_age
+            or index.dead_ratio > MAX_DEAD_RATIO
+        )
+        return index, due
+
+
+def _apply(index, product_ids):
+    """Bring products changed during a build up to date in the new index"""
+    rows = Product.objects.filter(pk__in=product_ids).values('id', *FIELD_WEIGHTS)
+    found = set()
+    for values in rows:
+        index.add(values['id'], product_fields(values))
+        found.add(values['id'])
+    for product_id in set(product_ids) - found:
+        index.remove(product_id)
+
+
+def _rebuild():
+    with _lock:
+        _state['building'] = True
+        _state['changed'] = set()
+    try:
+        index = build_index()
+        while True:
+            with _lock:
+                changed = _state['changed']
+                if not changed:
+                    _state.update(index=index, built_at=time.monotonic())
+                    return index
+                _state['changed'] = set()
+            _apply(index, changed)
+    finally:
+        with _lock:
+            _state['building'] = False
+
+
+def get_index():
+    """This process's index, built on first use and rebuilt when stale"""
+    index, due = _current()
+    if not due:
+        return index
+    if index is None:
+        # Nothing to search yet: wait for whoever builds the first index
+        _build_lock.acquire()
+    elif not _build_lock.acquire(blocking=False):
+        # Another request is rebuilding; search the current index meanwhile
+        return index
+    try:
+        index, due = _current()
+        return _rebuild() if due else index
+    finally:
+        _build_lock.release()
+
+
+def reset_index():
+    """Drop this process's index; the next search rebuilds it"""
+    with _lock:
+        _state['index'] = None
+
+
+def reindex(products):
+    """Re-add products to the index, if this process has built one or is building it"""
+    with _lock:
+        if _state['index'] is None and not _state['building']:
+            return
+    rows = list(products.values('id', *FIELD_WEIGHTS))
+    with _lock:
+        if _state['building']:
+            _state['changed'].update(values['id'] for values in rows)
+        index = _state['index']
+        if index is not None:
+            for values in rows:
+                index.add(values['id'], product_fields(values))
+
+
+class MemorySearchBackend(SearchBackend):
+    """BM25 over the in-memory index, with query tokens also matching as prefixes"""
+
+    def cache_query(self, query):
+        # Only the tokens count: punctuation is dropped and their order doesn't rank
+        return ' '.join(sorted(tokenize(query)))
+
+    def search(self, query, products, page_size, cursor=None, offset=0):
+        after = None
+        if cursor:
+            after = decode_cursor(cursor, ORDERING)
+            offset = 0
+        results, total = get_index().search(query, offset + page_size + 1, after=after)
+        results = results[offset:]
+
+        next_cursor = None
+        if len(results) > page_size:
+            results = results[:page_size]
+            next_cursor = encode_cursor(ORDERING, list(results[-1]))
+        rows = products.in_bulk([doc_id for _, doc_id in results])
+        # Rows deleted since the index last heard are skipped
+        return [rows[doc_id] for _, doc_id in results if doc_id in rows], next_cursor, min(total, count_limit())
+
+
+def remove(product_id):
+    with _lock:
+        if _state['building']:
+            _state['changed'].add(product_id)
+        if _state['index'] is not None:
+            _state['index'].remove(product_id)
+
+
+# Applied on commit so a rolled-back write never reaches the index
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        pk = instance.pk
+        transaction.on_commit(lambda: reindex(Product.objects.filter(pk=pk)))
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: remove(pk))
+
+
+@receiver(post_save, sender=Manufacturer)
+def manufacturer_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        pk = instance.pk
+        transaction.on_commit(lambda: reindex(Product.objects.filter(manufacturer_id=pk)))
@@ -0,0 +1,113 @@
+"""
+PostgreSQL full-text search for products
+
+Each product stores a weighted tsvector of its title (A), brand, category
+and manufacturer name (B) and description (C), kept current by the signal
+receivers below and indexed with GIN. A trigram index on the title backs
+typo-tolerant matches for queries the tsvector misses.
+
+Everything here is a no-op on other databases.
+"""
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_migrate, post_save
+from django.dispatch import receiver
+from products.models import Manufacturer, Product
+
+# Index DDL run after migrate; the deploy generates migrations, so these are
+# kept out of model Meta where SQLite would reject the GIN syntax
+SEARCH_INDEXES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS products_product_search_vector_gin "
+    "ON products_product USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS products_product_title_trgm "
+    "ON products_product USING gin (title gin_trgm_ops)",
+]
+
+
+def is_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def search_config():
+    """Text search configuration (stemming and stop words) for vectors and queries"""
+    return getattr(settings, 'SEARCH_CONFIG', 'english')
+
+
+def product_search_vector():
+    """Weighted tsvector expression over a product's searchable fields"""
+    config = search_config()
+    manufacturer_name = Subquery(
+        Manufacturer.objects.filter(pk=OuterRef('manufacturer_id')).values('name')[:1]
+    )
+    return (
+        SearchVector('title', weight='A', config=config)
+        + SearchVector('brand', weight='B', config=config)
+        + SearchVector('product_category', weight='B', config=config)
+        + SearchVector(Coalesce(manufacturer_name, Value('')), weight='B', config=config)
+        + SearchVector('description', weight='C', config=config)
+    )
+
+
+def update_search_vectors(queryset):
+    """
+    Recompute the stored vector of every product in the queryset
+
+    Returns:
+        Number of products updated (0 off PostgreSQL)
+    """
+    if not is_postgres():
+        return 0
+    return queryset.update(search_vector=product_search_vector())
+
+
+def full_text_search(query, products=None):
+    """
+    Products matching a user query, annotated with a relevance rank
+
+    The query is parsed like a web search box (quoted phrases, -exclusions,
+    OR). Titles within trigram distance of the query also match, so a typo
+    in a product name still finds it; rank adds their similarity to ts_rank.
+
+    Args:
+        query: Raw search text
+        products: Product queryset to search within (default: all)
+    Returns:
+        Product queryset annotated with 'rank', to be ordered by ('-rank', 'id')
+    """
+    if products is None:
+        products = Product.objects.all()
+    search_query = SearchQuery(query, search_type='websearch', config=search_config())
+    return products.filter(
+        Q(search_vector=search_query) | Q(title__trigram_similar=query)
+    ).annotate(
+        rank=SearchRank(F('search_vector'), search_query) + TrigramSimilarity('title', query)
+    )
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        update_search_vectors(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Manufacturer)
+def manufacturer_saved(sender, instance, raw=False, **kwargs):
+    # The manufacturer name is part of every one of its products' vectors
+    if not raw:
+        update_search_vectors(instance.products.all())
+
+
+def create_search_indexes(using=DEFAULT_DB_ALIAS, **kwargs):
+    """post_migrate: add the GIN indexes and fill vectors for rows that have none"""
+    if connections[using].vendor != 'postgresql':
+        return
+    with connections[using].cursor() as cursor:
+        for statement in SEARCH_INDEXES:
+            cursor.execute(statement)
+    Product.objects.using(using).filter(search_vector__isnull=True).update(
+        search_vector=product_search_vector()
+    )
@@ -0,0 +1,214 @@
+"""
+Read-only prefix index for typeahead suggestions, stored as one flat buffer
+
+Every phrase (a product title, brand, category or manufacturer name) is
+indexed under each of its word suffixes, so "robot" finds "Wooden Robot
+Kit" too. The keys are kept sorted in a single byte blob, and a prefix
+query is a binary search for the range of keys that start with it.
+
+Suggestions are numbered best first (highest weight, then alphabetically),
+so the best suggestions in a range are simply its smallest ordinals. For
+prefixes matching more than PREFIX_SCAN_LIMIT keys, such as single
+letters, the TOP_K best ordinals are precomputed; any other prefix scans a
+range no larger than that. Either way a query touches a bounded number of
+keys, however large the catalog.
+
+The buffer holds nothing but typed arrays and UTF-8 blobs, so it can be
+written to a file and memory-mapped by several processes, which then share
+one copy in the page cache. Arrays use native byte order; a snapshot is
+only meant to be read on the machine that wrote it.
+
+Nothing here depends on Django.
+"""
+import heapq
+import struct
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from .inverted_index import tokenize
+
+MAGIC = b'FLKSUG01'
+HEADER = struct.Struct('=8sdI')
+SECTION = struct.Struct('=QQ')
+
+KINDS = ('product', 'brand', 'category', 'manufacturer')
+
+# Ranges with more keys than this get their best suggestions precomputed
+PREFIX_SCAN_LIMIT = 256
+# Suggestions kept per precomputed prefix
+TOP_K = 20
+# Words of a phrase that start a key; later words are only matched in sequence
+MAX_KEY_WORDS = 8
+
+NO_SUGGESTION = 0xFFFFFFFF
+
+Suggestion = namedtuple('Suggestion', 'text kind product_id weight')
+
+
+def normalize(text):
+    """Casefolded words of text joined by single spaces"""
+    return ' '.join(tokenize(text))
+
+
+def phrase_keys(text):
+    """Keys a phrase is indexed under: each of its word suffixes"""
+    words = tokenize(text)
+    return {' '.join(words[i:]) for i in range(min(len(words), MAX_KEY_WORDS))}
+
+
+def rank(suggestion):
+    return (-suggestion.weight, suggestion.text.casefold(), suggestion.kind, suggestion.product_id)
+
+
+def _strings(values):
+    """(offsets array, UTF-8 blob) of a list of byte strings"""
+    offsets = array('I', [0])
+    for value in values:
+        offsets.append(offsets[-1] + len(value))
+    return offsets, b''.join(values)
+
+
+def _best(ordinals):
+    return heapq.nsmallest(TOP_K, set(ordinals))
+
+
+def _large_prefixes(keys, targets):
+    """(prefix, best ordinals) of every key prefix matching more than PREFIX_SCAN_LIMIT keys"""
+    found = []
+    # Ranges whose keys share their first `depth` bytes
+    stack = [(0, len(keys), 0)]
+    while stack:
+        lo, hi, depth = stack.pop()
+        i = lo
+        while i < hi:
+            if len(keys[i]) <= depth:
+                i += 1
+                continue
+            prefix = keys[i][:depth + 1]
+            # UTF-8 never contains 0xff, so this sorts after every key with the prefix
+            j = bisect_left(keys, prefix + b'\xff', i, hi)
+            if j - i > PREFIX_SCAN_LIMIT:
+                found.append((prefix, _best(targets[i:j])))
+                stack.append((i, j, depth + 1))
+            i = j
+    found.sort()
+    return found
+
+
+def build_snapshot(suggestions, built_at):
+    """
+    Serialize suggestions into a buffer PrefixIndex can read
+
+    Args:
+        suggestions: Iterable of Suggestion; kind is one of KINDS and
+            product_id is 0 for anything that is not a single product
+        built_at: Unix time the data was read, stored for staleness checks
+    Returns:
+        bytes
+    """
+    suggestions = sorted(suggestions, key=rank)
+    entries = sorted(
+        (key.encode('utf-8'), ordinal)
+        for ordinal, suggestion in enumerate(suggestions)
+        for key in phrase_keys(suggestion.text)
+    )
+    keys = [key for key, _ in entries]
+    targets = array('I', (ordinal for _, ordinal in entries))
+    key_offsets, key_blob = _strings(keys)
+    text_offsets, text_blob = _strings([s.text.encode('utf-8') for s in suggestions])
+
+    prefixes = _large_prefixes(keys, targets)
+    prefix_offsets, prefix_blob = _strings([prefix for prefix, _ in prefixes])
+    prefix_top = array('I')
+    for _, best in prefixes:
+        prefix_top.extend(best + [NO_SUGGESTION] * (TOP_K - len(best)))
+
+    sections = [
+        key_offsets.tobytes(), key_blob, targets.tobytes(),
+        text_offsets.tobytes(), text_blob,
+        bytes(KINDS.index(s.kind) for s in suggestions),
+        array('q', (s.product_id for s in suggestions)).tobytes(),
+        array('q', (s.weight for s in suggestions)).tobytes(),
+        prefix_offsets.tobytes(), prefix_blob, prefix_top.tobytes(),
+    ]
+    header_size = HEADER.size + SECTION.size * len(sections)
+    table, body, offset = [], [], header_size
+    for section in sections:
+        # 8-byte alignment for the typed arrays
+        padding = -offset % 8
+        body.append(b'\0' * padding + section)
+        offset += padding
+        table.append(SECTION.pack(offset, len(section)))
+        offset += len(section)
+    return HEADER.pack(MAGIC, built_at, len(sections)) + b''.join(table) + b''.join(body)
+
+
+class _Strings:
+    """Sequence of byte strings over an offsets array and a blob, for bisect"""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+
+class PrefixIndex:
+    """
+    Suggestions matching a typed prefix, read from a build_snapshot buffer
+
+    The buffer may be bytes or an mmap; it is read in place, never copied.
+    """
+
+    def __init__(self, buffer):
+        view = memoryview(buffer)
+        magic, self.built_at, count = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError('Not a suggestion index snapshot')
+        sections = []
+        for i in range(count):
+            offset, length = SECTION.unpack_from(view, HEADER.size + i * SECTION.size)
+            sections.append(view[offset:offset + length])
+        (key_offsets, key_blob, targets, text_offsets, text_blob, kinds,
+         product_ids, weights, prefix_offsets, prefix_blob, prefix_top) = sections
+        self.keys = _Strings(key_offsets.cast('I'), key_blob)
+        self.targets = targets.cast('I')
+        self.texts = _Strings(text_offsets.cast('I'), text_blob)
+        self.kinds = kinds
+        self.product_ids = product_ids.cast('q')
+        self.weights = weights.cast('q')
+        self.prefixes = _Strings(prefix_offsets.cast('I'), prefix_blob)
+        self.prefix_top = prefix_top.cast('I')
+
+    def __len__(self):
+        return len(self.texts)
+
+    def suggestion(self, ordinal):
+        return Suggestion(
+            self.texts[ordinal].decode('utf-8'), KINDS[self.kinds[ordinal]],
+            self.product_ids[ordinal], self.weights[ordinal]
+        )
+
+    def suggest(self, query, limit=TOP_K):
+        """
+        Best suggestions with a key starting with the normalized query
+
+        Returns:
+            Up to min(limit, TOP_K) Suggestion, best first
+        """
+        prefix = normalize(query).encode('utf-8')
+        if not prefix:
+            return []
+        limit = min(limit, TOP_K)
+        i = bisect_left(self.prefixes, prefix)
+        if i < len(self.prefixes) and self.prefixes[i] == prefix:
+            ordinals = [o for o in self.prefix_top[i * TOP_K:i * TOP_K + limit] if o != NO_SUGGESTION]
+        else:
+            lo = bisect_left(self.keys, prefix)
+            hi = bisect_left(self.keys, prefix + b'\xff', lo)
+            ordinals = heapq.nsmallest(limit, set(self.targets[lo:hi]))
+        return [self.suggestion(ordinal) for ordinal in ordinals]
@@ -0,0 +1,260 @@
+"""
+Typeahead suggestions, shared between worker processes
+
+Suggestions are product titles, brands, categories and manufacturer names,
+weighted by flick views (summed over the products sharing a brand,
+category or manufacturer). They are served from a PrefixIndex snapshot
+written to SUGGEST_INDEX_PATH, which every worker on the host memory-maps,
+so the index is built once per host rather than once per process.
+
+The snapshot is rebuilt once it is older than SUGGEST_INDEX_MAX_AGE, by
+whichever worker notices first while the others keep serving the old one;
+the rest pick up the new file on their next request. In between, product
+writes are applied to the writing process's overlay: a changed product's
+title replaces the snapshot's and a deleted product's is hidden. Brand,
+category and manufacturer changes, and new view counts, wait for the next
+rebuild. Processes that have no snapshot yet skip the overlay, and one
+holding more than SUGGEST_OVERLAY_MAX writes rebuilds early.
+"""
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from products.models import Product
+from .prefix_index import TOP_K, PrefixIndex, Suggestion, build_snapshot, normalize, phrase_keys, rank
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process lock; workers may rebuild at the same time
+    fcntl = None
+
+# Most suggestions one request may ask for
+MAX_SUGGESTIONS = 10
+
+_lock = threading.Lock()
+# overlay: product id -> (changed at, Suggestion or None if deleted)
+# overlay_keys: sorted (key, product id) of the overlay's suggestions
+# rebuild: the overlay hides too much of the snapshot to serve around it
+_state = {'index': None, 'file': None, 'overlay': {}, 'overlay_keys': [], 'rebuild': False}
+
+
+def index_path():
+    """
+    Snapshot file, SUGGEST_INDEX_PATH or one per database in the temp directory
+
+    An empty SUGGEST_INDEX_PATH keeps the index in this process only.
+    """
+    path = getattr(settings, 'SUGGEST_INDEX_PATH', None)
+    if path is None:
+        database = hashlib.sha1(str(connection.settings_dict['NAME']).encode('utf-8')).hexdigest()[:12]
+        path = os.path.join(tempfile.gettempdir(), f'flicks-suggest-{database}.idx')
+    return path or None
+
+
+def product_suggestion(product_id, title, views):
+    return Suggestion(title, 'product', product_id, views or 0)
+
+
+def read_suggestions():
+    """Every suggestion with its weight, from a single streamed query"""
+    totals = {}
+    rows = Product.objects.values_list(
+        'id', 'title', 'brand', 'product_category', 'manufacturer__name', 'flicks_analytics__views'
+    ).order_by()
+    for product_id, title, brand, category, manufacturer, views in rows.iterator(chunk_size=2000):
+        if normalize(title):
+            yield product_suggestion(product_id, title, views)
+        for kind, text in (('brand', brand), ('category', category), ('manufacturer', manufacturer)):
+            key = normalize(text or '')
+            if key:
+                # Spelling variants of one name add up under the first seen
+                shown, weight = totals.get((kind, key), (text, 0))
+                totals[(kind, key)] = (shown, weight + (views or 0))
+    for (kind, _), (text, weight) in totals.items():
+        yield Suggestion(text, kind, 0, weight)
+
+
+def build_index():
+    """A PrefixIndex of the current catalog, held in memory"""
+    built_at = time.time()
+    return PrefixIndex(build_snapshot(read_suggestions(), built_at))
+
+
+def load_index(path):
+    with open(path, 'rb') as f:
+        # The mapping outlives the file object and survives the file being replaced
+        return PrefixIndex(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def file_identity(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def write_index(path):
+    """
+    Rebuild the snapshot file unless another process already is
+
+    Returns:
+        True if this process wrote it
+    """
+    with open(f'{path}.lock', 'w') as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(build_snapshot(read_suggestions(), time.time()))
+        os.replace(tmp_path, path)
+        return True
+
+
+def index_overlay():
+    """Recompute overlay_keys after the overlay changed"""
+    _state['overlay_keys'] = sorted(
+        (key, product_id) for product_id, (_, suggestion) in _state['overlay'].items() if suggestion
+        for key in phrase_keys(suggestion.text)
+    )
+
+
+def install(index, identity=None):
+    """Make index current, dropping overlay entries it already includes"""
+    _state['index'] = index
+    _state['file'] = identity
+    _state['rebuild'] = False
+    _state['overlay'] = {
+        product_id: change for product_id, change in _state['overlay'].items()
+        if change[0] >= index.built_at
+    }
+    index_overlay()
+
+
+def is_stale(index):
+    max_age = getattr(settings, 'SUGGEST_INDEX_MAX_AGE', 300)
+    return (
+        index is None or time.time() - index.built_at > max_age or _state['rebuild']
+        or len(_state['overlay']) > getattr(settings, 'SUGGEST_OVERLAY_MAX', 500)
+    )
+
+
+def get_index():
+    """The current snapshot, reloaded when another process replaced it and rebuilt when stale"""
+    path = index_path()
+    with _lock:
+        if path is None:
+            if is_stale(_state['index']):
+                install(build_index())
+            return _state['index']
+
+        identity = file_identity(path)
+        if identity is not None and identity != _state['file']:
+            install(load_index(path), identity)
+        index = _state['index']
+        if is_stale(index):
+            if write_index(path):
+                identity = file_identity(path)
+                install(load_index(path), identity)
+            elif index is None:
+                # Another process is writing the first snapshot; don't wait for it
+                install(build_index())
+        return _state['index']
+
+
+def reset_index():
+    """Forget the snapshot, in this process and on disk; the next request rebuilds it"""
+    path = index_path()
+    with _lock:
+        _state.update(index=None, file=None, overlay={}, overlay_keys=[], rebuild=False)
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+
+def suggest(query, limit=MAX_SUGGESTIONS):
+    """
+    Best suggestions for a typed prefix
+
+    Args:
+        query: Text typed so far; its last word may be incomplete
+        limit: Most suggestions to return, capped at MAX_SUGGESTIONS
+    Returns:
+        List of Suggestion, best first
+    """
+    limit = max(1, min(limit, MAX_SUGGESTIONS))
+    index = get_index()
+    prefix = normalize(query)
+    with _lock:
+        overlay = _state['overlay']
+        keys = _state['overlay_keys']
+        matches = set()
+        i = bisect_left(keys, (prefix,))
+        while i < len(keys) and keys[i][0].startswith(prefix):
+            matches.add(keys[i][1])
+            i += 1
+        added = [overlay[product_id][1] for product_id in matches]
+        hidden = set(overlay)
+    # Ask for extra in case the overlay hides some; the index returns at most TOP_K
+    wanted = min(limit + len(hidden), TOP_K)
+    found = index.suggest(query, wanted)
+    results = [suggestion for suggestion in found if suggestion.product_id not in hidden]
+    results.extend(added)
+    results.sort(key=rank)
+    if len(found) == TOP_K and wanted < limit + len(hidden):
+        # The snapshot's suggestions past its TOP_K could rank anywhere after
+        # the last one returned; rebuild rather than keep serving short lists
+        known = sum(1 for suggestion in results if rank(suggestion) <= rank(found[-1]))
+        if known < limit:
+            with _lock:
+                _state['rebuild'] = True
+    return results[:limit]
+
+
+def has_index():
+    with _lock:
+        return _state['index'] is not None
+
+
+def product_changed(product_id):
+    # A process without a snapshot gets the write when it builds one
+    if not has_index():
+        return
+    row = Product.objects.filter(pk=product_id).values_list('title', 'flicks_analytics__views').first()
+    changed = product_suggestion(product_id, *row) if row and normalize(row[0]) else None
+    with _lock:
+        _state['overlay'][product_id] = (time.time(), changed)
+        index_overlay()
+
+
+def product_removed(product_id):
+    if not has_index():
+        return
+    with _lock:
+        _state['overlay'][product_id] = (time.time(), None)
+        index_overlay()
+
+
+# Applied on commit so a rolled-back write never reaches the overlay
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        pk = instance.pk
+        transaction.on_commit(lambda: product_changed(pk))
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: product_removed(pk))
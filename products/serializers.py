@@ -1,4 +1,6 @@
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
+from . import taxonomy
 from .models import (
     ShopUser, Manufacturer, Distributor, Product, Shop, 
     Subscription, ProductGallery, FlicksAnalytics, ViewSession
@@ -26,77 +28,174 @@ class DistributorSerializer(serializers.ModelSerializer):
         model = Distributor
         fields = '__all__'
 
+def gallery_url(item):
+    """Public URL of a gallery item's media, read from its stored media_urls"""
+    return (item.media_urls or {}).get(item.media_type)
+
+
+def primary_gallery_image(product):
+    """
+    Primary gallery image of a product, picked from its gallery in memory
+
+    Reads product.gallery.all(), so with the gallery prefetched (see
+    ProductSerializer.setup_eager_loading) this costs no query and shares
+    the list with gallery_items.
+    """
+    for item in product.gallery.all():
+        if item.is_primary and item.media_type == 'image':
+            return item
+    return None
+
+
 class ProductGallerySerializer(serializers.ModelSerializer):
+    image = serializers.SerializerMethodField()
+    video = serializers.SerializerMethodField()
+    poster = serializers.SerializerMethodField()
     url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = ProductGallery
-        fields = ['id', 'media_type', 'image', 'video', 'is_primary', 'alt_text', 'display_order', 'url']
+        fields = ['id', 'media_type', 'image', 'video', 'poster', 'placeholder', 'is_primary', 'alt_text', 'display_order', 'url', 'srcset']
+    
+    def get_image(self, obj):
+        return (obj.media_urls or {}).get('image')
+    
+    def get_video(self, obj):
+        return (obj.media_urls or {}).get('video')
+    
+    def get_poster(self, obj):
+        return (obj.media_urls or {}).get('poster')
     
     def get_url(self, obj):
-        if obj.media_type == 'image' and obj.image:
-            return obj.image.url
-        elif obj.media_type == 'video' and obj.video:
-            return obj.video.url
-        return None
+        return gallery_url(obj)
+    
+    def get_srcset(self, obj):
+        if obj.media_type == 'image':
+            return (obj.media_urls or {}).get('srcset', {})
+        return {}
         
-class ProductSerializer(serializers.ModelSerializer):
+class TaxonomyNamesMixin:
+    """product_category and brand as the canonical names of the product's terms"""
+    
+    def get_product_category(self, obj):
+        return taxonomy.name('category', obj.category_ref_id, obj.product_category)
+    
+    def get_brand(self, obj):
+        return taxonomy.name('brand', obj.brand_ref_id, obj.brand)
+
+class ProductSerializer(TaxonomyNamesMixin, serializers.ModelSerializer):
+    product_category = serializers.SerializerMethodField()
+    brand = serializers.SerializerMethodField()
     manufacturer_name = serializers.SerializerMethodField()
     image_url = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
+    image_placeholder = serializers.SerializerMethodField()
     video_url = serializers.SerializerMethodField()
+    video_poster_url = serializers.SerializerMethodField()
+    video_placeholder = serializers.CharField(source='flicks_placeholder', read_only=True)
     gallery_items = ProductGallerySerializer(many=True, read_only=True, source='gallery.all')
     
     class Meta:
         model = Product
         fields = ['id', 'title', 'brand', 'product_category', 'age_group', 
                   'gender', 'description', 'manufacturer_name', 'image_url', 
-                  'video_url', 'gallery_items']
+                  'image_srcset', 'image_placeholder', 'video_url', 'video_poster_url',
+                  'video_placeholder', 'gallery_items']
+    
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Load everything the serializer reads in a fixed number of queries
+
+        Args:
+            queryset: Product queryset, or a list of products (e.g. featured)
+        Returns:
+            The queryset with the manufacturer joined and the ordered gallery
+            prefetched; lists are prefetched in place and returned as-is
+        """
+        gallery = Prefetch(
+            'gallery',
+            queryset=ProductGallery.objects.order_by(*ProductGallery._meta.ordering)
+        )
+        if isinstance(queryset, list):
+            prefetch_related_objects(queryset, 'manufacturer', gallery)
+            return queryset
+        # The search vector is only read by the database
+        return queryset.select_related('manufacturer').prefetch_related(gallery).defer('search_vector')
     
     def get_manufacturer_name(self, obj):
         return obj.manufacturer.name if obj.manufacturer else None
     
     def get_image_url(self, obj):
         # Get primary image from gallery
-        primary_item = obj.gallery.filter(is_primary=True, media_type='image').first()
-        if primary_item and primary_item.image:
-            return primary_item.image.url
+        primary_item = primary_gallery_image(obj)
+        if primary_item and gallery_url(primary_item):
+            return gallery_url(primary_item)
         # Fallback to flicks field if no primary image
-        if obj.flicks:
-            return obj.flicks.url
-        return None
+        return (obj.media_urls or {}).get('flicks')
+    
+    def get_image_srcset(self, obj):
+        primary_item = primary_gallery_image(obj)
+        if primary_item:
+            return (primary_item.media_urls or {}).get('srcset', {})
+        return {}
+    
+    def get_image_placeholder(self, obj):
+        primary_item = primary_gallery_image(obj)
+        return primary_item.placeholder if primary_item else ''
         
     def get_video_url(self, obj):
         # Return the flicks field
-        if obj.flicks:
-            return obj.flicks.url
-        return None
+        return (obj.media_urls or {}).get('flicks')
+    
+    def get_video_poster_url(self, obj):
+        return (obj.media_urls or {}).get('flicks_poster')
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+class ProductDetailSerializer(TaxonomyNamesMixin, serializers.ModelSerializer):
+    product_category = serializers.SerializerMethodField()
+    brand = serializers.SerializerMethodField()
     manufacturer_name = serializers.SerializerMethodField()
     image_url = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
+    image_placeholder = serializers.SerializerMethodField()
     video_url = serializers.SerializerMethodField()
+    video_poster_url = serializers.SerializerMethodField()
+    video_placeholder = serializers.CharField(source='flicks_placeholder', read_only=True)
     gallery = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
         fields = ['id', 'title', 'brand', 'product_category', 'age_group', 
                  'gender', 'description', 'manufacturer_name', 
-                 'image_url', 'video_url', 'gallery']
+                 'image_url', 'image_srcset', 'image_placeholder', 'video_url',
+                 'video_poster_url', 'video_placeholder', 'gallery']
+    
+    setup_eager_loading = staticmethod(ProductSerializer.setup_eager_loading)
     
     def get_manufacturer_name(self, obj):
         return obj.manufacturer.name if obj.manufacturer else None
     
     def get_image_url(self, obj):
-        primary = obj.gallery.filter(is_primary=True, media_type='image').first()
-        if primary and primary.image:
-            return primary.image.url
-        return None
+        primary = primary_gallery_image(obj)
+        return gallery_url(primary) if primary else None
+    
+    def get_image_srcset(self, obj):
+        primary = primary_gallery_image(obj)
+        if primary:
+            return (primary.media_urls or {}).get('srcset', {})
+        return {}
+    
+    def get_image_placeholder(self, obj):
+        primary = primary_gallery_image(obj)
+        return primary.placeholder if primary else ''
         
     def get_video_url(self, obj):
         # Just return the main flicks field
-        if obj.flicks:
-            return obj.flicks.url
-        return None
+        return (obj.media_urls or {}).get('flicks')
+    
+    def get_video_poster_url(self, obj):
+        return (obj.media_urls or {}).get('flicks_poster')
         
     def get_gallery(self, obj):
         """Get all gallery items with their metadata"""
@@ -108,13 +207,17 @@ class ProductDetailSerializer(serializers.ModelSerializer):
                 'is_primary': item.is_primary,
                 'alt_text': item.alt_text,
                 'display_order': item.display_order,
+                'placeholder': item.placeholder,
             }
             
-            if item.media_type == 'image' and item.image:
-                item_data['url'] = item.image.url
-            elif item.media_type == 'video' and item.video:
-                item_data['url'] = item.video.url
+            urls = item.media_urls or {}
+            if item.media_type == 'image' and urls.get('image'):
+                item_data['url'] = urls['image']
+                item_data['srcset'] = urls.get('srcset', {})
+            elif item.media_type == 'video' and urls.get('video'):
+                item_data['url'] = urls['video']
                 item_data['duration'] = item.video_duration
+                item_data['poster'] = urls.get('poster')
                 
             result.append(item_data)
             
@@ -123,16 +226,36 @@ class ProductDetailSerializer(serializers.ModelSerializer):
 class ShopSerializer(serializers.ModelSerializer):
     owner_name = serializers.ReadOnlyField(source='owner.username')
     helper_count = serializers.SerializerMethodField()
+    banner_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Shop
         fields = [
             'id', 'name', 'description', 'address', 'phone', 'email', 
-            'banner', 'owner', 'owner_name', 'helpers', 'helper_count'
+            'banner', 'banner_url', 'banner_placeholder', 'owner', 'owner_name', 'helpers', 'helper_count'
         ]
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Join the owner and prefetch helpers, which helpers and helper_count share
+
+        Args:
+            queryset: Shop queryset, or a list of shops
+        Returns:
+            The eager-loading queryset; lists are prefetched in place and returned
+        """
+        if isinstance(queryset, list):
+            prefetch_related_objects(queryset, 'owner', 'helpers')
+            return queryset
+        return queryset.select_related('owner').prefetch_related('helpers')
+    
     def get_helper_count(self, obj):
-        return obj.helpers.count()
+        # Counted from helpers.all() so a prefetch serves both fields
+        return len(obj.helpers.all())
+    
+    def get_banner_url(self, obj):
+        return (obj.media_urls or {}).get('banner')
 
 class SubscriptionSerializer(serializers.ModelSerializer):
     plan_name = serializers.SerializerMethodField()
@@ -0,0 +1,127 @@
+"""
+In-process id <-> name maps of the category and brand tables
+
+Both tables hold hundreds of rows, not millions, so each process keeps them
+whole and serializers, facets and filters translate between term ids and
+names without a join or a query. A map is reloaded:
+
+  - when a transaction in this process that saved or deleted a term or
+    alias of its kind commits (bulk writers wrap themselves in
+    reloads_deferred() and call load_maps() once instead),
+  - after TAXONOMY_MAP_MAX_AGE seconds, to pick up renames made elsewhere,
+  - when asked about an id or spelling it does not know, at most once per
+    MISS_RELOAD_SECONDS, which is how terms other processes create appear.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from products.models import Brand, BrandAlias, Category, CategoryAlias, taxonomy_key
+
+TERMS = {'category': Category, 'brand': Brand}
+
+# Least time between reloads caused by unknown ids or spellings
+MISS_RELOAD_SECONDS = 10
+
+_lock = threading.Lock()
+# kind -> {'names': {id: name}, 'ids': {key: id}, 'loaded_at': monotonic time}
+_maps = {}
+_deferred = threading.local()
+
+
+def _load(kind):
+    model = TERMS[kind]
+    _maps[kind] = {
+        'names': dict(model.objects.values_list('id', 'name')),
+        'ids': dict(model.alias_model().objects.values_list('key', 'term_id')),
+        'loaded_at': time.monotonic(),
+    }
+    return _maps[kind]
+
+
+def _get(kind, missing=None):
+    """The kind's map, reloaded if stale or if `missing` says a lookup missed"""
+    max_age = getattr(settings, 'TAXONOMY_MAP_MAX_AGE', 300)
+    with _lock:
+        current = _maps.get(kind)
+        if current is None:
+            return _load(kind)
+        age = time.monotonic() - current['loaded_at']
+        if age > max_age or (missing is not None and missing(current) and age > MISS_RELOAD_SECONDS):
+            return _load(kind)
+        return current
+
+
+def load_maps():
+    """Load every map now instead of on first use"""
+    with _lock:
+        for kind in TERMS:
+            _load(kind)
+
+
+def name(kind, term_id, default=None):
+    """
+    Canonical name of a term
+
+    Args:
+        kind: 'category' or 'brand'
+        term_id: Term id, or None
+        default: Returned when the id is None or unknown, e.g. the product's own text
+    """
+    if term_id is None:
+        return default
+    names = _get(kind, missing=lambda current: term_id not in current['names'])['names']
+    return names.get(term_id, default)
+
+
+def lookup(kind, spelling):
+    """Id of the term a spelling resolves to, or None; unlike Term.resolve, never creates one"""
+    key = taxonomy_key(spelling)
+    if not key:
+        return None
+    return _get(kind, missing=lambda current: key not in current['ids'])['ids'].get(key)
+
+
+@contextmanager
+def reloads_deferred():
+    """Skip the reload after each term or alias write in this thread; call load_maps() after"""
+    _deferred.depth = getattr(_deferred, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _deferred.depth -= 1
+
+
+def _reload_if_changed(kind, changed_at):
+    with _lock:
+        current = _maps.get(kind)
+        # Several writes in one transaction share the first reload
+        if current is not None and current['loaded_at'] < changed_at:
+            _load(kind)
+
+
+def _term_changed(kind):
+    if getattr(_deferred, 'depth', 0):
+        return
+    changed_at = time.monotonic()
+    # Not before commit: a rolled-back term must never reach the map
+    transaction.on_commit(lambda: _reload_if_changed(kind, changed_at))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=CategoryAlias)
+@receiver(post_delete, sender=CategoryAlias)
+def category_changed(sender, **kwargs):
+    _term_changed('category')
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=BrandAlias)
+@receiver(post_delete, sender=BrandAlias)
+def brand_changed(sender, **kwargs):
+    _term_changed('brand')
@@ -1,9 +1,55 @@
 # products/tests.py
-from django.test import TestCase
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+import zipfile
+from datetime import timedelta
+from unittest import mock
+from PIL import Image
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from django.contrib.admin import site as admin_site
+from django.db import connection, transaction
+from django.test import TestCase, SimpleTestCase, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.core.management import call_command, CommandError
 from rest_framework.test import APIClient
 from django.contrib.auth import get_user_model
-from .models import Shop, Product
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, FileSystemStorage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from botocore.stub import Stubber
+from flicks.media import serve_media
+from flicks.storage_backends import TunedMediaStorage
+from . import catalog_cache, taxonomy, urls as products_urls
+from .models import (
+    Shop, Manufacturer, Product, ProductGallery, FeaturedProduct, FlicksAnalytics, ViewSession,
+    UploadSession, UploadIntent, Category, CategoryAlias, Brand
+)
+from .serializers import ProductSerializer, ProductDetailSerializer
+from .facets import facet_counts
+from .gallery_import import import_gallery
+from .search.inverted_index import InvertedIndex
+from .search import memory as memory_search, suggest
+from .search.memory import reset_index as reset_search_index
+from .search.prefix_index import PREFIX_SCAN_LIMIT, PrefixIndex, Suggestion, build_snapshot
+from .utils.bloom import BloomFilter
+from .utils.placeholders import blurhash_encode, compute_placeholder
+from .utils.media_processors import (
+    generate_image_derivatives, process_product_image, process_banner_image,
+    is_animated_gif, convert_gif_to_video
+)
 
 User = get_user_model()
 
@@ -47,4 +93,1708 @@ class APIEndpointTests(TestCase):
         url = reverse('store-info')
         self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
         response = self.client.get(url)
-        self.assertEqual(response.status_code, 200)
\ No newline at end of file
+        self.assertEqual(response.status_code, 200)
+
+
+def make_image_file(size=(1600, 1200), format='JPEG', **save_kwargs):
+    output = io.BytesIO()
+    Image.new('RGB', size, (200, 120, 40)).save(output, format=format, **save_kwargs)
+    output.seek(0)
+    return output
+
+
+def make_gif_file(frames=10):
+    output = io.BytesIO()
+    images = [Image.new('RGB', (64, 48), (i * 20, 0, 0)) for i in range(frames)]
+    images[0].save(output, format='GIF', save_all=True, append_images=images[1:], duration=100, loop=0)
+    output.seek(0)
+    output.name = 'spinner.gif'
+    return output
+
+
+class MediaProcessorTests(SimpleTestCase):
+    def test_derivatives_are_webp_and_never_upscaled(self):
+        derivatives = generate_image_derivatives(make_image_file((800, 800)), widths=[320, 640, 1080])
+        self.assertEqual(sorted(derivatives['webp']), [320, 640, 800])
+        img = Image.open(io.BytesIO(derivatives['webp'][320]))
+        self.assertEqual(img.format, 'WEBP')
+        self.assertEqual(img.size, (320, 320))
+    
+    def test_derivatives_apply_orientation_and_strip_exif(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotated 90 degrees clockwise
+        source = make_image_file((400, 200), exif=exif.tobytes())
+        derivatives = generate_image_derivatives(source, widths=[200])
+        img = Image.open(io.BytesIO(derivatives['webp'][200]))
+        self.assertEqual(img.size, (200, 400))
+        self.assertNotIn(0x0112, img.getexif())
+    
+    def test_product_image_is_square_and_capped(self):
+        source = make_image_file((3000, 2000))
+        source.name = 'photo.jpg'
+        processed = process_product_image(source, max_size=1024)
+        self.assertEqual(Image.open(processed).size, (1024, 1024))
+    
+    def test_banner_image_is_cropped_to_target(self):
+        source = make_image_file((3000, 3000))
+        source.name = 'banner.png'
+        processed = process_banner_image(source)
+        img = Image.open(processed)
+        self.assertEqual((img.format, img.size), ('PNG', (1280, 720)))
+    
+    @override_settings(IMAGE_MAX_PIXELS=1_000_000)
+    def test_decompression_bomb_is_rejected_before_decoding(self):
+        source = make_image_file((2000, 2000))
+        source.name = 'huge.jpg'
+        with self.assertRaises(Image.DecompressionBombError):
+            process_product_image(source)
+    
+    def test_animated_gif_detection(self):
+        self.assertTrue(is_animated_gif(make_gif_file()))
+        self.assertFalse(is_animated_gif(make_gif_file(frames=1)))
+        self.assertFalse(is_animated_gif(make_image_file()))
+    
+    @unittest.skipUnless(shutil.which('ffmpeg'), 'ffmpeg is not installed')
+    def test_animated_gif_converts_to_video_with_poster(self):
+        # A plain file object, as the import commands pass
+        video, poster, duration = convert_gif_to_video(make_gif_file(), container='mp4')
+        self.assertEqual(video.name, 'spinner.mp4')
+        self.assertEqual(Image.open(poster).size, (64, 48))
+        self.assertEqual(duration, 1)
+    
+    def test_blurhash_matches_reference_encoding(self):
+        # Single-colour image: DC term only, no AC components
+        self.assertEqual(blurhash_encode(Image.new('RGB', (10, 10), (90, 90, 90)), 1, 1), '00ATi,')
+        placeholder = compute_placeholder(make_image_file())
+        self.assertEqual(len(placeholder), 28)
+
+
+LOCAL_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+class ResumableUploadTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.upload_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.upload_root, ignore_errors=True)
+        overrides = override_settings(
+            MEDIA_ROOT=self.media_root,
+            STORAGES=LOCAL_STORAGES,
+            RESUMABLE_UPLOAD_ROOT=self.upload_root,
+            RESUMABLE_UPLOAD_PROBE_BYTES=16,
+            MEDIA_PIPELINE_EAGER=True,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        
+        self.staff = User.objects.create_user(username='staff', password='pw', is_staff=True)
+        self.product = Product.objects.create(
+            title='Robot', product_category='Toys', age_group='5+', brand='Acme', description='A robot'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        # An MP4 header followed by filler
+        self.video = b'\x00\x00\x00\x20ftypisom' + bytes(range(256)) * 4
+    
+    def create_upload(self):
+        response = self.client.post(reverse('create-upload'), {
+            'product_id': self.product.id, 'filename': 'demo.mp4', 'length': len(self.video)
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response['Location']
+    
+    def patch_chunk(self, url, offset, chunk):
+        return self.client.generic(
+            'PATCH', url, chunk,
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+    
+    @mock.patch('products.models.extract_video_poster', return_value=None)
+    @mock.patch('products.models.encode_video', side_effect=lambda f: (f, {'duration': 12}))
+    @mock.patch('products.uploads.probe_video_container', return_value='mp4')
+    def test_chunked_upload_resumes_and_attaches_flick(self, probe, encode_video, poster):
+        url = self.create_upload()
+        
+        response = self.patch_chunk(url, 0, self.video[:100])
+        self.assertEqual(response.status_code, 204)
+        probe.assert_called_once()
+        
+        # Resuming from a stale offset is rejected with the real one
+        response = self.patch_chunk(url, 0, self.video[:100])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.client.head(url)['Upload-Offset'], '100')
+        
+        response = self.patch_chunk(url, 100, self.video[100:])
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response['Upload-Offset'], str(len(self.video)))
+        
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.video_duration, 12)
+        with self.product.flicks.open('rb') as f:
+            self.assertEqual(f.read(), self.video)
+        self.assertEqual(UploadSession.objects.get().status, UploadSession.COMPLETE)
+    
+    @mock.patch('products.uploads.probe_video_container', return_value=None)
+    def test_invalid_container_is_rejected_after_first_chunk(self, probe):
+        url = self.create_upload()
+        response = self.patch_chunk(url, 0, b'not a video at all')
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(UploadSession.objects.get().status, UploadSession.FAILED)
+        self.assertEqual(self.patch_chunk(url, 18, b'more').status_code, 409)
+    
+    @mock.patch('products.uploads.probe_video_container', return_value='mp4')
+    def test_idle_uploads_expire(self, probe):
+        url = self.create_upload()
+        session = UploadSession.objects.get()
+        self.assertEqual(url, 'http://testserver' + reverse('upload-detail', args=[session.id]))
+        self.assertEqual(self.patch_chunk(url, 0, self.video[:100]).status_code, 204)
+        self.assertIn('Upload-Expires', self.client.head(url))
+        
+        idle = timezone.now() - timedelta(days=2)
+        UploadSession.objects.update(updated_at=idle)
+        self.assertEqual(self.patch_chunk(url, 100, self.video[100:]).status_code, 410)
+        session.refresh_from_db()
+        self.assertEqual((session.status, session.error), (UploadSession.FAILED, 'Upload expired'))
+        self.assertEqual(os.listdir(self.upload_root), [])
+    
+    def test_expire_uploads_command(self):
+        self.create_upload()
+        active = self.create_upload()
+        stale = UploadSession.objects.exclude(id=active.rstrip('/').rsplit('/', 1)[-1])
+        stale.update(updated_at=timezone.now() - timedelta(days=2))
+        stray = os.path.join(self.upload_root, f'{uuid.uuid4()}.part')
+        open(stray, 'wb').close()
+        os.utime(stray, (0, 0))
+        
+        call_command('expire_uploads', stdout=io.StringIO())
+        self.assertEqual(
+            sorted(UploadSession.objects.values_list('status', flat=True)),
+            [UploadSession.FAILED, UploadSession.UPLOADING]
+        )
+        self.assertEqual(os.listdir(self.upload_root), [f'{UploadSession.objects.get(status=UploadSession.UPLOADING).id}.part'])
+
+
+S3_SETTINGS = {
+    'STORAGES': {'default': {'BACKEND': 'storages.backends.s3boto3.S3Boto3Storage'},
+                 'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}},
+    'AWS_STORAGE_BUCKET_NAME': 'flicks-test',
+    'AWS_S3_REGION_NAME': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+    'AWS_S3_CUSTOM_DOMAIN': None,
+}
+
+
+@override_settings(**S3_SETTINGS)
+class DirectUploadTests(TestCase):
+    """Presigned uploads against a stubbed S3 client (no network)"""
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='pw', is_staff=True)
+        self.owner = User.objects.create_user(username='owner', password='pw')
+        self.shop = Shop.objects.create(
+            name='Shop', address='1 St', phone='123', email='s@example.com', owner=self.owner
+        )
+        self.product = Product.objects.create(
+            title='Robot', product_category='Toys', age_group='5+', brand='Acme', description='A robot'
+        )
+        self.client = APIClient()
+        self.stubber = Stubber(default_storage.connection.meta.client)
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+    
+    def create_intent(self, user, **data):
+        self.client.force_authenticate(user)
+        return self.client.post(reverse('create-upload-intent'), data, format='json')
+    
+    def test_presigned_put_for_flick(self):
+        response = self.create_intent(
+            self.staff, target='flicks', object_id=self.product.id, filename='demo.mp4', size=1024
+        )
+        self.assertEqual(response.status_code, 201)
+        upload = response.data['upload']
+        self.assertEqual(upload['method'], 'PUT')
+        self.assertIn('flicks-test', upload['url'])
+        self.assertIn('products/flicks/', upload['url'])
+        self.assertEqual(upload['headers']['Content-Type'], 'video/mp4')
+    
+    def test_presigned_post_for_shop_banner_by_owner(self):
+        response = self.create_intent(
+            self.owner, target='shop_banner', object_id=self.shop.id, filename='banner.jpg', size=2048, method='post'
+        )
+        self.assertEqual(response.status_code, 201)
+        fields = response.data['upload']['fields']
+        self.assertTrue(fields['key'].startswith('shops/banners/'))
+        self.assertIn('policy', fields)
+        
+        # Owners can't upload catalog media
+        response = self.create_intent(
+            self.owner, target='flicks', object_id=self.product.id, filename='demo.mp4', size=1024
+        )
+        self.assertEqual(response.status_code, 403)
+    
+    @mock.patch('products.uploads.enqueue')
+    def test_completion_verifies_object_with_head(self, enqueue):
+        response = self.create_intent(
+            self.staff, target='gallery_image', object_id=self.product.id, filename='photo.png', size=2048
+        )
+        intent = UploadIntent.objects.get(id=response.data['id'])
+        complete_url = reverse('complete-upload-intent', args=[intent.id])
+        
+        self.stubber.add_client_error('head_object', 'NoSuchKey', http_status_code=404)
+        self.assertEqual(self.client.post(complete_url).status_code, 400)
+        
+        self.stubber.add_response(
+            'head_object', {'ContentLength': 2048, 'ContentType': 'image/png'},
+            {'Bucket': 'flicks-test', 'Key': intent.storage_name}
+        )
+        response = self.client.post(complete_url)
+        self.assertEqual(response.status_code, 202)
+        enqueue.assert_called_once()
+        intent.refresh_from_db()
+        self.assertEqual(intent.status, UploadIntent.UPLOADED)
+        self.assertEqual(self.client.post(complete_url).status_code, 409)
+    
+    @mock.patch('products.uploads.enqueue')
+    def test_expired_intent_is_rejected(self, enqueue):
+        response = self.create_intent(
+            self.staff, target='gallery_image', object_id=self.product.id, filename='photo.png', size=2048
+        )
+        intent = UploadIntent.objects.get(id=response.data['id'])
+        UploadIntent.objects.filter(id=intent.id).update(expires_at=timezone.now() - timedelta(seconds=1))
+        
+        self.stubber.add_response('delete_object', {}, {'Bucket': 'flicks-test', 'Key': intent.storage_name})
+        response = self.client.post(reverse('complete-upload-intent', args=[intent.id]))
+        self.assertEqual(response.status_code, 410)
+        self.stubber.assert_no_pending_responses()
+        enqueue.assert_not_called()
+        intent.refresh_from_db()
+        self.assertEqual(intent.status, UploadIntent.FAILED)
+
+
+class MediaFixtureTestCase(TestCase):
+    """A shop, a product with a flick and one gallery image on local storage"""
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=media_root, STORAGES=LOCAL_STORAGES)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        
+        owner = User.objects.create_user(username='owner', password='pw')
+        shop = Shop(name='Shop', address='1 St', phone='123', email='s@example.com', owner=owner)
+        shop.banner = ContentFile(make_image_file().getvalue(), name='banner.jpg')
+        shop.save()
+        
+        product = Product(title='Robot', product_category='Toys', age_group='5+', brand='Acme', description='A robot')
+        product.flicks = ContentFile(b'video', name='demo.mp4')
+        with mock.patch('products.models.encode_video', side_effect=lambda f: (f, {'duration': 5})), \
+             mock.patch('products.models.extract_video_poster', return_value=None):
+            product.save()
+        
+        ProductGallery(
+            product=product, media_type='image',
+            image=ContentFile(make_image_file().getvalue(), name='photo.jpg')
+        ).save()
+
+
+class MediaChangeTrackingTests(MediaFixtureTestCase):
+    """Metadata-only saves must not touch storage or re-run media processing"""
+    def count_media_work(self):
+        """Patch storage opens and every media processor, returning the mocks"""
+        patches = {
+            'open': mock.patch.object(FileSystemStorage, '_open', autospec=True, side_effect=FileSystemStorage._open),
+            'banner': mock.patch('products.models.process_banner_image'),
+            'image': mock.patch('products.models.process_product_image'),
+            'video': mock.patch('products.models.encode_video'),
+        }
+        mocks = {}
+        for name, patcher in patches.items():
+            mocks[name] = patcher.start()
+            self.addCleanup(patcher.stop)
+        return mocks
+    
+    def test_metadata_only_saves_skip_media_work(self):
+        mocks = self.count_media_work()
+        
+        shop = Shop.objects.get()
+        shop.name = 'Renamed Shop'
+        shop.save()
+        
+        product = Product.objects.get()
+        product.title = 'Renamed Robot'
+        product.save()
+        
+        item = ProductGallery.objects.get()
+        item.alt_text = 'A robot'
+        item.save()
+        
+        for name, work in mocks.items():
+            self.assertEqual(work.call_count, 0, f"{name} was called on a metadata-only save")
+    
+    def test_new_upload_is_processed(self):
+        mocks = self.count_media_work()
+        mocks['banner'].side_effect = lambda f: f
+        
+        shop = Shop.objects.get()
+        shop.banner = ContentFile(make_image_file().getvalue(), name='new-banner.jpg')
+        shop.save()
+        
+        self.assertEqual(mocks['banner'].call_count, 1)
+    
+    @override_settings(IMAGE_MAX_PIXELS=1_000_000)
+    def test_oversized_upload_is_a_validation_error(self):
+        shop = Shop.objects.get()
+        shop.banner = ContentFile(make_image_file((2000, 2000)).getvalue(), name='huge.jpg')
+        with self.assertRaisesMessage(ValidationError, 'under 1 megapixels'):
+            shop.save()
+        item = ProductGallery(
+            product=Product.objects.get(), media_type='image',
+            image=ContentFile(make_image_file((2000, 2000)).getvalue(), name='huge.jpg')
+        )
+        with self.assertRaises(ValidationError):
+            item.save()
+    
+    def test_encoded_video_temp_file_is_removed_after_save(self):
+        encoded = TemporaryUploadedFile('new.mp4', 'video/mp4', 7, None)
+        encoded.write(b'encoded')
+        path = encoded.temporary_file_path()
+        
+        product = Product.objects.get()
+        product.flicks = ContentFile(b'video', name='new.mp4')
+        with mock.patch('products.models.encode_video', return_value=(encoded, {'encoded': True})), \
+             mock.patch('products.models.extract_video_poster', return_value=None):
+            product.save()
+        
+        self.assertTrue(encoded.closed)
+        self.assertFalse(os.path.exists(path))
+        with default_storage.open(product.flicks.name) as stored:
+            self.assertEqual(stored.read(), b'encoded')
+
+
+@unittest.skipUnless(shutil.which('ffmpeg'), 'ffmpeg is not installed')
+class AnimatedGifUploadTests(MediaFixtureTestCase):
+    def test_gallery_upload_is_stored_as_looping_video(self):
+        item = ProductGallery(
+            product=Product.objects.get(), media_type='image',
+            image=ContentFile(make_gif_file().getvalue(), name='spinner.gif')
+        )
+        item.save()
+        item.refresh_from_db()
+        self.assertEqual((item.media_type, item.video_codec, item.video_duration), ('video', 'h264', 1))
+        self.assertFalse(item.image)
+        self.assertTrue(default_storage.exists(item.video.name))
+        self.assertEqual(Image.open(item.poster).size, (64, 48))
+
+
+class StoredMediaUrlTests(MediaFixtureTestCase):
+    """Serializers read URLs resolved at save time, never the storage backend"""
+    def test_serializers_do_not_resolve_urls(self):
+        with mock.patch.object(FileSystemStorage, 'url') as storage_url:
+            product = Product.objects.get()
+            data = ProductDetailSerializer(product).data
+            listing = ProductSerializer(product).data
+            banner = Shop.objects.get().media_urls['banner']
+        
+        self.assertEqual(storage_url.call_count, 0)
+        self.assertEqual(data['image_url'], '/media/products/photos/photo.jpg')
+        self.assertIn('640', data['image_srcset']['webp'])
+        self.assertEqual(data['video_url'], product.media_urls['flicks'])
+        self.assertEqual(listing['image_url'], data['image_url'])
+        self.assertTrue(banner.startswith('/media/'))
+    
+    def test_replacing_media_refreshes_urls(self):
+        shop = Shop.objects.get()
+        old_url = shop.media_urls['banner']
+        with mock.patch('products.models.process_banner_image', side_effect=lambda f: f):
+            shop.banner = ContentFile(make_image_file().getvalue(), name='other.jpg')
+            shop.save()
+        
+        self.assertNotEqual(Shop.objects.get().media_urls['banner'], old_url)
+        self.assertIn('other', Shop.objects.get().media_urls['banner'])
+    
+    def test_command_rebuilds_urls_for_new_host(self):
+        cache.clear()
+        self.client.force_login(User.objects.get())
+        detail = reverse('product-detail', args=[Product.objects.get().id])
+        listing = reverse('all-products')
+        before = {url: self.client.get(url) for url in (detail, listing)}
+        with override_settings(MEDIA_URL='https://cdn.example.com/'), self.captureOnCommitCallbacks(execute=True):
+            call_command('refresh_media_urls', stdout=io.StringIO())
+        
+        item = ProductGallery.objects.get()
+        self.assertTrue(item.media_urls['image'].startswith('https://cdn.example.com/'))
+        self.assertTrue(all(
+            url.startswith('https://cdn.example.com/')
+            for url in item.media_urls['srcset']['webp'].values()
+        ))
+        self.assertTrue(Shop.objects.get().media_urls['banner'].startswith('https://cdn.example.com/'))
+        
+        # Validators taken before the refresh no longer match, and cached cards are replaced
+        for url, response in before.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        self.assertEqual(self.client.get(listing).data['results'][0]['image_url'], item.media_urls['image'])
+
+
+class ProductListQueryTests(TestCase):
+    """List endpoints cost a fixed number of queries however many products they return"""
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='buyer', password='pw'))
+        for i in range(10):
+            manufacturer = Manufacturer.objects.create(
+                name=f'Maker {i}', email=f'maker{i}@example.com', phone='1', address='1 St'
+            )
+            product = Product(
+                title=f'Toy {i}', product_category='Toys', age_group='5+', gender='U',
+                brand='Acme', description='A toy', manufacturer=manufacturer
+            )
+            product.save(no_process=True)
+            ProductGallery.objects.bulk_create([
+                ProductGallery(product=product, media_type='image', display_order=1,
+                               media_urls={'image': f'/media/{i}-b.jpg'}),
+                ProductGallery(product=product, media_type='image', is_primary=True,
+                               media_urls={'image': f'/media/{i}-a.jpg'}),
+            ])
+    
+    def test_all_products(self):
+        # Count, products joined with manufacturers, gallery prefetch
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('all-products'), {'page_size': 10})
+        first = response.data['results'][0]
+        self.assertEqual(first['manufacturer_name'], 'Maker 0')
+        self.assertEqual(first['image_url'], '/media/0-a.jpg')
+        self.assertEqual([item['url'] for item in first['gallery_items']], ['/media/0-a.jpg', '/media/0-b.jpg'])
+    
+    def test_filter_products(self):
+        # Products, gallery prefetch, count, facets
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('filter-products'), {'category': 'Toys'})
+        self.assertEqual(len(response.data['results']), 10)
+    
+    def test_featured_trending_products(self):
+        for order, product in enumerate(Product.objects.all()):
+            FeaturedProduct.objects.create(product=product, featured_type='trending', display_order=order)
+        # Featured ids, products joined with manufacturers, galleries
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('trending-products'))
+        self.assertEqual(response.json()[0]['image_url'], '/media/0-a.jpg')
+    
+    def test_product_detail(self):
+        product = Product.objects.first()
+        # Validators, product joined with manufacturer, galleries
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('product-detail', args=[product.id]))
+        self.assertEqual(response.data['image_url'], '/media/0-a.jpg')
+        self.assertEqual(len(response.data['gallery']), 2)
+
+
+@override_settings(STORAGES={
+    **LOCAL_STORAGES, 'default': {'BACKEND': 'flicks.storage_backends.ContentAddressedStorage'}
+})
+class LocalMediaTests(SimpleTestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=media_root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.payload = bytes(range(256)) * 40
+        self.name = default_storage.save('products/videos/clip.mp4', ContentFile(self.payload))
+        self.factory = RequestFactory()
+    
+    def get(self, **headers):
+        return serve_media(self.factory.get('/media/' + self.name, headers=headers), self.name)
+    
+    def test_content_addressed_names(self):
+        self.assertRegex(self.name, r'^products/videos/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32}\.mp4$')
+        again = default_storage.save('products/videos/other.mp4', ContentFile(self.payload))
+        self.assertEqual(again, self.name)
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, '.tmp')), [])
+    
+    def test_full_and_ranged_responses(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), self.payload)
+        
+        response = self.get(range='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.payload)}')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(b''.join(response.streaming_content), self.payload[100:200])
+        
+        response = self.get(range='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.payload[-10:])
+        
+        response = self.get(range=f'bytes={len(self.payload)}-')
+        self.assertEqual(response.status_code, 416)
+    
+    def test_conditional_and_offloaded_responses(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(if_none_match=etag).status_code, 304)
+        
+        with override_settings(MEDIA_SENDFILE_HEADER='X-Accel-Redirect'):
+            response = self.get(range='bytes=0-9')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.name)
+        self.assertEqual(response.content, b'')
+    
+    def test_path_traversal_is_rejected(self):
+        with self.assertRaises(Http404):
+            serve_media(self.factory.get('/media/x'), '../../etc/passwd')
+
+
+@override_settings(
+    AWS_ACCESS_KEY_ID='key', AWS_SECRET_ACCESS_KEY='secret',
+    AWS_STORAGE_BUCKET_NAME='flicks', AWS_S3_REGION_NAME='us-east-1',
+    AWS_S3_MAX_POOL_CONNECTIONS=24, AWS_S3_MULTIPART_CHUNKSIZE=5 * 1024 * 1024,
+    AWS_S3_MAX_CONCURRENCY=12, AWS_S3_MAX_ATTEMPTS=3,
+)
+class TunedMediaStorageTests(SimpleTestCase):
+    def test_client_is_shared_and_configured(self):
+        storage = TunedMediaStorage()
+        clients = []
+        thread = threading.Thread(target=lambda: clients.append(TunedMediaStorage().bucket.meta.client))
+        thread.start()
+        thread.join()
+        
+        self.assertIs(clients[0], storage.client)
+        self.assertIs(storage.bucket.Object('x').meta.client, storage.client)
+        self.assertEqual(storage.client.meta.config.max_pool_connections, 24)
+        self.assertEqual(storage.client.meta.config.retries['total_max_attempts'], 4)
+        self.assertEqual(storage.transfer_config.multipart_chunksize, 5 * 1024 * 1024)
+        self.assertEqual(storage.transfer_config.max_request_concurrency, 12)
+        self.assertEqual(storage.transfer_config.max_in_memory_upload_chunks, 12)
+
+
+class GarbageCollectMediaTests(MediaFixtureTestCase):
+    def make_orphan(self, name, age_hours):
+        name = default_storage.save(name, ContentFile(b'orphan'))
+        mtime = time.time() - age_hours * 3600
+        os.utime(default_storage.path(name), (mtime, mtime))
+        return name
+    
+    def referenced_files(self):
+        item = ProductGallery.objects.get()
+        return [
+            Shop.objects.get().banner.name, Product.objects.get().flicks.name, item.image.name,
+            *item.image_variants['webp'].values(),
+        ]
+    
+    def test_dry_run_then_delete(self):
+        stale = self.make_orphan('products/photos/replaced.jpg', age_hours=48)
+        fresh = self.make_orphan('products/photos/uploading.jpg', age_hours=1)
+        unrelated = self.make_orphan('static/app.css', age_hours=48)
+        old = time.time() - 48 * 3600
+        for name in self.referenced_files():
+            os.utime(default_storage.path(name), (old, old))
+        
+        out = io.StringIO()
+        call_command('gc_media', '--dry-run', stdout=out)
+        self.assertIn(f'orphan: {stale}', out.getvalue())
+        self.assertTrue(default_storage.exists(stale))
+        
+        call_command('gc_media', stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(stale))
+        for name in [fresh, unrelated, *self.referenced_files()]:
+            self.assertTrue(default_storage.exists(name), name)
+    
+    def test_only_uploads_in_flight_protect_their_objects(self):
+        product = Product.objects.get()
+        old = timezone.now() - timedelta(days=2)
+        uploading = self.make_orphan('products/flicks/uploading.mp4', age_hours=48)
+        finished = self.make_orphan('products/flicks/finished.mp4', age_hours=48)
+        expired = self.make_orphan('products/photos/expired.jpg', age_hours=48)
+        live = UploadSession.objects.create(
+            product=product, filename='uploading.mp4', length=10, storage_name=uploading
+        )
+        done = UploadSession.objects.create(
+            product=product, filename='finished.mp4', length=10, storage_name=finished,
+            status=UploadSession.COMPLETE
+        )
+        UploadSession.objects.filter(pk=done.pk).update(updated_at=old)
+        intent = UploadIntent.objects.create(
+            target=UploadIntent.GALLERY_IMAGE, object_id=product.id, storage_name=expired,
+            content_type='image/jpeg', size=10, expires_at=old
+        )
+        UploadIntent.objects.filter(pk=intent.pk).update(created_at=old)
+        
+        call_command('gc_media', '--dry-run', stdout=io.StringIO())
+        self.assertEqual(UploadSession.objects.count(), 2)
+        
+        call_command('gc_media', stdout=io.StringIO())
+        self.assertTrue(default_storage.exists(uploading))
+        self.assertFalse(default_storage.exists(finished))
+        self.assertFalse(default_storage.exists(expired))
+        self.assertEqual(list(UploadSession.objects.all()), [live])
+        self.assertFalse(UploadIntent.objects.exists())
+    
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        names = [f'products/photos/{i}.jpg' for i in range(1000)]
+        for name in names:
+            bloom.add(name)
+        self.assertTrue(all(name in bloom for name in names))
+        false_positives = sum(f'shops/banners/{i}.jpg' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+def make_zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    buffer.seek(0)
+    return buffer
+
+
+@override_settings(STORAGES=LOCAL_STORAGES, MEDIA_PIPELINE_EAGER=True)
+class GalleryImportTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=media_root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        
+        self.robot = Product.objects.create(title='Robot', product_category='Toys', age_group='5+', brand='Acme', description='A robot')
+        self.dog = Product.objects.create(title='Robot Dog', product_category='Toys', age_group='5+', brand='Acme', description='A dog')
+        ProductGallery(
+            product=self.dog, media_type='image', is_primary=True, display_order=3,
+            image=ContentFile(make_image_file().getvalue(), name='existing.jpg')
+        ).save()
+    
+    def test_zip_import_matches_orders_and_queues(self):
+        archive = make_zip({
+            'Robot/front.jpg': make_image_file().getvalue(),
+            'Robot/side.jpg': make_image_file().getvalue(),
+            'Robot Dog_2.jpg': make_image_file().getvalue(),
+            f'{self.robot.id}/demo.mp4': b'\x00\x00\x00\x18ftypmp42' + b'\x00' * 64,
+            'Unknown/thing.jpg': make_image_file().getvalue(),
+            'Robot/notes.txt': b'ignored',
+        })
+        with mock.patch('products.models.encode_video', side_effect=lambda f: (f, {'duration': 7})) as process, \
+             mock.patch('products.models.extract_video_poster', return_value=None):
+            report = import_gallery(archive, workers=2)
+        
+        self.assertEqual((report['created'], report['images'], report['queued']), (4, 3, 1))
+        self.assertEqual([path for path, _ in report['skipped']], ['Unknown/thing.jpg'])
+        self.assertEqual(process.call_count, 1)
+        
+        robot_images = list(self.robot.gallery.filter(media_type='image').order_by('display_order'))
+        self.assertEqual([item.is_primary for item in robot_images], [True, False])
+        self.assertEqual([item.display_order for item in robot_images], [1, 2])
+        self.assertTrue(all(item.image_variants and item.placeholder and item.media_urls for item in robot_images))
+        self.assertEqual(self.robot.gallery.get(media_type='video').video_duration, 7)
+        
+        # The existing primary image keeps its flag; new media goes after it
+        new_dog = self.dog.gallery.get(is_primary=False)
+        self.assertEqual(new_dog.display_order, 4)
+    
+    def test_mapping_csv_sets_primary(self):
+        archive = make_zip({'a.jpg': make_image_file().getvalue(), 'b.jpg': make_image_file().getvalue()})
+        mapping = io.BytesIO(
+            f"file,product,alt_text,is_primary\na.jpg,{self.dog.id},Side view,\nb.jpg,robot dog,Front,yes\n".encode()
+        )
+        report = import_gallery(archive, mapping=mapping, workers=1)
+        
+        self.assertEqual(report['created'], 2)
+        primary = self.dog.gallery.get(is_primary=True)
+        self.assertEqual(primary.alt_text, 'Front')
+        self.assertEqual(self.dog.gallery.filter(media_type='image').count(), 3)
+    
+    def test_import_invalidates_cached_listings(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user(username='buyer', password='pw'))
+        url = reverse('all-products')
+        before = self.client.get(url)
+        archive = make_zip({'Robot/front.jpg': make_image_file().getvalue()})
+        with self.captureOnCommitCallbacks(execute=True):
+            import_gallery(archive, workers=1)
+        
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=before['ETag']).status_code, 200)
+    
+    def test_admin_action_queues_import_without_a_process_pool(self):
+        admin = User.objects.create_superuser(username='admin', password='pw', email='admin@example.com')
+        self.client.force_login(admin)
+        spool = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool, ignore_errors=True)
+        archive = ContentFile(make_zip({'Robot/front.jpg': make_image_file().getvalue()}).getvalue(), name='media.zip')
+        
+        with override_settings(FILE_UPLOAD_TEMP_DIR=spool), \
+             mock.patch('products.gallery_import.ProcessPoolExecutor') as pool:
+            response = self.client.post(reverse('admin:products_product_changelist'), {
+                'action': 'import_gallery_media', '_selected_action': [self.robot.pk], 'apply': '1', 'archive': archive,
+            })
+        
+        self.assertEqual(response.status_code, 302)
+        pool.assert_not_called()
+        self.assertEqual(self.robot.gallery.filter(media_type='image').count(), 1)
+        self.assertEqual(os.listdir(spool), [])
+
+
+@override_settings(STORAGES=LOCAL_STORAGES)
+class ReprocessMediaTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=media_root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.checkpoint = os.path.join(media_root, 'checkpoint.json')
+        
+        self.products = []
+        for title in ('Old', 'Older', 'Done'):
+            product = Product(title=title, product_category='Toys', age_group='5+', brand='Acme', description=title)
+            product.flicks = ContentFile(b'video', name=f'{title}.mp4')
+            product.save(no_process=True)
+            self.products.append(product)
+        Product.objects.filter(title='Done').update(video_duration=20, video_codec='h264', video_height=720)
+    
+    def run_command(self, *args):
+        out = io.StringIO()
+        call_command('reprocess_media', '--model', 'product', '--missing-duration', '--workers', '0',
+                     '--checkpoint', self.checkpoint, *args, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+    
+    def test_dry_run_estimates_from_metadata(self):
+        out = self.run_command('--dry-run')
+        self.assertIn('products.product: 2 videos', out)
+        self.assertIn('2 with unknown duration', out)
+        self.assertFalse(os.path.exists(self.checkpoint))
+    
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        metadata = {'duration': 14, 'codec': 'h264', 'height': 1080, 'encoded': True}
+        calls = []
+        def encode(f):
+            calls.append(f.name)
+            if 'Older' in f.name and len(calls) == 2:
+                raise RuntimeError('encoder crashed')
+            return f, metadata
+        
+        with mock.patch('products.models.encode_video', side_effect=encode), \
+             mock.patch('products.models.extract_video_poster', return_value=None):
+            self.run_command()
+            self.assertEqual(len(calls), 2)
+            self.run_command()
+        
+        # The finished item is not encoded again
+        self.assertEqual(len(calls), 3)
+        old = Product.objects.get(title='Old')
+        self.assertEqual((old.video_duration, old.video_codec, old.video_height), (14, 'h264', 1080))
+        self.assertIsNotNone(old.video_processed_at)
+        self.assertEqual(Product.objects.filter(video_duration__isnull=True).count(), 0)
+        with open(self.checkpoint) as f:
+            self.assertEqual(json.load(f)['failed'], {'products.product': {}})
+    
+    def test_checkpoint_from_other_selection_is_refused(self):
+        with mock.patch('products.models.encode_video', side_effect=lambda f: (f, {})), \
+             mock.patch('products.models.extract_video_poster', return_value=None):
+            self.run_command('--processed-before', '2020-01-01')
+        with self.assertRaises(CommandError):
+            self.run_command()
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='buyer', password='pw'))
+        # Duplicate titles make the id tiebreaker matter
+        for i in range(7):
+            Product(
+                title=f'Toy {i % 3}', product_category='Toys', age_group='5+', gender='M' if i % 2 else 'F',
+                brand='Acme', description='A toy'
+            ).save(no_process=True)
+    
+    def walk(self, url, **params):
+        ids, cursor = [], None
+        while True:
+            response = self.client.get(url, {**params, 'page_size': 3, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            ids.extend(item['id'] for item in response.data['results'])
+            cursor = response.data['next_cursor']
+            if not cursor:
+                self.assertFalse(response.data['has_more'])
+                return ids
+    
+    def test_cursor_walks_every_sort_without_gaps(self):
+        for sort, ordering in (('id', ['id']), ('-title', ['-title', '-id']), ('brand', ['brand', 'id'])):
+            with self.subTest(sort=sort):
+                expected = list(Product.objects.order_by(*ordering).values_list('id', flat=True))
+                self.assertEqual(self.walk(reverse('all-products'), sort=sort), expected)
+    
+    def test_brand_sort_stays_on_indexed_text(self):
+        odd = Product(title='Odd', product_category='Toys', age_group='5+', brand='Zeta', description='A toy')
+        odd.save(no_process=True)
+        # Renaming the term changes what listings show, not where the product sorts
+        Brand.objects.filter(pk=odd.brand_ref_id).update(name='Aardvark')
+        self.assertEqual(self.walk(reverse('all-products'), sort='brand')[-1], odd.id)
+        self.assertEqual(self.walk(reverse('all-products'), sort='-brand')[0], odd.id)
+    
+    def test_filtered_and_search_listings(self):
+        expected = list(Product.objects.filter(gender='M').order_by('id').values_list('id', flat=True))
+        self.assertEqual(self.walk(reverse('filter-products'), gender='M'), expected)
+        self.assertEqual(len(self.walk(reverse('search-products'), q='toy')), 7)
+    
+    def test_bad_or_mismatched_cursor_is_rejected(self):
+        url = reverse('all-products')
+        cursor = self.client.get(url, {'page_size': 3}).data['next_cursor']
+        self.assertEqual(self.client.get(url, {'cursor': 'not-a-cursor'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'cursor': cursor, 'sort': 'title'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'sort': 'description'}).status_code, 400)
+    
+    def test_counts_are_cached_per_filter(self):
+        url = reverse('filter-products')
+        self.assertEqual(self.client.get(url, {'gender': 'M'}).data['count'], 3)
+        Product(title='New', product_category='Toys', age_group='5+', gender='M', brand='Acme',
+                description='A toy').save(no_process=True)
+        self.assertEqual(self.client.get(url, {'gender': 'M'}).data['count'], 3)
+        self.assertEqual(self.client.get(url, {'gender': 'F'}).data['count'], 4)
+    
+    @override_settings(SEARCH_COUNT_LIMIT=5)
+    def test_search_count_stops_at_limit(self):
+        url = reverse('search-products')
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(url, {'q': 'toy', 'page_size': 3}).data
+        self.assertEqual((data['count'], data['count_capped']), (5, True))
+        self.assertTrue(any('COUNT(*)' in q['sql'] and 'LIMIT 5' in q['sql'] for q in queries.captured_queries))
+        # Title matches rank first, ordered in SQL
+        with self.captureOnCommitCallbacks(execute=True):
+            Product(title='Plain', product_category='Toys', age_group='5+', brand='Acme',
+                    description='Not a toy').save(no_process=True)
+        self.assertEqual(self.client.get(url, {'q': 'toy', 'page_size': 10}).data['results'][-1]['title'], 'Plain')
+        self.assertEqual(len(self.walk(url, q='toy')), 8)
+        data = self.client.get(url, {'q': 'plain'}).data
+        self.assertEqual((data['count'], data['count_capped']), (1, False))
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='buyer', password='pw'))
+        # Committed, so the new category terms reach the taxonomy maps
+        with self.captureOnCommitCallbacks(execute=True):
+            for gender, age, category in (
+                ('M', '3-5 Years', 'Toys'), ('M', '5-7 Years', 'Toys'), ('F', '3-5 Years', 'Toys'),
+                ('F', '3-5 Years', 'Books'), ('U', '', 'Games'),
+            ):
+                Product(title='Item', product_category=category, age_group='5+', standardized_age=age,
+                        gender=gender, brand='Acme', description='').save(no_process=True)
+    
+    def test_each_facet_ignores_its_own_filter(self):
+        with self.assertNumQueries(1):
+            facets = facet_counts({'gender': 'M', 'age_group': '3-5 Years'})
+        self.assertEqual(facets['gender'], {'M': 1, 'F': 2, 'U': 0})
+        self.assertEqual(facets['age_group'], {
+            '0-18 Months': 0, '18-36 Months': 0, '3-5 Years': 1, '5-7 Years': 1, '7-12 Years': 0, '12+ Years': 0
+        })
+        self.assertEqual(facets['category'], {'Toys': 1})
+        self.assertEqual(facet_counts({})['category'], {'Toys': 3, 'Books': 1, 'Games': 1})
+        with self.assertNumQueries(0):
+            facet_counts({'age_group': '3-5 Years', 'gender': 'M'})
+    
+    def test_filter_response_and_categories(self):
+        data = self.client.get(reverse('filter-products'), {'category': 'Toys', 'page_size': 2}).data
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['facets']['gender'], {'M': 2, 'F': 1, 'U': 0})
+        self.assertEqual(data['facets']['category'], {'Toys': 3, 'Books': 1, 'Games': 1})
+        self.assertEqual(self.client.get(reverse('product-categories')).data, ['Toys', 'Books', 'Games'])
+
+
+class TaxonomyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='buyer', password='pw'))
+    
+    def product(self, category, brand='Acme'):
+        product = Product(title='Item', product_category=category, age_group='5+', gender='U',
+                          brand=brand, description='')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save(no_process=True)
+        return product
+    
+    def test_spellings_resolve_to_one_term(self):
+        term_id = Category.resolve('Toys & Games')
+        self.assertEqual(Category.resolve('toys and games'), term_id)
+        self.assertEqual(Category.resolve(' TOYS-AND-GAMES '), term_id)
+        self.assertIsNone(Category.resolve(''))
+        self.assertEqual(Category.objects.get().name, 'Toys & Games')
+        # Aliases typed in the admin are stored normalized
+        with self.captureOnCommitCallbacks(execute=True):
+            CategoryAlias.objects.create(key='Games/Toys', term_id=term_id)
+        self.assertEqual(taxonomy.lookup('category', 'games toys'), term_id)
+    
+    def test_maps_reload_once_the_write_commits(self):
+        taxonomy.load_maps()
+        with transaction.atomic():
+            rolled_back = Brand.resolve('Rolled Back')
+            transaction.set_rollback(True)
+        self.assertIsNone(taxonomy.name('brand', rolled_back))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            committed = Brand.resolve('Committed')
+            self.assertIsNone(taxonomy.name('brand', committed))
+        self.assertEqual(taxonomy.name('brand', committed), 'Committed')
+    
+    def test_products_show_and_filter_by_canonical_name(self):
+        self.product('Toys & Games')
+        self.product('toys and games', brand='ACME')
+        self.product('Books')
+        self.assertEqual(Product.objects.values('category_ref').distinct().count(), 2)
+        self.assertEqual(Product.objects.values('brand_ref').distinct().count(), 1)
+        data = self.client.get(reverse('filter-products'), {'category': 'TOYS AND GAMES'}).data
+        self.assertEqual(data['count'], 2)
+        self.assertEqual({row['product_category'] for row in data['results']}, {'Toys & Games'})
+        self.assertEqual(data['facets']['category'], {'Toys & Games': 2, 'Books': 1})
+        self.assertEqual(self.client.get(reverse('filter-products'), {'category': 'Unknown'}).data['count'], 0)
+        
+        # Renaming the term renames it everywhere, products keep their text
+        Category.objects.filter(name='Books').update(name='Reading')
+        taxonomy.load_maps()
+        cache.clear()
+        self.assertEqual(self.client.get(reverse('product-categories')).data, ['Toys & Games', 'Reading'])
+    
+    def test_backfill_links_existing_products(self):
+        Product.objects.bulk_create([
+            Product(title='Item', product_category=category, age_group='5+', gender='U', brand='Acme', description='')
+            for category in ('toys', 'Toys', 'Toys', 'Puzzles', 'jigsaws')
+        ])
+        aliases = os.path.join(tempfile.mkdtemp(), 'aliases.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(aliases))
+        with open(aliases, 'w') as f:
+            json.dump({'category': {'Puzzles': ['Jigsaws']}}, f)
+        
+        with self.captureOnCommitCallbacks() as callbacks:
+            call_command('backfill_taxonomy', '--batch-size', '2', '--aliases', aliases, stdout=io.StringIO())
+        # One load_maps() at the end instead of a reload per term created
+        self.assertFalse([callback for callback in callbacks if callback.__module__ == 'products.taxonomy'])
+        self.assertEqual(taxonomy.name('category', Category.objects.get(name='Puzzles').pk), 'Puzzles')
+        self.assertFalse(Product.objects.filter(category_ref__isnull=True).exists())
+        # The commonest spelling names the term
+        self.assertEqual(sorted(Category.objects.values_list('name', flat=True)), ['Puzzles', 'Toys'])
+        self.assertEqual(Product.objects.filter(category_ref__name='Puzzles').count(), 2)
+        self.assertEqual(Brand.objects.get().products.count(), 5)
+
+
+class InvertedIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = InvertedIndex()
+        self.index.add(1, [('Racing Car', 3), ('A fast toy with a dinosaur sticker', 1)])
+        self.index.add(2, [('Dinosaur Puzzle', 3), ('Wooden puzzle', 1)])
+        self.index.add(3, [('Building Blocks', 3), ('Colourful bricks', 1)])
+    
+    def ids(self, query, **kwargs):
+        return [doc_id for _, doc_id in self.index.search(query, 10, **kwargs)[0]]
+    
+    def test_title_weight_and_prefix_matching(self):
+        self.assertEqual(self.ids('dinosaur'), [2, 1])
+        self.assertEqual(self.ids('dino'), [2, 1])
+        self.assertEqual(self.ids('dino', prefix=False), [])
+        self.assertEqual(self.ids('BRICK'), [3])
+    
+    def test_updates_and_removals(self):
+        self.index.add(2, [('Jigsaw', 3), ('Wooden puzzle', 1)])
+        self.index.remove(3)
+        self.assertEqual(self.ids('dinosaur'), [1])
+        self.assertEqual(self.ids('jigsaw'), [2])
+        self.assertEqual(self.ids('blocks'), [])
+        self.assertEqual(len(self.index), 2)
+        self.assertAlmostEqual(self.index.dead_ratio, 0.5)
+    
+    def test_paging_continues_after_last_result(self):
+        first, total = self.index.search('dinosaur', 1)
+        rest, _ = self.index.search('dinosaur', 10, after=first[-1])
+        self.assertEqual(total, 2)
+        self.assertEqual([doc_id for _, doc_id in first + rest], [2, 1])
+
+
+@override_settings(SEARCH_BACKEND='memory')
+class MemorySearchBackendTests(TestCase):
+    def setUp(self):
+        reset_search_index()
+        self.addCleanup(reset_search_index)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='buyer', password='pw'))
+        self.maker = Manufacturer.objects.create(name='Lego Group', email='l@example.com', phone='1', address='1 St')
+        for title, description in (('Racing Car', 'Has a dinosaur sticker'), ('Dinosaur Puzzle', 'Wooden')):
+            Product(
+                title=title, description=description, brand='Acme', product_category='Toys',
+                age_group='5+', manufacturer=self.maker
+            ).save(no_process=True)
+    
+    def search(self, q, **params):
+        response = self.client.get(reverse('search-products'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+    
+    def test_ranked_paged_search(self):
+        first = self.search('dino', page_size=1)
+        self.assertEqual([item['title'] for item in first['results']], ['Dinosaur Puzzle'])
+        self.assertEqual(first['count'], 2)
+        rest = self.search('dino', page_size=1, cursor=first['next_cursor'])
+        self.assertEqual([item['title'] for item in rest['results']], ['Racing Car'])
+        self.assertFalse(rest['has_more'])
+    
+    def test_index_follows_committed_writes(self):
+        self.search('lego')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product(title='Dinosaur Egg', description='Hatches', brand='Acme', product_category='Toys',
+                    age_group='5+').save(no_process=True)
+            Product.objects.get(title='Racing Car').delete()
+            self.maker.name = 'Brickworks'
+            self.maker.save()
+        
+        self.assertEqual([item['title'] for item in self.search('dinosaur')['results']],
+                         ['Dinosaur Egg', 'Dinosaur Puzzle'])
+        self.assertEqual(self.search('lego')['count'], 0)
+        self.assertEqual(self.search('brickworks')['count'], 1)
+    
+    def test_stale_index_is_searched_while_another_request_rebuilds(self):
+        index = memory_search.get_index()
+        with override_settings(SEARCH_INDEX_MAX_AGE=0), memory_search._build_lock:
+            self.assertIs(memory_search.get_index(), index)
+    
+    def test_writes_during_a_rebuild_reach_the_new_index(self):
+        racing = Product.objects.get(title='Racing Car')
+        build = memory_search.build_index
+        
+        def build_then_write():
+            index = build()
+            # Committed by another request while the table was being read
+            Product.objects.filter(pk=racing.pk).update(title='Dinosaur Kart')
+            memory_search.reindex(Product.objects.filter(pk=racing.pk))
+            return index
+        
+        with mock.patch('products.search.memory.build_index', side_effect=build_then_write):
+            index = memory_search.get_index()
+        self.assertEqual(index.search('kart', 10)[1], 1)
+
+
+class SearchResultCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='buyer', password='pw'))
+        for title in ('Robot Toy', 'Toy Robot Dog', 'Racing Car'):
+            Product(title=title, product_category='Toys', age_group='5+', brand='Acme').save(no_process=True)
+    
+    def search(self, q, **params):
+        response = self.client.get(reverse('search-products'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['title'] for item in response.data['results']]
+    
+    def test_normalized_queries_share_cached_ids_and_cards(self):
+        first = self.search('robot toy')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search('ROBOT  toy '), first)
+        # Another page size is another entry, but its count and cards are cached
+        with self.assertNumQueries(1):
+            self.search('robot toy', page_size=1)
+        stats = catalog_cache.cache_stats()
+        self.assertEqual((stats['search']['hits'], stats['search']['misses']), (1, 2))
+        self.assertEqual((stats['cards']['hits'], stats['cards']['misses']), (4, 3))
+    
+    def test_query_operators_are_part_of_the_key(self):
+        keys = {
+            catalog_cache.search_key(query, 1, 20, None)
+            for query in ('robot toy', 'Robot  TOY', 'toy robot', '-robot toy', '"robot toy"', 'robot or toy')
+        }
+        self.assertEqual(len(keys), 5)
+        # The memory backend ignores order and operators, so they share its key
+        with override_settings(SEARCH_BACKEND='memory'):
+            self.assertEqual(
+                catalog_cache.search_key('toy, Robot', 1, 20, None), catalog_cache.search_key('robot toy', 1, 20, None)
+            )
+    
+    def test_committed_writes_invalidate(self):
+        self.assertEqual(self.search('robot'), ['Robot Toy', 'Toy Robot Dog'])
+        version = catalog_cache.catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.get(title='Racing Car')
+            product.title = 'Racing Robot'
+            product.save(no_process=True)
+        self.assertEqual(catalog_cache.catalog_version(), version + 1)
+        self.assertEqual(self.search('robot'), ['Robot Toy', 'Toy Robot Dog', 'Racing Robot'])
+        
+        # An uncommitted write changes nothing
+        with transaction.atomic():
+            Product.objects.get(title='Robot Toy').delete()
+            transaction.set_rollback(True)
+        self.assertEqual(catalog_cache.catalog_version(), version + 1)
+        
+        # Bulk writes send no signals; bulk_written() bumps once they commit
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(title='Racing Robot').update(title='Racing Car')
+            catalog_cache.bulk_written()
+            self.assertEqual(catalog_cache.catalog_version(), version + 1)
+        self.assertEqual(self.search('robot'), ['Robot Toy', 'Toy Robot Dog'])
+    
+    def test_stats_are_staff_only(self):
+        self.search('robot')
+        url = reverse('search-cache-stats')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_authenticate(User.objects.create_user(username='staff', password='pw', is_staff=True))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['search'], {'hits': 0, 'misses': 1, 'hit_rate': 0.0})
+
+
+class FeaturedResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='buyer', password='pw'))
+        self.products = []
+        for title in ('Kite', 'Drone', 'Robot'):
+            product = Product(title=title, product_category='Toys', age_group='5+', brand='Acme', description='')
+            product.save(no_process=True)
+            self.products.append(product)
+    
+    def titles(self, name='trending-products'):
+        return [item['title'] for item in self.client.get(reverse(name)).json()]
+    
+    def test_hits_run_no_queries(self):
+        self.assertEqual(self.titles(), ['Robot', 'Drone', 'Kite'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles(), ['Robot', 'Drone', 'Kite'])
+        self.assertEqual(catalog_cache.cache_stats()['featured'], {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+    
+    def test_featured_and_product_writes_replace_the_body(self):
+        self.assertEqual(self.titles('top-products'), ['Robot', 'Drone', 'Kite'])
+        with self.captureOnCommitCallbacks(execute=True):
+            FeaturedProduct.objects.create(product=self.products[0], featured_type='top')
+        self.assertEqual(self.titles('top-products'), ['Kite'])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].title = 'Box Kite'
+            self.products[0].save(no_process=True)
+        self.assertEqual(self.titles('top-products'), ['Box Kite'])
+        
+        admin = User.objects.create_superuser(username='admin', password='pw', email='admin@example.com')
+        self.client.force_login(admin)
+        ids = f'{self.products[2].id},{self.products[1].id}'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:save-featured-products'), {'top_ids': ids, 'trending_ids': ''})
+        self.assertEqual(self.titles('top-products'), ['Robot', 'Drone'])
+    
+    def test_concurrent_miss_waits_for_the_rebuild(self):
+        cache.add('demo:lock', 1)
+        threading.Timer(0.1, cache.set, args=('demo', b'built elsewhere')).start()
+        build = mock.Mock(return_value=b'built here')
+        self.assertEqual(catalog_cache.single_flight('demo', build, 60), (b'built elsewhere', True))
+        build.assert_not_called()
+        self.assertEqual(catalog_cache.single_flight('other', build, 60), (b'built here', False))
+        self.assertIsNone(cache.get('other:lock'))
+    
+    @override_settings(REBUILD_LOCK_SECONDS=0.1)
+    def test_waiter_that_gives_up_leaves_the_lock_alone(self):
+        cache.add('demo:lock', 'builder')
+        build = mock.Mock(return_value=b'built here')
+        self.assertEqual(catalog_cache.single_flight('demo', build, 60), (b'built here', False))
+        self.assertEqual(cache.get('demo:lock'), 'builder')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='buyer', password='pw'))
+        self.product = Product(title='Kite', product_category='Toys', age_group='5+', brand='Acme', description='')
+        self.product.save(no_process=True)
+        self.item = ProductGallery.objects.create(product=self.product, media_urls={'image': '/media/kite.jpg'})
+    
+    def revalidate(self, url, response, **params):
+        return self.client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+    
+    def test_unchanged_resources_are_not_modified(self):
+        urls = [
+            reverse('product-detail', args=[self.product.id]), reverse('all-products'),
+            reverse('trending-products'), reverse('product-categories'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response['ETag'].startswith('W/"'))
+                # Listings are validated from the cache, the product by one aggregate query
+                with self.assertNumQueries(1 if url == urls[0] else 0):
+                    not_modified = self.revalidate(url, response)
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(not_modified.content, b'')
+                since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(since.status_code, 304)
+        
+        first = self.client.get(urls[1], {'page_size': 1})
+        self.assertEqual(self.revalidate(urls[1], first, page_size=1).status_code, 304)
+        self.assertEqual(self.revalidate(urls[1], first, page_size=2).status_code, 200)
+    
+    def test_writes_change_the_validators(self):
+        detail = reverse('product-detail', args=[self.product.id])
+        listing = reverse('all-products')
+        before = {url: self.client.get(url) for url in (detail, listing)}
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.delete()
+        for url, response in before.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.revalidate(url, response).status_code, 200)
+        
+        trending = reverse('trending-products')
+        response = self.client.get(trending)
+        with self.captureOnCommitCallbacks(execute=True):
+            FeaturedProduct.objects.create(product=self.product, featured_type='trending')
+        self.assertEqual(self.revalidate(trending, response).status_code, 200)
+    
+    def test_missing_products_and_anonymous_clients(self):
+        missing = reverse('product-detail', args=[self.product.id + 100])
+        self.assertEqual(self.client.get(missing, HTTP_IF_NONE_MATCH='*').status_code, 404)
+        response = self.client.get(reverse('product-detail', args=[self.product.id]))
+        self.client.force_authenticate(None)
+        # Permissions are checked before validators
+        self.assertEqual(self.revalidate(reverse('product-detail', args=[self.product.id]), response).status_code, 401)
+
+
+class PrefixIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = PrefixIndex(build_snapshot([
+            Suggestion('Wooden Robot Kit', 'product', 1, 50),
+            Suggestion('Robot Dog', 'product', 2, 80),
+            Suggestion('Roboworks', 'brand', 0, 10),
+            Suggestion('Racing Car', 'product', 3, 80),
+        ], built_at=1.0))
+    
+    def texts(self, query, limit=10):
+        return [suggestion.text for suggestion in self.index.suggest(query, limit)]
+    
+    def test_prefix_of_any_word_ranked_by_weight(self):
+        self.assertEqual(self.texts('robo'), ['Robot Dog', 'Wooden Robot Kit', 'Roboworks'])
+        self.assertEqual(self.texts('R'), ['Racing Car', 'Robot Dog', 'Wooden Robot Kit', 'Roboworks'])
+        self.assertEqual(self.texts('wooden  rob'), ['Wooden Robot Kit'])
+        self.assertEqual(self.texts('robot k'), ['Wooden Robot Kit'])
+        self.assertEqual(self.texts('kit robot'), [])
+        self.assertEqual(self.texts('robo', limit=1), ['Robot Dog'])
+        self.assertEqual(self.index.suggest('robot d')[0], Suggestion('Robot Dog', 'product', 2, 80))
+    
+    def test_broad_prefixes_use_precomputed_best(self):
+        count = PREFIX_SCAN_LIMIT * 4
+        index = PrefixIndex(build_snapshot(
+            [Suggestion(f'Toy {i:04d} Train', 'product', i + 1, i) for i in range(count)], built_at=1.0
+        ))
+        self.assertTrue(len(index.prefixes))
+        best = [f'Toy {i:04d} Train' for i in range(count - 1, count - 4, -1)]
+        for query in ('t', 'to', 'toy', 'train', 'toy 07'):
+            with self.subTest(query=query):
+                expected = best if query != 'toy 07' else [f'Toy {i:04d} Train' for i in (799, 798, 797)]
+                self.assertEqual([s.text for s in index.suggest(query, 3)], expected)
+        self.assertEqual(PrefixIndex(build_snapshot([], built_at=1.0)).suggest('toy'), [])
+
+
+class SuggestTests(TestCase):
+    def setUp(self):
+        snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, snapshot_dir, ignore_errors=True)
+        overrides = override_settings(SUGGEST_INDEX_PATH=os.path.join(snapshot_dir, 'suggest.idx'))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        suggest.reset_index()
+        self.addCleanup(suggest.reset_index)
+        
+        maker = Manufacturer.objects.create(name='Lego Group', email='l@example.com', phone='1', address='1 St')
+        for title, brand, views in (('Robot Dog', 'Acme', 5), ('Rocket Ship', 'Lego', 20), ('Racing Car', 'Acme', 1)):
+            product = Product(title=title, brand=brand, product_category='Toys', age_group='5+', manufacturer=maker)
+            product.save(no_process=True)
+            FlicksAnalytics.objects.create(product=product, views=views)
+    
+    def suggestions(self, q, **params):
+        response = self.client.get(reverse('suggest-products'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(item['text'], item['type']) for item in response.data['suggestions']]
+    
+    def test_suggestions_weighted_by_views(self):
+        self.assertEqual(self.suggestions('ro'), [('Rocket Ship', 'product'), ('Robot Dog', 'product')])
+        # Brands and manufacturers add up the views of their products
+        self.assertEqual(self.suggestions('l'), [('Lego Group', 'manufacturer'), ('Lego', 'brand')])
+        self.assertEqual(self.suggestions('toys'), [('Toys', 'category')])
+        self.assertEqual(self.suggestions('r', limit=2), [('Rocket Ship', 'product'), ('Robot Dog', 'product')])
+        self.assertEqual(self.client.get(reverse('suggest-products'), {'q': ' '}).status_code, 400)
+    
+    def test_writes_reach_overlay_before_rebuild(self):
+        self.suggestions('ro')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(title='Rocket Ship').get().delete()
+            robot = Product.objects.get(title='Robot Dog')
+            robot.title = 'Robotic Dog'
+            robot.save(no_process=True)
+            Product(title='Rope Ladder', product_category='Toys', age_group='5+').save(no_process=True)
+        self.assertEqual(self.suggestions('ro'), [('Robotic Dog', 'product'), ('Rope Ladder', 'product')])
+        
+        # A fresh snapshot includes them and empties the overlay
+        with override_settings(SUGGEST_INDEX_MAX_AGE=0):
+            self.assertEqual(self.suggestions('ro'), [('Robotic Dog', 'product'), ('Rope Ladder', 'product')])
+        self.assertEqual(suggest._state['overlay'], {})
+    
+    def test_overlay_needs_an_index_and_is_capped(self):
+        robot = Product.objects.get(title='Robot Dog')
+        with self.assertNumQueries(0):
+            suggest.product_changed(robot.pk)
+        self.assertEqual(suggest._state['overlay'], {})
+        
+        self.suggestions('ro')
+        with override_settings(SUGGEST_OVERLAY_MAX=1):
+            suggest.product_changed(robot.pk)
+            suggest.product_changed(Product.objects.get(title='Racing Car').pk)
+            self.assertEqual(len(suggest._state['overlay']), 2)
+            # Past the cap the next request rebuilds the snapshot instead
+            self.suggestions('ro')
+        self.assertEqual(suggest._state['overlay'], {})
+    
+    def test_overlay_hiding_too_much_forces_a_rebuild(self):
+        zebras = [
+            Product.objects.create(title=f'Zebra {i}', product_category='Toys', age_group='5+', brand='Acme')
+            for i in range(25)
+        ]
+        self.suggestions('zebra')
+        # Hiding the snapshot's whole top 20 leaves nothing known to rank above the rest
+        for product in zebras:
+            suggest.product_removed(product.pk)
+        self.assertEqual(self.suggestions('zebra'), [])
+        self.assertTrue(suggest._state['rebuild'])
+        self.assertEqual(len(self.suggestions('zebra', limit=10)), 10)
+        self.assertFalse(suggest._state['rebuild'])
+    
+    def test_snapshot_is_shared_through_the_file(self):
+        self.suggestions('ro')
+        path = settings.SUGGEST_INDEX_PATH
+        self.assertTrue(os.path.exists(path))
+        # Another worker replacing the file is picked up without a rebuild
+        Product(title='Rowing Boat', product_category='Toys', age_group='5+').save(no_process=True)
+        suggest.write_index(path)
+        with self.assertNumQueries(0):
+            self.assertIn(('Rowing Boat', 'product'), self.suggestions('row'))
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'full-text search needs PostgreSQL')
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='buyer', password='pw'))
+        self.maker = Manufacturer.objects.create(name='Lego Group', email='l@example.com', phone='1', address='1 St')
+        for title, brand, description in (
+            ('Racing Car', 'Speedy', 'A fast toy with a dinosaur sticker'),
+            ('Dinosaur Puzzle', 'Acme', 'Wooden puzzle'),
+            ('Building Blocks', 'Acme', 'Colourful bricks'),
+        ):
+            Product.objects.create(
+                title=title, brand=brand, description=description, product_category='Toys',
+                age_group='5+', manufacturer=self.maker
+            )
+    
+    def search(self, q):
+        response = self.client.get(reverse('search-products'), {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [item['title'] for item in response.data['results']]
+    
+    def test_title_matches_outrank_description_matches(self):
+        self.assertEqual(self.search('dinosaur'), ['Dinosaur Puzzle', 'Racing Car'])
+    
+    def test_stemming_and_typos(self):
+        self.assertEqual(self.search('puzzles'), ['Dinosaur Puzzle'])
+        self.assertEqual(self.search('Buildng Blocks'), ['Building Blocks'])
+    
+    def test_manufacturer_rename_updates_vectors(self):
+        self.maker.name = 'Brickworks'
+        self.maker.save()
+        self.assertEqual(len(self.search('brickworks')), 3)
+
+
+def seed_catalog(count, owner, start=0):
+    """
+    Add count products shaped like production data
+
+    Each product has a manufacturer, a flick, two gallery images, analytics
+    and view sessions; every other one is featured, and a shop with two
+    helpers is added per five products.
+    """
+    for i in range(start, start + count):
+        manufacturer = Manufacturer.objects.create(
+            name=f'Maker {i}', email=f'maker{i}@example.com', phone='1', address='1 St'
+        )
+        product = Product(
+            title=f'Toy {i}', product_category=f'Category {i % 3}', age_group='5+',
+            standardized_age='5-7 Years', gender='U', brand='Acme', description='A toy robot',
+            manufacturer=manufacturer, flicks=f'products/flicks/{i}.mp4',
+            media_urls={'flicks': f'/media/products/flicks/{i}.mp4'}
+        )
+        product.save(no_process=True)
+        ProductGallery.objects.bulk_create([
+            ProductGallery(product=product, media_type='image', is_primary=True,
+                           media_urls={'image': f'/media/{i}-a.jpg'}),
+            ProductGallery(product=product, media_type='image', display_order=1,
+                           media_urls={'image': f'/media/{i}-b.jpg'}),
+        ])
+        FlicksAnalytics.objects.create(product=product, views=i, total_watch_time=i * 10)
+        ViewSession.objects.bulk_create([
+            ViewSession(product=product, session_id=f'seed-{i}-{n}', completed=bool(n)) for n in range(2)
+        ])
+        if i % 2 == 0:
+            FeaturedProduct.objects.create(product=product, featured_type='trending', display_order=i)
+            FeaturedProduct.objects.create(product=product, featured_type='top', display_order=i)
+        if i % 5 == 0:
+            shop = Shop(name=f'Shop {i}', address='1 St', phone='123', email=f'shop{i}@example.com', owner=owner)
+            shop.save(no_process=True)
+            shop.helpers.add(*(
+                User.objects.create_user(username=f'helper-{i}-{n}', password='pw') for n in range(2)
+            ))
+
+
+@override_settings(
+    STORAGES=LOCAL_STORAGES,
+    # Seeding creates dozens of users; the default hasher dominates runtime
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class QueryBudgetTests(TestCase):
+    """
+    Query count of every API route and admin changelist, at two data sizes
+
+    A request may make at most its budget of queries, and exactly as many
+    against the large catalog (with a larger page) as against the small
+    one, so a per-row query fails here even when it fits the budget.
+    """
+    SMALL, LARGE = 5, 25
+    
+    # Most queries each route in products/urls.py may make
+    ROUTE_BUDGETS = {
+        'api-documentation': 0,
+        'register-shop-with-owner': 8,
+        'register-shop-helper': 5,
+        'login': 1,
+        'store-info': 3,
+        'inventory': 0,
+        'staff': 0,
+        'subscription': 0,
+        'shop-banner': 2,
+        'all-products': 3,
+        'trending-products': 3,
+        'top-products': 3,
+        'filter-products': 4,
+        'product-detail': 3,
+        'search-products': 4,
+        'search-cache-stats': 0,
+        'suggest-products': 1,
+        'product-categories': 1,
+        'flicks-feed': 0,
+        'distributors': 0,
+        'brands': 0,
+        'user-profile': 2,
+        'start-view': 2,
+        'end-view': 5,
+        'create-upload': 2,
+        'upload-detail': 1,
+        'create-upload-intent': 2,
+        'complete-upload-intent': 2,
+        'api-overview': 0,
+    }
+    
+    # Status each route's request below must get, where it isn't 200
+    ROUTE_STATUSES = {
+        'register-shop-with-owner': 201,
+        'register-shop-helper': 201,
+        'start-view': 201,
+        'create-upload': 201,
+        'create-upload-intent': 201,
+        'complete-upload-intent': 202,
+    }
+    
+    # Direct uploads need S3 storage, with the bucket stubbed out
+    S3_ROUTES = {'create-upload-intent', 'complete-upload-intent'}
+    
+    # Most queries each products admin changelist may make, session and user included
+    ADMIN_BUDGETS = {
+        'manufacturer': 5,
+        'product': 7,
+        'distributor': 5,
+        'shop': 5,
+        'shopuser': 5,
+        'featuredproduct': 5,
+        'category': 5,
+        'brand': 5,
+    }
+    
+    def setUp(self):
+        upload_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, upload_root, ignore_errors=True)
+        overrides = override_settings(
+            RESUMABLE_UPLOAD_ROOT=upload_root, SUGGEST_INDEX_PATH=os.path.join(upload_root, 'suggest.idx')
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        
+        self.admin = User.objects.create_superuser(username='admin', password='pw', email='admin@example.com')
+        self.owner = User.objects.create_user(username='owner', password='pw', role=User.OWNER)
+        self.rounds = 0
+    
+    def route_request(self, name, page_size):
+        """(method, url, data, user) exercising a route against the current data"""
+        product = Product.objects.order_by('id').first()
+        suffix = f'{self.rounds}-{page_size}'
+        requests = {
+            'api-documentation': lambda: ('get', reverse(name), {}, None),
+            'register-shop-with-owner': lambda: ('post', reverse(name), {
+                'shop_name': 'New Shop', 'shop_address': '1 St', 'shop_phone': '123',
+                'shop_email': f'new-{suffix}@example.com', 'owner_username': f'new-owner-{suffix}',
+                'owner_email': f'new-owner-{suffix}@example.com', 'owner_password': 'pw',
+                'owner_first_name': 'New', 'owner_last_name': 'Owner',
+            }, None),
+            'register-shop-helper': lambda: ('post', reverse(name), {
+                'username': f'new-helper-{suffix}', 'email': f'new-helper-{suffix}@example.com',
+                'password': 'pw', 'first_name': 'New', 'last_name': 'Helper',
+                'shop_id': Shop.objects.first().id, 'invitation_code': 'code',
+            }, None),
+            'login': lambda: ('post', reverse(name), {'username': 'owner', 'password': 'pw'}, None),
+            'store-info': lambda: ('get', reverse(name), {}, self.owner),
+            'inventory': lambda: ('get', reverse(name), {}, self.owner),
+            'staff': lambda: ('get', reverse(name), {}, self.owner),
+            'subscription': lambda: ('get', reverse(name), {}, self.owner),
+            'shop-banner': lambda: ('get', reverse(name), {}, self.owner),
+            'all-products': lambda: ('get', reverse(name), {'page_size': page_size}, None),
+            'trending-products': lambda: ('get', reverse(name), {}, self.owner),
+            'top-products': lambda: ('get', reverse(name), {}, self.owner),
+            'filter-products': lambda: ('get', reverse(name), {'gender': 'U'}, self.owner),
+            'product-detail': lambda: ('get', reverse(name, args=[product.id]), {}, self.owner),
+            'search-products': lambda: ('get', reverse(name), {'q': 'toy robot', 'page_size': page_size}, self.owner),
+            'search-cache-stats': lambda: ('get', reverse(name), {}, self.admin),
+            'suggest-products': lambda: ('get', reverse(name), {'q': 'toy', 'limit': page_size}, None),
+            'product-categories': lambda: ('get', reverse(name), {}, None),
+            'flicks-feed': lambda: ('get', reverse(name), {}, self.owner),
+            'distributors': lambda: ('get', reverse(name), {}, self.owner),
+            'brands': lambda: ('get', reverse(name), {}, self.owner),
+            'user-profile': lambda: ('get', reverse(name), {}, self.owner),
+            'start-view': lambda: ('post', reverse(name), {'product_id': product.id}, None),
+            'end-view': lambda: ('post', reverse(name), {
+                'session_id': ViewSession.objects.create(product=product, session_id=f'open-{suffix}').session_id,
+                'duration': 10, 'percent_watched': 90,
+            }, None),
+            'create-upload': lambda: ('post', reverse(name), {
+                'product_id': product.id, 'filename': 'demo.mp4', 'length': 1024
+            }, self.admin),
+            'upload-detail': lambda: ('head', reverse(name, args=[
+                UploadSession.objects.create(product=product, filename='demo.mp4', length=1024).id
+            ]), {}, self.admin),
+            'create-upload-intent': lambda: ('post', reverse(name), {
+                'target': 'flicks', 'object_id': product.id, 'filename': 'demo.mp4', 'size': 1024
+            }, self.admin),
+            'complete-upload-intent': lambda: ('post', reverse(name, args=[self.uploaded_intent(product).id]), {}, self.admin),
+            'api-overview': lambda: ('get', reverse(name), {}, self.owner),
+        }
+        return requests[name]()
+    
+    def uploaded_intent(self, product):
+        """A direct upload whose object the stubbed bucket has received"""
+        intent = UploadIntent.objects.create(
+            user=self.admin, target=UploadIntent.FLICKS, object_id=product.id,
+            storage_name='products/flicks/demo.mp4', content_type='video/mp4', size=1024,
+            expires_at=timezone.now() + timedelta(minutes=15),
+        )
+        self.stubber.add_response('head_object', {'ContentLength': 1024, 'ContentType': 'video/mp4'})
+        return intent
+    
+    def capture(self, send):
+        with CaptureQueriesContext(connection) as queries:
+            response = send()
+        return response, [query['sql'] for query in queries.captured_queries]
+    
+    def measure_route(self, name, page_size):
+        # Cached counts and a built suggestion index would hide queries from the second size
+        cache.clear()
+        suggest.reset_index()
+        if name not in self.S3_ROUTES:
+            return self.send_route(name, page_size)
+        with override_settings(**S3_SETTINGS), mock.patch('products.uploads.enqueue'), \
+             Stubber(default_storage.connection.meta.client) as self.stubber:
+            return self.send_route(name, page_size)
+    
+    def send_route(self, name, page_size):
+        method, url, data, user = self.route_request(name, page_size)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        if method == 'post':
+            return self.capture(lambda: self.client.post(url, data, format='json'))
+        return self.capture(lambda: getattr(self.client, method)(url, data))
+    
+    def measure_changelist(self, model_name):
+        self.client = Client()
+        self.client.force_login(self.admin)
+        url = reverse(f'admin:products_{model_name}_changelist')
+        return self.capture(lambda: self.client.get(url))
+    
+    def assertWithinBudget(self, label, budget, small, large, status=200):
+        """Fail with the SQL of the large run if it is over budget or grew with the data"""
+        (small_response, small_sql), (large_response, large_sql) = small, large
+        for response in (small_response, large_response):
+            self.assertEqual(response.status_code, status, f"{label} failed: {response.content[:500]}")
+        if len(large_sql) <= budget and len(large_sql) == len(small_sql):
+            return
+        repeated = {}
+        for sql in large_sql:
+            # Group queries that differ only in their parameters
+            shape = re.sub(r"\b\d+\b|'[^']*'|\"s\d+_x\d+\"", '?', sql)
+            repeated[shape] = repeated.get(shape, 0) + 1
+        listing = '\n'.join(f"  {count}x {shape}" for shape, count in repeated.items())
+        self.fail(
+            f"{label}: {len(small_sql)} queries with {self.SMALL} products, "
+            f"{len(large_sql)} with {self.LARGE} (budget {budget}):\n{listing}"
+        )
+    
+    def measure_at_both_sizes(self, labels, measure):
+        """
+        Run measure(label, page_size) for every label on the small catalog,
+        grow it, and run them all again
+
+        Each request runs in a rolled-back transaction so one route's writes
+        never change what the next one sees.
+        """
+        results = {label: [] for label in labels}
+        for start, count in ((0, self.SMALL), (self.SMALL, self.LARGE - self.SMALL)):
+            with self.captureOnCommitCallbacks(execute=True):
+                seed_catalog(count, self.owner, start=start)
+            for label in labels:
+                with transaction.atomic():
+                    results[label].append(measure(label, start + count))
+                    transaction.set_rollback(True)
+            self.rounds += 1
+        return results
+    
+    def test_every_route_has_a_budget(self):
+        names = {pattern.name for pattern in products_urls.urlpatterns}
+        self.assertEqual(names, set(self.ROUTE_BUDGETS))
+    
+    def test_every_products_changelist_has_a_budget(self):
+        registered = {
+            model._meta.model_name for model in admin_site._registry if model._meta.app_label == 'products'
+        }
+        self.assertEqual(registered, set(self.ADMIN_BUDGETS))
+    
+    def test_route_budgets(self):
+        results = self.measure_at_both_sizes(self.ROUTE_BUDGETS, self.measure_route)
+        for name, (small, large) in results.items():
+            with self.subTest(route=name):
+                self.assertWithinBudget(
+                    name, self.ROUTE_BUDGETS[name], small, large, self.ROUTE_STATUSES.get(name, 200)
+                )
+    
+    def test_admin_changelist_budgets(self):
+        results = self.measure_at_both_sizes(
+            self.ADMIN_BUDGETS, lambda model_name, page_size: self.measure_changelist(model_name)
+        )
+        for model_name, (small, large) in results.items():
+            with self.subTest(changelist=model_name):
+                self.assertWithinBudget(f'{model_name} changelist', self.ADMIN_BUDGETS[model_name], small, large)
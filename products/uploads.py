@@ -0,0 +1,677 @@
+"""
+Resumable video uploads (tus-style)
+
+    POST   /api/uploads/            create an upload, returns its URL
+    HEAD   /api/uploads/<id>/       current Upload-Offset, to resume after a drop
+    PATCH  /api/uploads/<id>/       append a chunk at Upload-Offset
+    DELETE /api/uploads/<id>/       abandon the upload
+
+Chunks are written to local disk, or buffered into S3 multipart parts when
+RESUMABLE_UPLOAD_BACKEND = 's3'. The container header is checked with ffprobe
+as soon as the first RESUMABLE_UPLOAD_PROBE_BYTES arrive, and the finished
+file is handed to the media pipeline. Uploads that receive no chunk for
+RESUMABLE_UPLOAD_EXPIRES seconds are abandoned: their chunks are discarded
+when next touched, or by the expire_uploads command.
+
+Direct uploads skip the app servers entirely:
+
+    POST   /api/uploads/intents/                 presigned PUT/POST target in the bucket
+    POST   /api/uploads/intents/<id>/complete/   verify the object (HEAD) and process it
+"""
+import logging
+import mimetypes
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.http import UnreadablePostError
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework import status
+from flicks.storage_backends import object_key
+from .models import Product, ProductGallery, Shop, Manufacturer, UploadSession, UploadIntent
+from .media_pipeline import enqueue
+from .utils.media_processors import probe_video_container
+
+logger = logging.getLogger(__name__)
+
+TUS_VERSION = '1.0.0'
+CHUNK_CONTENT_TYPE = 'application/offset+octet-stream'
+VIDEO_EXTENSIONS = ['mp4', 'mov', 'avi', 'wmv', 'flv', 'webm']
+IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif', 'webp']
+IMAGE_MAX_SIZE = 5 * 1024 * 1024
+VIDEO_MAX_SIZE = 100 * 1024 * 1024
+READ_BLOCK_SIZE = 64 * 1024
+# S3 rejects multipart parts under 5MB (except the last one)
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+
+UPLOAD_TO = {
+    UploadSession.FLICKS: Product._meta.get_field('flicks').upload_to,
+    UploadSession.GALLERY: ProductGallery._meta.get_field('video').upload_to,
+}
+
+
+def upload_root():
+    root = getattr(settings, 'RESUMABLE_UPLOAD_ROOT', os.path.join(tempfile.gettempdir(), 'flicks-uploads'))
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+def part_path(session):
+    """Local file holding the upload (local) or the unflushed part buffer (S3)"""
+    return os.path.join(upload_root(), f'{session.id}.part')
+
+
+def head_path(session):
+    """First bytes of an S3 upload, kept locally for the ffprobe header check"""
+    return os.path.join(upload_root(), f'{session.id}.head')
+
+
+def upload_expiry():
+    """How long an upload may go without a chunk (RESUMABLE_UPLOAD_EXPIRES setting)"""
+    return timedelta(seconds=getattr(settings, 'RESUMABLE_UPLOAD_EXPIRES', 24 * 60 * 60))
+
+
+def is_abandoned(session):
+    return session.status == UploadSession.UPLOADING and session.updated_at < timezone.now() - upload_expiry()
+
+
+def upload_headers(session):
+    headers = {
+        'Tus-Resumable': TUS_VERSION,
+        'Upload-Offset': str(session.offset),
+        'Upload-Length': str(session.length),
+        'Cache-Control': 'no-store',
+    }
+    if session.status == UploadSession.UPLOADING:
+        headers['Upload-Expires'] = http_date((session.updated_at + upload_expiry()).timestamp())
+    return headers
+
+
+def upload_url(session, request):
+    return request.build_absolute_uri(reverse('upload-detail', args=[session.id]))
+
+
+def upload_data(session, request):
+    return {
+        'id': str(session.id),
+        'upload_url': upload_url(session, request),
+        'product_id': session.product_id,
+        'target': session.target,
+        'filename': session.filename,
+        'offset': session.offset,
+        'length': session.length,
+        'status': session.status,
+        'error': session.error or None,
+    }
+
+
+def _s3_client():
+    return default_storage.connection.meta.client
+
+
+def _start_s3_upload(session):
+    name = default_storage.get_available_name(UPLOAD_TO[session.target] + session.filename)
+    params = default_storage.get_object_parameters(name)
+    params.setdefault('ContentType', mimetypes.guess_type(session.filename)[0] or 'application/octet-stream')
+    response = _s3_client().create_multipart_upload(
+        Bucket=default_storage.bucket_name,
+        Key=object_key(default_storage, name),
+        **params
+    )
+    session.storage_name = name
+    session.s3_upload_id = response['UploadId']
+
+
+def _flush_s3_part(session):
+    """Upload the buffered bytes as the next multipart part"""
+    path = part_path(session)
+    part_number = len(session.parts) + 1
+    with open(path, 'rb') as f:
+        response = _s3_client().upload_part(
+            Bucket=default_storage.bucket_name,
+            Key=object_key(default_storage, session.storage_name),
+            UploadId=session.s3_upload_id,
+            PartNumber=part_number,
+            Body=f
+        )
+    session.parts = session.parts + [{'PartNumber': part_number, 'ETag': response['ETag']}]
+    open(path, 'wb').close()
+
+
+def _complete_s3_upload(session):
+    if os.path.getsize(part_path(session)) or not session.parts:
+        _flush_s3_part(session)
+    _s3_client().complete_multipart_upload(
+        Bucket=default_storage.bucket_name,
+        Key=object_key(default_storage, session.storage_name),
+        UploadId=session.s3_upload_id,
+        MultipartUpload={'Parts': session.parts}
+    )
+
+
+def _discard(session):
+    """Remove local chunk files and abort any S3 multipart upload"""
+    for path in (part_path(session), head_path(session)):
+        if os.path.exists(path):
+            os.unlink(path)
+    if session.backend == UploadSession.S3 and session.s3_upload_id:
+        try:
+            _s3_client().abort_multipart_upload(
+                Bucket=default_storage.bucket_name,
+                Key=object_key(default_storage, session.storage_name),
+                UploadId=session.s3_upload_id
+            )
+        except Exception as e:
+            logger.error(f"Error aborting multipart upload {session.s3_upload_id}: {e}")
+
+
+def abandon(session, error='Upload expired'):
+    """Discard an upload's chunks and mark it failed"""
+    _discard(session)
+    session.status = UploadSession.FAILED
+    session.error = error
+    session.save(update_fields=['status', 'error', 'updated_at'])
+
+
+def expire_uploads():
+    """
+    Abandon uploads idle past RESUMABLE_UPLOAD_EXPIRES, and remove chunk
+    files on disk that no upload in progress owns
+
+    Returns:
+        (uploads abandoned, stray files removed)
+    """
+    cutoff = timezone.now() - upload_expiry()
+    abandoned = 0
+    stale = UploadSession.objects.filter(status=UploadSession.UPLOADING, updated_at__lt=cutoff)
+    for upload_id in stale.values_list('id', flat=True).iterator():
+        with transaction.atomic():
+            # Skips uploads a PATCH touched since the query above
+            session = UploadSession.objects.select_for_update().filter(id=upload_id).first()
+            if session is not None and is_abandoned(session):
+                abandon(session)
+                abandoned += 1
+
+    removed = 0
+    root = upload_root()
+    active = {
+        str(upload_id) for upload_id in
+        UploadSession.objects.filter(status=UploadSession.UPLOADING).values_list('id', flat=True).iterator()
+    }
+    for filename in os.listdir(root):
+        path = os.path.join(root, filename)
+        upload_id, ext = os.path.splitext(filename)
+        if ext not in ('.part', '.head') or upload_id in active:
+            continue
+        if os.path.getmtime(path) < cutoff.timestamp():
+            os.unlink(path)
+            removed += 1
+    return abandoned, removed
+
+
+def in_flight_uploads():
+    """
+    Uploads that may own a stored object no media field references yet:
+    sessions still receiving or processing chunks, intents the client can
+    still upload to, and intents queued for attaching
+
+    Returns:
+        (UploadSession queryset, UploadIntent queryset)
+    """
+    now = timezone.now()
+    cutoff = now - upload_expiry()
+    sessions = UploadSession.objects.filter(
+        status__in=[UploadSession.UPLOADING, UploadSession.PROCESSING], updated_at__gte=cutoff
+    )
+    intents = UploadIntent.objects.filter(
+        Q(status=UploadIntent.PENDING, expires_at__gt=now) | Q(status=UploadIntent.UPLOADED, created_at__gte=cutoff)
+    )
+    return sessions, intents
+
+
+def prune_uploads():
+    """
+    Delete upload rows untouched for RESUMABLE_UPLOAD_EXPIRES that are no
+    longer in flight, so their objects can be swept once nothing else
+    references them. Uploads in progress are left to expire_uploads().
+
+    Returns:
+        (sessions deleted, intents deleted)
+    """
+    cutoff = timezone.now() - upload_expiry()
+    sessions, _ = (
+        UploadSession.objects.filter(updated_at__lt=cutoff)
+        .exclude(status=UploadSession.UPLOADING)
+        .delete()
+    )
+    intents, _ = UploadIntent.objects.filter(created_at__lt=cutoff).delete()
+    return sessions, intents
+
+
+@receiver(post_delete, sender=UploadSession)
+def upload_deleted(sender, instance, **kwargs):
+    # Uploads deleted with their product would otherwise leave chunks behind
+    if instance.status == UploadSession.UPLOADING:
+        _discard(instance)
+
+
+def _append_chunk(request, session):
+    """
+    Stream the request body onto the upload without buffering it in memory
+
+    Returns the number of bytes stored. A dropped connection keeps whatever
+    arrived, so the client can resume from the new offset.
+    """
+    remaining = session.length - session.offset
+    probe_bytes = getattr(settings, 'RESUMABLE_UPLOAD_PROBE_BYTES', 1024 * 1024)
+    part_size = max(getattr(settings, 'RESUMABLE_UPLOAD_PART_SIZE', 8 * 1024 * 1024), S3_MIN_PART_SIZE)
+    is_s3 = session.backend == UploadSession.S3
+    received = 0
+
+    with open(part_path(session), 'r+b') as part:
+        if is_s3:
+            part.seek(0, os.SEEK_END)
+        else:
+            part.seek(session.offset)
+            part.truncate()
+        while received < remaining:
+            try:
+                block = request.read(min(READ_BLOCK_SIZE, remaining - received))
+            except UnreadablePostError:
+                break
+            if not block:
+                break
+            part.write(block)
+            if is_s3 and session.offset + received < probe_bytes:
+                with open(head_path(session), 'ab') as head:
+                    head.write(block[:probe_bytes - session.offset - received])
+            received += len(block)
+            if is_s3 and part.tell() >= part_size:
+                part.flush()
+                _flush_s3_part(session)
+                part.seek(0)
+                part.truncate()
+
+    session.offset += received
+    return received
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def create_upload(request):
+    """Start a resumable video upload for a product's flick or gallery"""
+    product_id = request.data.get('product_id')
+    target = request.data.get('target', UploadSession.FLICKS)
+    filename = os.path.basename(request.data.get('filename', ''))
+    length = request.headers.get('Upload-Length', request.data.get('length'))
+
+    if not product_id or not filename or length is None:
+        return Response(
+            {"error": "product_id, filename and Upload-Length are required"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if target not in UPLOAD_TO:
+        return Response({"error": "target must be 'flicks' or 'gallery'"}, status=status.HTTP_400_BAD_REQUEST)
+    if filename.rsplit('.', 1)[-1].lower() not in VIDEO_EXTENSIONS:
+        return Response(
+            {"error": "Unsupported file format. Please upload MP4, MOV, AVI, WMV, FLV or WebM file."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        length = int(length)
+    except (TypeError, ValueError):
+        return Response({"error": "Upload-Length must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+    max_size = getattr(settings, 'RESUMABLE_UPLOAD_MAX_SIZE', 500 * 1024 * 1024)
+    if length <= 0 or length > max_size:
+        return Response(
+            {"error": f"Upload-Length must be between 1 and {max_size} bytes"},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+    try:
+        product = Product.objects.get(id=product_id)
+    except Product.DoesNotExist:
+        return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    session = UploadSession(
+        user=request.user,
+        product=product,
+        target=target,
+        filename=filename,
+        length=length,
+        backend=getattr(settings, 'RESUMABLE_UPLOAD_BACKEND', UploadSession.LOCAL),
+    )
+    if session.backend == UploadSession.S3:
+        _start_s3_upload(session)
+    session.save()
+    open(part_path(session), 'wb').close()
+
+    headers = upload_headers(session)
+    headers['Location'] = upload_url(session, request)
+    return Response(upload_data(session, request), status=status.HTTP_201_CREATED, headers=headers)
+
+
+@api_view(['GET', 'HEAD', 'PATCH', 'DELETE'])
+@permission_classes([IsAdminUser])
+def upload_detail(request, upload_id):
+    """Report the offset of, append a chunk to, or abandon a resumable upload"""
+    try:
+        session = UploadSession.objects.get(id=upload_id)
+    except UploadSession.DoesNotExist:
+        return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    if is_abandoned(session):
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(id=upload_id)
+            if is_abandoned(session):
+                abandon(session)
+        return Response({"error": session.error}, status=status.HTTP_410_GONE, headers={'Tus-Resumable': TUS_VERSION})
+
+    if request.method in ('GET', 'HEAD'):
+        return Response(upload_data(session, request), headers=upload_headers(session))
+
+    if request.method == 'DELETE':
+        # Chunks are discarded by upload_deleted
+        session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT, headers={'Tus-Resumable': TUS_VERSION})
+
+    if request.content_type != CHUNK_CONTENT_TYPE:
+        return Response(
+            {"error": f"Chunks must be sent as {CHUNK_CONTENT_TYPE}"},
+            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+        )
+
+    with transaction.atomic():
+        # Serialise concurrent PATCHes to the same upload
+        session = UploadSession.objects.select_for_update().get(id=upload_id)
+
+        if session.status != UploadSession.UPLOADING:
+            return Response(
+                {"error": f"Upload is {session.status}"},
+                status=status.HTTP_409_CONFLICT,
+                headers=upload_headers(session)
+            )
+        if request.headers.get('Upload-Offset') != str(session.offset):
+            return Response(
+                {"error": "Upload-Offset does not match the current offset", "offset": session.offset},
+                status=status.HTTP_409_CONFLICT,
+                headers=upload_headers(session)
+            )
+
+        _append_chunk(request, session)
+
+        probe_bytes = getattr(settings, 'RESUMABLE_UPLOAD_PROBE_BYTES', 1024 * 1024)
+        if not session.container and session.offset >= min(probe_bytes, session.length):
+            header_file = head_path(session) if session.backend == UploadSession.S3 else part_path(session)
+            session.container = probe_video_container(header_file) or ''
+            if not session.container:
+                _discard(session)
+                session.status = UploadSession.FAILED
+                session.error = 'File is not a supported video container'
+                session.save()
+                return Response(
+                    {"error": session.error},
+                    status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                    headers=upload_headers(session)
+                )
+
+        if session.offset == session.length:
+            if session.backend == UploadSession.S3:
+                _complete_s3_upload(session)
+            session.status = UploadSession.PROCESSING
+        session.save()
+
+    if session.status == UploadSession.PROCESSING:
+        enqueue(attach_upload, str(session.id))
+
+    return Response(status=status.HTTP_204_NO_CONTENT, headers=upload_headers(session))
+
+
+def _attach_media(session, media):
+    product = session.product
+    if session.target == UploadSession.FLICKS:
+        product.flicks = media
+        product.save()
+    else:
+        ProductGallery(product=product, media_type='video', video=media).save()
+
+
+def attach_upload(session_id):
+    """Media pipeline job: attach an assembled upload to its product and process it"""
+    session = UploadSession.objects.select_related('product').get(id=session_id)
+    try:
+        if session.backend == UploadSession.S3:
+            _attach_media(session, session.storage_name)
+        else:
+            with open(part_path(session), 'rb') as f:
+                _attach_media(session, File(f, name=session.filename))
+        session.status = UploadSession.COMPLETE
+    except Exception as e:
+        logger.error(f"Error attaching upload {session_id}: {e}")
+        session.status = UploadSession.FAILED
+        session.error = str(e)
+    finally:
+        for path in (part_path(session), head_path(session)):
+            if os.path.exists(path):
+                os.unlink(path)
+    session.save(update_fields=['status', 'error', 'updated_at'])
+
+
+# Where each kind of direct upload lands, mirroring the model field validators
+INTENT_TARGETS = {
+    UploadIntent.FLICKS: {
+        'model': Product,
+        'upload_to': Product._meta.get_field('flicks').upload_to,
+        'extensions': VIDEO_EXTENSIONS,
+        'max_size': VIDEO_MAX_SIZE,
+    },
+    UploadIntent.GALLERY_IMAGE: {
+        'model': Product,
+        'upload_to': ProductGallery._meta.get_field('image').upload_to,
+        'extensions': IMAGE_EXTENSIONS,
+        'max_size': IMAGE_MAX_SIZE,
+    },
+    UploadIntent.GALLERY_VIDEO: {
+        'model': Product,
+        'upload_to': ProductGallery._meta.get_field('video').upload_to,
+        'extensions': VIDEO_EXTENSIONS,
+        'max_size': VIDEO_MAX_SIZE,
+    },
+    UploadIntent.SHOP_BANNER: {
+        'model': Shop,
+        'upload_to': Shop._meta.get_field('banner').upload_to,
+        'extensions': IMAGE_EXTENSIONS,
+        'max_size': IMAGE_MAX_SIZE,
+    },
+    UploadIntent.MANUFACTURER_BANNER: {
+        'model': Manufacturer,
+        'upload_to': Manufacturer._meta.get_field('banner').upload_to,
+        'extensions': IMAGE_EXTENSIONS,
+        'max_size': IMAGE_MAX_SIZE,
+    },
+}
+
+
+def _can_upload_to(user, target, obj):
+    """Staff manage catalog media; shop owners may also replace their shop banner"""
+    if user.is_staff:
+        return True
+    return target == UploadIntent.SHOP_BANNER and obj.owner_id == user.id
+
+
+def _presign(intent, method, expires_in):
+    client = _s3_client()
+    key = object_key(default_storage, intent.storage_name)
+    acl = getattr(default_storage, 'default_acl', None)
+
+    if method == 'post':
+        fields = {'Content-Type': intent.content_type}
+        conditions = [
+            {'Content-Type': intent.content_type},
+            ['content-length-range', intent.size, intent.size],
+        ]
+        if acl:
+            fields['acl'] = acl
+            conditions.append({'acl': acl})
+        post = client.generate_presigned_post(
+            Bucket=default_storage.bucket_name,
+            Key=key,
+            Fields=fields,
+            Conditions=conditions,
+            ExpiresIn=expires_in
+        )
+        return {'method': 'POST', 'url': post['url'], 'fields': post['fields'], 'headers': {}}
+
+    params = {'Bucket': default_storage.bucket_name, 'Key': key, 'ContentType': intent.content_type}
+    headers = {'Content-Type': intent.content_type}
+    if acl:
+        params['ACL'] = acl
+        headers['x-amz-acl'] = acl
+    url = client.generate_presigned_url('put_object', Params=params, ExpiresIn=expires_in)
+    return {'method': 'PUT', 'url': url, 'fields': {}, 'headers': headers}
+
+
+@api_view(['POST'])
+def create_upload_intent(request):
+    """Get a presigned target to upload media straight to the bucket"""
+    target = request.data.get('target')
+    object_id = request.data.get('object_id')
+    filename = os.path.basename(request.data.get('filename', ''))
+    size = request.data.get('size')
+    method = request.data.get('method', 'put').lower()
+
+    if target not in INTENT_TARGETS:
+        return Response(
+            {"error": f"target must be one of: {', '.join(INTENT_TARGETS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not object_id or not filename or size is None:
+        return Response({"error": "object_id, filename and size are required"}, status=status.HTTP_400_BAD_REQUEST)
+    if method not in ('put', 'post'):
+        return Response({"error": "method must be 'put' or 'post'"}, status=status.HTTP_400_BAD_REQUEST)
+
+    config = INTENT_TARGETS[target]
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if ext not in config['extensions']:
+        return Response(
+            {"error": f"Unsupported file format. Allowed: {', '.join(config['extensions'])}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        return Response({"error": "size must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+    if size <= 0 or size > config['max_size']:
+        return Response(
+            {"error": f"size must be between 1 and {config['max_size']} bytes"},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+    try:
+        obj = config['model'].objects.get(pk=object_id)
+    except config['model'].DoesNotExist:
+        return Response({"error": f"{config['model'].__name__} not found"}, status=status.HTTP_404_NOT_FOUND)
+    if not _can_upload_to(request.user, target, obj):
+        return Response({"error": "Not allowed to upload media here"}, status=status.HTTP_403_FORBIDDEN)
+
+    if not hasattr(default_storage, 'bucket_name'):
+        return Response(
+            {"error": f"Direct uploads require S3 storage; use {reverse('create-upload')} instead"},
+            status=status.HTTP_501_NOT_IMPLEMENTED
+        )
+
+    expires_in = getattr(settings, 'DIRECT_UPLOAD_EXPIRES', 15 * 60)
+    intent = UploadIntent.objects.create(
+        user=request.user,
+        target=target,
+        object_id=obj.pk,
+        # A random prefix keeps names unique without a HEAD request per intent
+        storage_name=f"{config['upload_to']}{uuid.uuid4().hex[:12]}_{filename}",
+        content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        size=size,
+        expires_at=timezone.now() + timedelta(seconds=expires_in),
+    )
+
+    return Response({
+        'id': str(intent.id),
+        'upload': _presign(intent, method, expires_in),
+        'complete_url': request.build_absolute_uri(reverse('complete-upload-intent', args=[intent.id])),
+        'expires_at': intent.expires_at,
+    }, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+def complete_upload_intent(request, intent_id):
+    """Confirm a direct upload: verify the stored object and queue processing"""
+    try:
+        intent = UploadIntent.objects.get(id=intent_id, user=request.user)
+    except UploadIntent.DoesNotExist:
+        return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    if intent.status != UploadIntent.PENDING:
+        return Response({"error": f"Upload is {intent.status}"}, status=status.HTTP_409_CONFLICT)
+
+    key = object_key(default_storage, intent.storage_name)
+    if intent.expires_at <= timezone.now():
+        intent.status = UploadIntent.FAILED
+        intent.error = "Upload intent expired"
+        intent.save(update_fields=['status', 'error'])
+        # The presigned URL may still have been used just before expiry
+        _s3_client().delete_object(Bucket=default_storage.bucket_name, Key=key)
+        return Response({"error": intent.error}, status=status.HTTP_410_GONE)
+    try:
+        head = _s3_client().head_object(Bucket=default_storage.bucket_name, Key=key)
+    except ClientError:
+        return Response({"error": "Object has not been uploaded"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if head['ContentLength'] != intent.size or head.get('ContentType') != intent.content_type:
+        intent.status = UploadIntent.FAILED
+        intent.error = (
+            f"Stored object ({head['ContentLength']} bytes, {head.get('ContentType')}) "
+            f"does not match the declared upload ({intent.size} bytes, {intent.content_type})"
+        )
+        intent.save(update_fields=['status', 'error'])
+        _s3_client().delete_object(Bucket=default_storage.bucket_name, Key=key)
+        return Response({"error": intent.error}, status=status.HTTP_400_BAD_REQUEST)
+
+    intent.status = UploadIntent.UPLOADED
+    intent.save(update_fields=['status'])
+    enqueue(attach_direct_upload, str(intent.id))
+
+    return Response({'id': str(intent.id), 'status': intent.status}, status=status.HTTP_202_ACCEPTED)
+
+
+def attach_direct_upload(intent_id):
+    """Media pipeline job: point the target field at the uploaded object and process it"""
+    intent = UploadIntent.objects.get(id=intent_id)
+    try:
+        obj = INTENT_TARGETS[intent.target]['model'].objects.get(pk=intent.object_id)
+        if intent.target == UploadIntent.FLICKS:
+            obj.flicks = intent.storage_name
+            obj.save()
+        elif intent.target == UploadIntent.GALLERY_IMAGE:
+            ProductGallery(product=obj, media_type='image', image=intent.storage_name).save()
+        elif intent.target == UploadIntent.GALLERY_VIDEO:
+            ProductGallery(product=obj, media_type='video', video=intent.storage_name).save()
+        else:
+            obj.banner = intent.storage_name
+            obj.save()
+        intent.status = UploadIntent.COMPLETE
+    except Exception as e:
+        logger.error(f"Error attaching direct upload {intent_id}: {e}")
+        intent.status = UploadIntent.FAILED
+        intent.error = str(e)
+    intent.save(update_fields=['status', 'error'])
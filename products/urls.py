@@ -1,5 +1,5 @@
 from django.urls import path
-from . import api, analytics, docs
+from . import api, analytics, docs, uploads
 
 urlpatterns = [
 
@@ -22,6 +22,8 @@ urlpatterns = [
     path('products/filter/', api.filter_products, name='filter-products'),
     path('products/<int:product_id>/', api.product_detail, name='product-detail'),    
     path('products/search/', api.search_products, name='search-products'),
+    path('products/search/stats/', api.search_cache_stats, name='search-cache-stats'),
+    path('products/suggest/', api.suggest_products, name='suggest-products'),
     path('products/categories/', api.product_categories, name='product-categories'),
 
     # path('products/age_groups/', api.age_groups, name='product-age-groups'),
@@ -34,5 +36,10 @@ urlpatterns = [
     path('analytics/start-view/', analytics.start_view_session, name='start-view'),
     path('analytics/end-view/', analytics.end_view_session, name='end-view'),
 
+    path('uploads/', uploads.create_upload, name='create-upload'),
+    path('uploads/<uuid:upload_id>/', uploads.upload_detail, name='upload-detail'),
+    path('uploads/intents/', uploads.create_upload_intent, name='create-upload-intent'),
+    path('uploads/intents/<uuid:intent_id>/complete/', uploads.complete_upload_intent, name='complete-upload-intent'),
+
     path('', api.api_overview, name='api-overview'),
 ]
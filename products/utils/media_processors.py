@@ -1,51 +1,93 @@
+import json
 import os
 import subprocess
 import tempfile
 import logging
-from django.core.files.base import ContentFile
+from PIL import Image
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from .image_engine import open_image, resize_cover, resize_to_width, output_format, encode_image
+
+try:
+    # Registers the AVIF codec on Pillow builds that lack native support
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
 
 logger = logging.getLogger(__name__)
 
-def process_video(video_file):
+DEFAULT_DERIVATIVE_WIDTHS = [320, 640, 1080]
+DEFAULT_DERIVATIVE_QUALITY = 80
+DEFAULT_PRODUCT_IMAGE_MAX_SIZE = 2048
+
+def probe_video(path):
+    """
+    Read duration, video codec and height of a video file with ffprobe
+    
+    Returns:
+        Dict with duration (whole seconds), codec and height; values are
+        None when ffprobe is missing or can't tell
+    """
+    metadata = {'duration': None, 'codec': None, 'height': None}
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'format=duration:stream=codec_name,height',
+        '-of', 'json',
+        path
+    ]
+    try:
+        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        info = json.loads(result.stdout)
+    except Exception as e:
+        logger.error(f"Error probing video: {e}")
+        return metadata
+    
+    duration = info.get('format', {}).get('duration')
+    if duration:
+        metadata['duration'] = int(float(duration))
+    streams = info.get('streams') or [{}]
+    metadata['codec'] = streams[0].get('codec_name')
+    metadata['height'] = streams[0].get('height')
+    return metadata
+
+def encode_video(video_file):
     """
     Process video using ffmpeg:
-    1. Get video duration
+    1. Probe duration, codec and height
     2. Compress video to 4500 kbps bitrate
     3. Normalize audio
     
-    Returns: (processed_video, duration_in_seconds)
+    Returns:
+        (processed_video, metadata) where metadata has duration, codec and
+        height of the result and encoded (False when ffmpeg failed and the
+        original file is returned with its own metadata). An encoded video
+        is a temp file the caller must close() once it is saved, which
+        deletes it.
     """
+    metadata = {'duration': None, 'codec': None, 'height': None, 'encoded': False}
     if not video_file:
-        return video_file, None
+        return video_file, metadata
         
+    input_path = None
+    processed = None
     try:
         # Create temporary files for processing
         with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as input_file:
             for chunk in video_file.chunks():
                 input_file.write(chunk)
             input_path = input_file.name
-            
-        output_path = input_path + '_processed.mp4'
-        
-        # Get video duration
-        duration = None
-        try:
-            duration_cmd = [
-                'ffprobe',
-                '-v', 'error',
-                '-show_entries', 'format=duration',
-                '-of', 'default=noprint_wrappers=1:nokey=1',
-                input_path
-            ]
-            duration_result = subprocess.run(
-                duration_cmd,
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            duration = int(float(duration_result.stdout.strip()))
-        except Exception as e:
-            logger.error(f"Error extracting video duration: {e}")
+        
+        # Storage streams the result from disk (FileSystemStorage moves it),
+        # so large flicks go into multipart uploads without being read into
+        # memory
+        processed = TemporaryUploadedFile(os.path.basename(video_file.name), 'video/mp4', 0, None)
+        output_path = processed.temporary_file_path()
+        
+        metadata.update(probe_video(input_path))
         
         # Process video with ffmpeg - compress to 4500 kbps bitrate
         cmd = [
@@ -60,6 +102,7 @@ def process_video(video_file):
             '-ar', '48000',        # Audio sample rate
             '-af', 'loudnorm',     # Normalize audio
             '-movflags', '+faststart', # Optimize for web streaming
+            '-f', 'mp4',           # The temp file's suffix follows the upload's
             '-y',                  # Overwrite output files
             output_path
         ]
@@ -67,62 +110,163 @@ def process_video(video_file):
         # Run the ffmpeg command
         subprocess.run(cmd, check=True, capture_output=True)
         
-        # Read the processed file
-        with open(output_path, 'rb') as f:
-            processed_content = f.read()
-        
-        # Create a ContentFile with the processed video
-        filename = os.path.basename(video_file.name)
-        processed_file = ContentFile(processed_content, name=filename)
+        output_metadata = probe_video(output_path)
+        metadata['codec'] = output_metadata['codec'] or 'h264'
+        metadata['height'] = output_metadata['height'] or metadata['height']
+        metadata['duration'] = metadata['duration'] or output_metadata['duration']
+        metadata['encoded'] = True
         
-        # Clean up temporary files
-        os.unlink(input_path)
-        os.unlink(output_path)
-        
-        return processed_file, duration
+        processed.size = os.path.getsize(output_path)
+        processed.seek(0)
+        return processed, metadata
         
     except Exception as e:
         logger.error(f"Error processing video: {e}")
-        return video_file, duration  # Return original file if processing fails
+        if processed is not None:
+            processed.close()
+        return video_file, metadata  # Return original file if processing fails
+    
+    finally:
+        if input_path and os.path.exists(input_path):
+            os.unlink(input_path)
 
-def process_product_image(image_file):
+def process_video(video_file):
     """
-    Process product image to make it 1:1 aspect ratio by cropping
+    Re-encode a video (see encode_video)
+    
+    Returns: (processed_video, duration_in_seconds)
+    """
+    processed, metadata = encode_video(video_file)
+    return processed, metadata['duration']
+
+# Leading bytes of the containers accepted by validate_video
+VIDEO_SIGNATURES = [
+    (4, b'ftyp', 'mp4'),                 # MP4 / MOV (ISO base media)
+    (0, b'\x1a\x45\xdf\xa3', 'webm'),    # WebM / Matroska (EBML)
+    (0, b'RIFF', 'avi'),
+    (0, b'FLV', 'flv'),
+    (0, b'\x30\x26\xb2\x75\x8e\x66\xcf\x11', 'wmv'),  # ASF
+    (4, b'moov', 'mov'),
+    (4, b'mdat', 'mov'),
+    (4, b'wide', 'mov'),
+]
+
+def sniff_video_container(header):
+    """Identify a video container from its first bytes, or None if unknown"""
+    for offset, signature, container in VIDEO_SIGNATURES:
+        if header[offset:offset + len(signature)] == signature:
+            return container
+    return None
+
+def probe_video_container(path):
+    """
+    Validate the container of a (possibly partial) video file with ffprobe
+    
+    A partial MP4/MOV whose moov atom sits at the end of the file can't be
+    fully probed yet, so a recognised ISO base media header is accepted
+    when ffprobe only complains about the missing moov atom.
+    
+    Returns:
+        The container name, or None if the file is not a video we accept
+    """
+    with open(path, 'rb') as f:
+        container = sniff_video_container(f.read(16))
+    if not container:
+        return None
+    
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', 'format=format_name',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except FileNotFoundError:
+        logger.error("ffprobe is not installed; cannot validate upload header")
+        return None
+    if result.returncode == 0 and result.stdout.strip():
+        return container
+    if container in ('mp4', 'mov') and 'moov atom not found' in result.stderr:
+        return container
+    
+    logger.error(f"ffprobe rejected upload header: {result.stderr.strip()}")
+    return None
+
+def extract_video_poster(video_file, timestamp=0.5):
+    """
+    Grab a still frame from a video to use as its poster
     
     Args:
-        image_file: The Django uploaded file object
+        video_file: The Django file object (uploaded or already processed)
+        timestamp: Offset in seconds of the frame to grab (default 0.5)
     
     Returns:
-        Processed file with 1:1 aspect ratio
+        JPEG ContentFile named after the video, or None if ffmpeg fails
     """
+    input_path = output_path = None
     try:
-        img = Image.open(image_file)
-        
-        width, height = img.size
-        
-        size = min(width, height)
+        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(video_file.name)[1], delete=False) as input_file:
+            for chunk in video_file.chunks():
+                input_file.write(chunk)
+            input_path = input_file.name
+        output_path = input_path + '_poster.jpg'
         
-        left = (width - size) // 2
-        top = (height - size) // 2
-        right = left + size
-        bottom = top + size
+        cmd = [
+            'ffmpeg',
+            '-ss', str(timestamp),  # Seek before decoding; clamps to the last frame on short clips
+            '-i', input_path,
+            '-frames:v', '1',
+            '-q:v', '3',
+            '-y',
+            output_path
+        ]
+        subprocess.run(cmd, check=True, capture_output=True)
         
-        cropped_img = img.crop((left, top, right, bottom))
+        with open(output_path, 'rb') as f:
+            poster_content = f.read()
         
-        output = io.BytesIO()
+        stem = os.path.splitext(os.path.basename(video_file.name))[0]
+        return ContentFile(poster_content, name=f"{stem}_poster.jpg")
+    
+    except Exception as e:
+        logger.error(f"Error extracting video poster: {e}")
+        return None
+    
+    finally:
+        for path in (input_path, output_path):
+            if path and os.path.exists(path):
+                os.unlink(path)
 
-        format = os.path.splitext(image_file.name)[1][1:].upper()
-        if format == 'JPG':
-            format = 'JPEG'
-        
-        if format not in ['JPEG', 'PNG', 'GIF', 'WEBP']:
-            format = 'JPEG'
+def process_product_image(image_file, max_size=None):
+    """
+    Process product image to make it 1:1 aspect ratio by cropping
+    
+    The image is decoded at reduced scale where possible and never kept
+    larger than max_size, so memory use is bounded by the output size
+    rather than the camera resolution.
+    
+    Args:
+        image_file: The Django uploaded file object
+        max_size: Maximum edge of the square (default PRODUCT_IMAGE_MAX_SIZE setting)
+    
+    Returns:
+        Processed file with 1:1 aspect ratio
+    """
+    if max_size is None:
+        max_size = getattr(settings, 'PRODUCT_IMAGE_MAX_SIZE', DEFAULT_PRODUCT_IMAGE_MAX_SIZE)
+    try:
+        img = open_image(image_file, target_size=(max_size, max_size))
         
-        cropped_img.save(output, format=format, quality=90)
-        output.seek(0)
+        size = min(img.width, img.height, max_size)
+        cropped_img = resize_cover(img, (size, size))
         
-        return ContentFile(output.getvalue(), name=image_file.name)
+        content = encode_image(cropped_img, output_format(image_file.name), quality=90)
+        return ContentFile(content, name=image_file.name)
     
+    except Image.DecompressionBombError:
+        raise
     except Exception as e:
         logger.error(f"Error processing product image: {e}")
         return image_file 
@@ -140,42 +284,197 @@ def process_banner_image(image_file, target_width=1280, target_height=720):
         Processed file with 1280x720 resolution
     """
     try:
-        img = Image.open(image_file)
-        print("hello trying this out")
-        img_ratio = img.width / img.height
-        target_ratio = target_width / target_height
-        
-        if img_ratio > target_ratio:
-            new_width = int(img.height * target_ratio)
-            resized_img = img.resize((int(new_width * (target_height / img.height)), target_height), Image.LANCZOS)
-            left = (resized_img.width - target_width) // 2
-            top = 0
-            right = left + target_width
-            bottom = target_height
-            cropped_img = resized_img.crop((left, top, right, bottom))
-        else:
-            new_height = int(img.width / target_ratio)
-            resized_img = img.resize((target_width, int(new_height * (target_width / img.width))), Image.LANCZOS)
-            left = 0
-            top = (resized_img.height - target_height) // 2
-            right = target_width
-            bottom = top + target_height
-            cropped_img = resized_img.crop((left, top, right, bottom))
-        
-        output = io.BytesIO()
-        
-        format = os.path.splitext(image_file.name)[1][1:].upper()
-        if format == 'JPG':
-            format = 'JPEG'
-        
-        if format not in ['JPEG', 'PNG', 'GIF', 'WEBP']:
-            format = 'JPEG'
-        
-        cropped_img.save(output, format=format, quality=90)
-        output.seek(0)
-        
-        return ContentFile(output.getvalue(), name=image_file.name)
+        img = open_image(image_file, target_size=(target_width, target_height))
+        cropped_img = resize_cover(img, (target_width, target_height))
+        
+        content = encode_image(cropped_img, output_format(image_file.name), quality=90)
+        return ContentFile(content, name=image_file.name)
     
+    except Image.DecompressionBombError:
+        raise
     except Exception as e:
         logger.error(f"Error processing banner image: {e}")
-        return image_file
\ No newline at end of file
+        return image_file
+
+def avif_supported():
+    """Check whether the installed Pillow can encode AVIF"""
+    Image.init()
+    return 'AVIF' in Image.SAVE
+
+def _derivative_image(img, fmt):
+    """Convert an image to a mode the target derivative format can encode"""
+    if fmt in ('WEBP', 'AVIF') and img.mode not in ('RGB', 'RGBA'):
+        has_alpha = img.mode in ('LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+        return img.convert('RGBA' if has_alpha else 'RGB')
+    return img
+
+def generate_image_derivatives(image_file, widths=None):
+    """
+    Generate downscaled WebP (and AVIF when available) copies of an image
+    
+    EXIF orientation is applied to the pixels and metadata is not carried
+    over to the derivatives. Widths larger than the source are skipped; a
+    source narrower than every width still gets one derivative at its own size.
+    
+    Args:
+        image_file: The Django file object (or any file-like object)
+        widths: Target widths in pixels (default IMAGE_DERIVATIVE_WIDTHS setting)
+    
+    Returns:
+        Dict mapping format name to {width: encoded bytes}, e.g. {'webp': {320: b'...'}}
+    """
+    if widths is None:
+        widths = getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', DEFAULT_DERIVATIVE_WIDTHS)
+    quality = getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', DEFAULT_DERIVATIVE_QUALITY)
+    
+    img = open_image(image_file, target_size=(max(widths), 1))
+    
+    targets = sorted({w for w in widths if w < img.width})
+    if not targets or max(widths) >= img.width:
+        targets.append(img.width)
+    
+    formats = ['WEBP']
+    if avif_supported():
+        formats.append('AVIF')
+    
+    derivatives = {}
+    for width in targets:
+        resized = resize_to_width(img, width)
+        for fmt in formats:
+            content = encode_image(_derivative_image(resized, fmt), fmt, quality=quality)
+            derivatives.setdefault(fmt.lower(), {})[width] = content
+    
+    return derivatives
+
+def save_image_derivatives(image_file, upload_to, widths=None):
+    """
+    Generate responsive derivatives for an image and store them
+    
+    Args:
+        image_file: The processed image file
+        upload_to: Storage directory for the derivatives, e.g. 'products/photos/'
+        widths: Target widths in pixels (default IMAGE_DERIVATIVE_WIDTHS setting)
+    
+    Returns:
+        Dict mapping format to {width: stored name}, suitable for a JSONField.
+        Empty if the derivatives could not be generated.
+    """
+    try:
+        derivatives = generate_image_derivatives(image_file, widths)
+    except Exception as e:
+        logger.error(f"Error generating image derivatives: {e}")
+        return {}
+    
+    return store_image_derivatives(derivatives, image_file.name, upload_to)
+
+def store_image_derivatives(derivatives, image_name, upload_to):
+    """
+    Store derivatives produced by generate_image_derivatives
+    
+    Args:
+        derivatives: {format: {width: encoded bytes}}
+        image_name: Name of the source image; derivatives are named after it
+        upload_to: Storage directory for the derivatives
+    
+    Returns:
+        Dict mapping format to {width: stored name}
+    """
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    variants = {}
+    for fmt, sizes in derivatives.items():
+        for width, content in sizes.items():
+            name = default_storage.save(f"{upload_to}{stem}_{width}w.{fmt}", ContentFile(content))
+            variants.setdefault(fmt, {})[str(width)] = name
+    return variants
+
+GIF_VIDEO_CODECS = {
+    'mp4': [
+        '-c:v', 'libx264',
+        '-preset', 'slow',
+        '-crf', '26',
+        '-pix_fmt', 'yuv420p',
+        '-movflags', '+faststart',
+    ],
+    'webm': [
+        '-c:v', 'libvpx-vp9',
+        '-crf', '36',
+        '-b:v', '0',
+        '-pix_fmt', 'yuv420p',
+    ],
+}
+
+def is_animated_gif(image_file):
+    """Check whether an uploaded image is a GIF with more than one frame"""
+    try:
+        image_file.seek(0)
+        img = Image.open(image_file)
+        return img.format == 'GIF' and getattr(img, 'n_frames', 1) > 1
+    except Exception:
+        return False
+    finally:
+        image_file.seek(0)
+
+def convert_gif_to_video(image_file, container=None):
+    """
+    Convert an animated GIF to a compact looping video using ffmpeg
+    
+    Args:
+        image_file: The uploaded GIF; a Django file or any binary file object
+        container: 'mp4' (H.264) or 'webm' (VP9), default ANIMATED_GIF_CONTAINER setting
+    
+    Returns:
+        (video_file, poster_file, duration_in_seconds), or None if ffmpeg fails
+    """
+    if container is None:
+        container = getattr(settings, 'ANIMATED_GIF_CONTAINER', 'mp4')
+    
+    input_path = output_path = None
+    try:
+        image_file.seek(0)
+        img = Image.open(image_file)
+        
+        # GIF frame delays are in milliseconds
+        duration_ms = 0
+        for frame in range(img.n_frames):
+            img.seek(frame)
+            duration_ms += img.info.get('duration', 100)
+        img.seek(0)
+        poster = encode_image(img.convert('RGB'), 'JPEG', quality=85)
+        
+        with tempfile.NamedTemporaryFile(suffix='.gif', delete=False) as input_file:
+            # File() gives plain file objects chunks(), which rewinds first
+            for chunk in File(image_file).chunks():
+                input_file.write(chunk)
+            input_path = input_file.name
+        output_path = f"{input_path}_converted.{container}"
+        
+        cmd = [
+            'ffmpeg',
+            '-i', input_path,
+            # Codecs need even dimensions
+            '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',
+            *GIF_VIDEO_CODECS[container],
+            '-an',
+            '-y',
+            output_path
+        ]
+        subprocess.run(cmd, check=True, capture_output=True)
+        
+        with open(output_path, 'rb') as f:
+            video_content = f.read()
+        
+        stem = os.path.splitext(os.path.basename(getattr(image_file, 'name', None) or 'animation.gif'))[0]
+        return (
+            ContentFile(video_content, name=f"{stem}.{container}"),
+            ContentFile(poster, name=f"{stem}_poster.jpg"),
+            max(1, round(duration_ms / 1000)),
+        )
+    
+    except Exception as e:
+        logger.error(f"Error converting animated GIF: {e}")
+        return None
+    
+    finally:
+        for path in (input_path, output_path):
+            if path and os.path.exists(path):
+                os.unlink(path)
@@ -0,0 +1,107 @@
+import logging
+import numpy as np
+from PIL import Image
+from .image_engine import open_image
+
+logger = logging.getLogger(__name__)
+
+BASE83_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+# The hash only carries a few cosine components, so a tiny thumbnail
+# gives the same result as the full image at a fraction of the cost
+SAMPLE_SIZE = 32
+
+
+def _base83(value, length):
+    """Encode an integer as fixed-width base83"""
+    chars = []
+    for i in range(1, length + 1):
+        digit = (int(value) // (83 ** (length - i))) % 83
+        chars.append(BASE83_CHARS[digit])
+    return ''.join(chars)
+
+
+def _srgb_to_linear(pixels):
+    values = pixels / 255.0
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+
+def _linear_to_srgb(value):
+    value = min(max(value, 0.0), 1.0)
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value, exponent):
+    return np.copysign(np.abs(value) ** exponent, value)
+
+
+def blurhash_encode(img, x_components=4, y_components=3):
+    """
+    Encode an image as a BlurHash string
+
+    Args:
+        img: A PIL image (any size; callers should pass a small thumbnail)
+        x_components: Horizontal cosine components (1-9)
+        y_components: Vertical cosine components (1-9)
+
+    Returns:
+        The BlurHash, e.g. 'LEHV6nWB2yk8pyo0adR*.7kCMdnj'
+    """
+    pixels = np.asarray(img.convert('RGB'), dtype=np.float64)
+    height, width = pixels.shape[:2]
+    linear = _srgb_to_linear(pixels)
+
+    cos_x = np.cos(np.pi * np.outer(np.arange(x_components), np.arange(width)) / width)
+    cos_y = np.cos(np.pi * np.outer(np.arange(y_components), np.arange(height)) / height)
+
+    # factors[j, i] is the colour weight of basis function (i, j)
+    factors = np.einsum('jy,ix,yxc->jic', cos_y, cos_x, linear) / (width * height)
+    normalisation = np.full((y_components, x_components, 1), 2.0)
+    normalisation[0, 0] = 1.0
+    factors = (factors * normalisation).reshape(-1, 3)
+
+    dc, ac = factors[0], factors[1:]
+
+    parts = [_base83((x_components - 1) + (y_components - 1) * 9, 1)]
+
+    if len(ac):
+        quantised_max = int(max(0, min(82, np.floor(np.abs(ac).max() * 166 - 0.5))))
+        maximum_value = (quantised_max + 1) / 166
+    else:
+        quantised_max = 0
+        maximum_value = 1
+    parts.append(_base83(quantised_max, 1))
+
+    r, g, b = (_linear_to_srgb(channel) for channel in dc)
+    parts.append(_base83((r << 16) + (g << 8) + b, 4))
+
+    if len(ac):
+        quantised = np.floor(_sign_pow(ac / maximum_value, 0.5) * 9 + 9.5)
+        quantised = np.clip(quantised, 0, 18).astype(int)
+        for qr, qg, qb in quantised:
+            parts.append(_base83(qr * 19 * 19 + qg * 19 + qb, 2))
+
+    return ''.join(parts)
+
+
+def compute_placeholder(image_file):
+    """
+    Compute the BlurHash placeholder for an uploaded or stored image
+
+    Returns:
+        The hash string, or an empty string if the image can't be read
+    """
+    try:
+        img = open_image(image_file, target_size=(SAMPLE_SIZE, SAMPLE_SIZE))
+        img.thumbnail((SAMPLE_SIZE, SAMPLE_SIZE), Image.BILINEAR)
+        return blurhash_encode(img)
+    except Image.DecompressionBombError:
+        raise
+    except Exception as e:
+        logger.error(f"Error computing image placeholder: {e}")
+        return ''
+    finally:
+        if hasattr(image_file, 'seek'):
+            image_file.seek(0)
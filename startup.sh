@@ -2,6 +2,8 @@
 python manage.py showmigrations
 python manage.py makemigrations products
 python manage.py migrate
+python manage.py refresh_media_urls --missing
+python manage.py backfill_taxonomy
 python manage.py shell < create_superuser.py
 gunicorn flicks.wsgi:application
 